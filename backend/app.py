@@ -1,3 +1,4 @@
+import click
 from flask import Flask
 from flask_cors import CORS
 from flask_sqlalchemy import SQLAlchemy
@@ -13,6 +14,10 @@ def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
     
+    # Pool sizing and pre-ping for the configured database
+    from services.database_service import engine_options
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+    
     # Initialize extensions with app
     db.init_app(app)
     jwt.init_app(app)
@@ -21,7 +26,9 @@ def create_app(config_class=Config):
     CORS(app, 
          resources={r"/api/*": {"origins": "*"}},
          supports_credentials=True,
-         allow_headers=["Content-Type", "Authorization", "Access-Control-Allow-Credentials"],
+         allow_headers=["Content-Type", "Authorization", "Access-Control-Allow-Credentials", "If-None-Match",
+                        app.config['RESPONSE_CACHE_BYPASS_HEADER']],
+         expose_headers=["ETag", "X-Response-Cache"],
          methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"])
     
     # Register blueprints
@@ -29,15 +36,101 @@ def create_app(config_class=Config):
     from routes.chat import chat_bp
     from routes.documents import documents_bp
     from routes.generate import generate_bp
+    from routes.jobs import jobs_bp
+    from routes.metrics import metrics_bp
+    from routes.revisions import revisions_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(chat_bp, url_prefix='/api/chat')
     app.register_blueprint(documents_bp, url_prefix='/api/documents')
     app.register_blueprint(generate_bp, url_prefix='/api/generate')
+    app.register_blueprint(jobs_bp, url_prefix='/api/jobs')
+    app.register_blueprint(metrics_bp, url_prefix='/api/metrics')
+    app.register_blueprint(revisions_bp, url_prefix='/api/documents')
     
     # Create database tables
     with app.app_context():
+        from services.database_service import init_sqlite_pragmas
+        init_sqlite_pragmas(db.engine, app.config)
+        
+        # Time requests, SQL statements, storage operations and LLM calls
+        if app.config['METRICS_ENABLED']:
+            from services.metrics_service import init_metrics
+            init_metrics(app, db.engine)
+        
         db.create_all()
+        
+        # Bring databases created by older versions up to the current schema
+        if app.config['DB_MIGRATE_ON_STARTUP']:
+            from services.migration_service import run_migrations
+            run_migrations(db.engine)
+        
+        # Build the full-text search index
+        from services.search_service import init_search_index
+        init_search_index(app)
+        
+        # Keep the normalized tag tables used for tag filters and facets in sync
+        from services.tag_service import init_tag_index
+        init_tag_index(app)
+        
+        # Record a revision of every saved document content
+        if app.config['REVISIONS_ENABLED']:
+            from services.revision_service import init_revision_history
+            init_revision_history(app)
+        
+        # Keep the MinHash signatures used to find near-duplicate documents in sync
+        if app.config['DEDUP_ENABLED']:
+            from services.duplicate_service import init_duplicate_index
+            init_duplicate_index(app)
+        
+        # Keep the per-user vector indexes used by chat retrieval in sync
+        if app.config['RAG_ENABLED']:
+            from services.vector_index import init_vector_index
+            init_vector_index(app)
+        
+        # Start background workers for analysis jobs
+        if app.config['JOBS_WORKERS'] > 0:
+            from services.job_service import init_job_queue
+            init_job_queue(app)
+    
+    @app.cli.command('storage-gc')
+    def storage_gc():
+        """Delete stored files that no document references"""
+        from services.storage_service import collect_garbage
+        removed = collect_garbage(app.config['STORAGE_GC_GRACE_SECONDS'])
+        print(f"Removed {removed['orphan_objects']} orphan objects, "
+              f"{removed['unreferenced_rows']} unreferenced files and {removed['temp_files']} temp files")
+    
+    @app.cli.command('revisions-prune')
+    def revisions_prune():
+        """Drop document revisions beyond REVISION_KEEP_MAX or older than REVISION_KEEP_DAYS"""
+        from services.revision_service import prune_all_revisions
+        removed = prune_all_revisions(app.config['REVISION_KEEP_MAX'], app.config['REVISION_KEEP_DAYS'])
+        print(f"Removed {removed} revisions")
+    
+    @app.cli.command('duplicates-index')
+    @click.option('--rebuild', is_flag=True, help='Recompute every signature, e.g. after changing DEDUP_* settings')
+    def duplicates_index(rebuild):
+        """Compute near-duplicate signatures for documents that have none"""
+        from services.duplicate_service import index_documents
+        print(f"Indexed {index_documents(rebuild=rebuild)} documents")
+    
+    @app.cli.command('db-upgrade')
+    def db_upgrade():
+        """Apply pending schema migrations"""
+        from services.migration_service import run_migrations
+        applied = run_migrations(db.engine)
+        print(f"Applied migrations: {', '.join(map(str, applied))}" if applied else "Schema is up to date")
+    
+    @app.cli.command('db-status')
+    def db_status():
+        """List schema migrations that have not been applied"""
+        from services.migration_service import pending_migrations
+        pending = pending_migrations(db.engine)
+        for version, description in pending:
+            print(f"{version}: {description}")
+        if not pending:
+            print("Schema is up to date")
     
     @app.route('/api/health')
     def health_check():
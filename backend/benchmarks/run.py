@@ -0,0 +1,217 @@
+"""Offline benchmark of the API against an in-process app and fake LLM server.
+
+Run from the backend folder:
+
+    python -m benchmarks.run --output results.json
+    python -m benchmarks.run --scenarios list,search --requests 500 --compare results.json
+
+Each run seeds a fresh database in a temporary folder (or the one given by
+--database-url), so results from different commits are comparable when the
+same options are used.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import numpy as np
+from benchmarks.scenarios import SCENARIOS, prepare_accounts
+from benchmarks.seed import seed_database
+
+PERCENTILES = (50, 95, 99)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the DocuMind API offline')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'Comma-separated scenarios to run (default: {",".join(SCENARIOS)})')
+    parser.add_argument('--requests', type=int, default=200, help='Measured requests per scenario')
+    parser.add_argument('--warmup', type=int, default=10, help='Unmeasured requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4, help='Requests in flight at once')
+    parser.add_argument('--users', type=int, default=2)
+    parser.add_argument('--documents', type=int, default=200, help='Text documents per user')
+    parser.add_argument('--document-size', type=int, default=2000, help='Characters per text document')
+    parser.add_argument('--files', type=int, default=20, help='Uploaded files per user')
+    parser.add_argument('--file-size', type=int, default=20000, help='Bytes per seeded or uploaded file')
+    parser.add_argument('--llm-latency', type=float, default=0.05, help='Seconds the fake LLM waits per request')
+    parser.add_argument('--llm-error-rate', type=float, default=0.0, help='Fraction of LLM requests failing with 429/500')
+    parser.add_argument('--llm-stall-rate', type=float, default=0.0, help='Fraction of LLM requests that stall')
+    parser.add_argument('--llm-stall-seconds', type=float, default=5.0)
+    parser.add_argument('--storage', default='local', help='Storage backend: local or memory')
+    parser.add_argument('--database-url', help='Benchmark against this database instead of a temporary SQLite file')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated data')
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Print changes against the results in this JSON file')
+    parser.add_argument('--max-regression', type=float,
+                        help='With --compare, exit with status 1 if any p95 grew by more than this percentage')
+    return parser.parse_args(argv)
+
+
+def benchmark_config(args, workdir):
+    """Config for an isolated app that never leaves the process"""
+    from config import Config
+
+    class BenchmarkConfig(Config):
+        DEBUG = False
+        SQLALCHEMY_DATABASE_URI = args.database_url or f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+        UPLOAD_FOLDER = os.path.join(workdir, 'uploads')
+        VECTOR_INDEX_FOLDER = os.path.join(workdir, 'vector_index')
+        STORAGE_BACKEND = args.storage
+        LLM_FAKE_SERVER = True
+        LLM_FAKE_LATENCY = args.llm_latency
+        LLM_FAKE_ERROR_RATE = args.llm_error_rate
+        LLM_FAKE_STALL_RATE = args.llm_stall_rate
+        LLM_FAKE_STALL_SECONDS = args.llm_stall_seconds
+        OPENAI_API_KEY = 'benchmark-key'
+        EMBEDDING_PROVIDER = 'local'
+        JOBS_WORKERS = max(2, args.concurrency)
+        JOBS_MAX_PER_USER = max(2, args.concurrency)
+        JOBS_POLL_INTERVAL = 0.05
+        SLOW_REQUEST_THRESHOLD = 0
+        METRICS_TOKEN = None
+
+    return BenchmarkConfig
+
+
+def run_scenario(app, accounts, run, requests, concurrency, warmup=0):
+    """Issue requests from `concurrency` threads and return their latencies and outcomes"""
+    local = threading.local()
+
+    def call(number):
+        if not hasattr(local, 'client'):
+            local.client = app.test_client()
+        account = accounts[number % len(accounts)]
+        start = time.perf_counter()
+        try:
+            response = run(local.client, account, number)
+            status = response.status_code
+        except Exception as e:
+            status = type(e).__name__
+        return time.perf_counter() - start, status
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(warmup)))
+
+        start = time.perf_counter()
+        outcomes = list(executor.map(call, range(warmup, warmup + requests)))
+        elapsed = time.perf_counter() - start
+
+    latencies = np.array([latency for latency, _ in outcomes]) * 1000
+    statuses = Counter(str(status) for _, status in outcomes)
+    errors = sum(count for status, count in statuses.items() if not status.isdigit() or int(status) >= 400)
+
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'errors': errors,
+        'statuses': dict(sorted(statuses.items())),
+        'seconds': round(elapsed, 4),
+        'throughput_rps': round(requests / elapsed, 2) if elapsed else None,
+        'latency_ms': {
+            'mean': round(float(latencies.mean()), 3),
+            **{f'p{p}': round(float(np.percentile(latencies, p)), 3) for p in PERCENTILES},
+            'max': round(float(latencies.max()), 3)
+        }
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results):
+    print(f"{'scenario':<10} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+    for name, result in results['scenarios'].items():
+        latency = result['latency_ms']
+        print(f"{name:<10} {result['throughput_rps']:>9} {latency['p50']:>9} {latency['p95']:>9} "
+              f"{latency['p99']:>9} {result['errors']:>7}")
+
+
+def compare_results(results, baseline):
+    """Print per-scenario changes against a baseline and return the largest p95 increase in percent"""
+    def change(new, old):
+        return (new - old) / old * 100 if old else 0.0
+
+    worst = 0.0
+    print(f"\nAgainst {baseline.get('commit') or 'baseline'} ({baseline.get('created_at')}):")
+    print(f"{'scenario':<10} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}")
+    for name, result in results['scenarios'].items():
+        old = baseline.get('scenarios', {}).get(name)
+        if old is None:
+            print(f"{name:<10} {'(new)':>9}")
+            continue
+        changes = [change(result['throughput_rps'], old['throughput_rps'])] + [
+            change(result['latency_ms'][f'p{p}'], old['latency_ms'][f'p{p}']) for p in PERCENTILES
+        ]
+        worst = max(worst, changes[2])
+        print(f"{name:<10} " + ' '.join(f'{value:>+8.1f}%' for value in changes))
+    return worst
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        sys.exit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    from app import create_app
+
+    workdir = tempfile.mkdtemp(prefix='documind-benchmark-')
+    try:
+        app = create_app(benchmark_config(args, workdir))
+
+        start = time.perf_counter()
+        accounts = seed_database(app, args.users, args.documents, args.document_size,
+                                 args.files, args.file_size, args.seed)
+        seed_seconds = time.perf_counter() - start
+        prepare_accounts(accounts, args.file_size, args.seed)
+
+        results = {
+            'created_at': datetime.utcnow().isoformat(),
+            'commit': git_commit(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'settings': vars(args),
+            'seed_seconds': round(seed_seconds, 3),
+            'scenarios': {}
+        }
+        for name in names:
+            results['scenarios'][name] = run_scenario(
+                app, accounts, SCENARIOS[name], args.requests, args.concurrency, args.warmup
+            )
+            print(f"{name}: done", file=sys.stderr)
+
+        server = app.extensions.get('fake_llm_server')
+        if server is not None:
+            server.stop()
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            worst = compare_results(results, json.load(f))
+        if args.max_regression is not None and worst > args.max_regression:
+            sys.exit(f"p95 latency regressed by {worst:.1f}% (limit {args.max_regression}%)")
+
+
+if __name__ == '__main__':
+    main()
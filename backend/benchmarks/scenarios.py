@@ -0,0 +1,108 @@
+import io
+import itertools
+import random
+import threading
+import time
+from benchmarks.seed import VOCABULARY, make_text
+
+# Job states after which an analysis is done, one way or another
+FINISHED_JOB_STATUSES = ('succeeded', 'failed', 'cancelled')
+
+# Scenario name -> function(client, account, number) returning the final response
+SCENARIOS = {}
+
+
+def scenario(name):
+    """Register a benchmark scenario"""
+    def decorator(run):
+        SCENARIOS[name] = run
+        return run
+    return decorator
+
+
+class Picker:
+    """Thread-safe round robin over a list, so concurrent requests spread over the seeded data"""
+
+    def __init__(self, items):
+        self._items = itertools.cycle(items)
+        self._lock = threading.Lock()
+
+    def next(self):
+        with self._lock:
+            return next(self._items)
+
+
+@scenario('list')
+def list_documents(client, account, number):
+    return client.get('/api/documents', headers=account['headers'])
+
+
+@scenario('search')
+def search_documents(client, account, number):
+    term = VOCABULARY[number % len(VOCABULARY)]
+    return client.get(f'/api/documents?search={term}', headers=account['headers'])
+
+
+@scenario('upload')
+def upload_file(client, account, number):
+    # Unique bytes per request, so each upload stores a new file rather than a reference
+    data = f'upload {account["user_id"]} {number} {time.time_ns()} '.encode('utf-8') + account['upload_body']
+    return client.post(
+        '/api/documents',
+        data={'file': (io.BytesIO(data), f'upload-{number}.txt')},
+        headers=account['headers'],
+        content_type='multipart/form-data'
+    )
+
+
+@scenario('download')
+def download_file(client, account, number):
+    document_id = account['file_picker'].next()
+    response = client.get(f'/api/documents/{document_id}/download', headers=account['headers'])
+    response.get_data()
+    return response
+
+
+@scenario('analyze')
+def analyze_document(client, account, number):
+    """Enqueue an analysis and wait for the job workers to finish it.
+
+    Documents are analyzed round robin, so runs with more requests than seeded
+    documents per user also measure analysis cache hits.
+    """
+    document_id = account['document_picker'].next()
+    response = client.post(f'/api/documents/{document_id}/analyze', headers=account['headers'])
+    if response.status_code != 202:
+        return response
+
+    job_id = response.get_json()['job']['id']
+    while True:
+        response = client.get(f'/api/jobs/{job_id}', headers=account['headers'])
+        if response.status_code != 200 or response.get_json()['job']['status'] in FINISHED_JOB_STATUSES:
+            return response
+        time.sleep(0.005)
+
+
+@scenario('chat')
+def chat(client, account, number):
+    return client.post('/api/chat', json={
+        'messages': [{'role': 'user', 'content': f'What do my documents say about {VOCABULARY[number % len(VOCABULARY)]}?'}]
+    }, headers=account['headers'])
+
+
+@scenario('generate')
+def generate_document(client, account, number):
+    return client.post('/api/generate', json={
+        'type': 'report',
+        'title': f'Benchmark report {number}',
+        'description': f'A short report on {VOCABULARY[number % len(VOCABULARY)]}'
+    }, headers=account['headers'])
+
+
+def prepare_accounts(accounts, upload_size, seed=0):
+    """Attach the per-account state scenarios draw from"""
+    rng = random.Random(seed)
+    for account in accounts:
+        account['document_picker'] = Picker(account['document_ids'])
+        account['file_picker'] = Picker(account['file_document_ids'] or account['document_ids'])
+        account['upload_body'] = make_text(rng, upload_size).encode('utf-8')
@@ -0,0 +1,90 @@
+import io
+import random
+from flask_jwt_extended import create_access_token
+from app import db
+from models.document import Document
+from models.user import User
+
+# Small fixed vocabulary so searches hit a predictable share of documents
+VOCABULARY = (
+    'revenue forecast budget contract invoice meeting hiring roadmap quarterly report customer '
+    'churn pricing launch release security audit compliance vendor renewal analysis strategy '
+    'marketing campaign pipeline retention onboarding feedback incident postmortem migration '
+    'database latency throughput capacity storage backup policy review summary proposal'
+).split()
+TAGS = ('finance', 'legal', 'hr', 'engineering', 'sales', 'marketing', 'ops', 'research')
+STATUSES = ('draft', 'final', 'archived')
+
+
+def make_text(rng, size):
+    """About size characters of words drawn from the vocabulary"""
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(VOCABULARY)
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words)
+
+
+def seed_database(app, users=2, documents=200, document_size=2000, files=20, file_size=20000, seed=0):
+    """Create users with documents and uploaded files; returns their auth headers and ids.
+
+    documents and files are per user. Text documents are inserted through the
+    ORM so the search and tag indexes see them; files go through the upload
+    endpoint so storage, hashing and precompression are exercised as in use.
+    """
+    rng = random.Random(seed)
+    accounts = []
+
+    with app.app_context():
+        # Hashing is deliberately slow, so every account shares one hash
+        template = User(username='template', email='template@example.com')
+        template.set_password('benchmark')
+        password_hash = template.password_hash
+
+        for number in range(users):
+            user = User(username=f'bench{number}', email=f'bench{number}@example.com', password_hash=password_hash)
+            db.session.add(user)
+            db.session.flush()
+
+            for index in range(documents):
+                document = Document(
+                    title=f'{rng.choice(VOCABULARY).title()} {rng.choice(VOCABULARY)} {index}',
+                    content=make_text(rng, document_size),
+                    file_type='txt',
+                    status=rng.choice(STATUSES),
+                    user_id=user.id
+                )
+                document.set_tags(rng.sample(TAGS, rng.randint(0, 3)))
+                db.session.add(document)
+
+            db.session.commit()
+            accounts.append({
+                'user_id': user.id,
+                'headers': {'Authorization': f'Bearer {create_access_token(identity=user.id)}'},
+                'document_ids': [],
+                'file_document_ids': []
+            })
+
+        for account in accounts:
+            account['document_ids'] = [document_id for (document_id,) in db.session.query(Document.id).filter(
+                Document.user_id == account['user_id']
+            ).order_by(Document.id).all()]
+
+    client = app.test_client()
+    for account in accounts:
+        for index in range(files):
+            # Distinct contents, so every upload stores a new file
+            data = f'{index} {account["user_id"]} {make_text(rng, file_size)}'.encode('utf-8')
+            response = client.post(
+                '/api/documents',
+                data={'file': (io.BytesIO(data), f'seed-{index}.txt'), 'title': f'Seed file {index}'},
+                headers=account['headers'],
+                content_type='multipart/form-data'
+            )
+            if response.status_code != 201:
+                raise RuntimeError(f'Seeding upload failed with {response.status_code}: {response.get_data(as_text=True)}')
+            account['file_document_ids'].append(response.get_json()['document']['id'])
+
+    return accounts
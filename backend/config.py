@@ -12,6 +12,19 @@ class Config:
     # Database settings
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL', 'sqlite:///documind.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    DB_MIGRATE_ON_STARTUP = os.environ.get('DB_MIGRATE_ON_STARTUP', 'True') == 'True'
+    
+    # Connection pool, used for server databases such as Postgres
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 10))
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW', 20))
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))  # Seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', 1800))  # Replace connections older than this
+    DB_POOL_PRE_PING = os.environ.get('DB_POOL_PRE_PING', 'True') == 'True'
+    
+    # SQLite connection pragmas
+    SQLITE_JOURNAL_MODE = os.environ.get('SQLITE_JOURNAL_MODE', 'WAL')
+    SQLITE_SYNCHRONOUS = os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL')
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get('SQLITE_BUSY_TIMEOUT', 5000))  # Milliseconds to wait for a lock
     
     # JWT settings
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY', 'jwt-dev-key-change-in-production')
@@ -20,7 +33,120 @@ class Config:
     
     # OpenAI settings
     OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL')  # None uses the OpenAI default
+    
+    # Shared LLM client settings
+    LLM_MAX_CONNECTIONS = int(os.environ.get('LLM_MAX_CONNECTIONS', 20))
+    LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('LLM_MAX_KEEPALIVE_CONNECTIONS', 10))
+    LLM_TIMEOUT = float(os.environ.get('LLM_TIMEOUT', 60))  # Seconds
+    LLM_CONNECT_TIMEOUT = float(os.environ.get('LLM_CONNECT_TIMEOUT', 5))
+    LLM_MAX_IN_FLIGHT = int(os.environ.get('LLM_MAX_IN_FLIGHT', 16))  # Concurrent requests per process
+    LLM_ACQUIRE_TIMEOUT = float(os.environ.get('LLM_ACQUIRE_TIMEOUT', 10))  # Wait for a free slot
+    
+    # Model routing: small inputs go to the small tier with an output budget sized to the input.
+    # LLM_ROUTES overrides the rules per task as JSON, e.g. {"chat": {"tier": "large"}, "generate": {"max_output": 3000}}
+    LLM_ROUTING_ENABLED = os.environ.get('LLM_ROUTING_ENABLED', 'True') == 'True'
+    LLM_MODEL_SMALL = os.environ.get('LLM_MODEL_SMALL', 'gpt-3.5-turbo')
+    LLM_MODEL_LARGE = os.environ.get('LLM_MODEL_LARGE', 'gpt-4-turbo')
+    LLM_ROUTES = os.environ.get('LLM_ROUTES', '')
+    
+    # LLM call resilience: LLM_TIMEOUT bounds each attempt, LLM_DEADLINE the call including retries
+    LLM_DEADLINE = float(os.environ.get('LLM_DEADLINE', 120))  # Seconds
+    LLM_MAX_RETRIES = int(os.environ.get('LLM_MAX_RETRIES', 2))  # For timeouts, 429 and 5xx responses
+    LLM_RETRY_BASE_DELAY = float(os.environ.get('LLM_RETRY_BASE_DELAY', 0.5))  # Seconds, doubled per retry, with jitter
+    LLM_RETRY_MAX_DELAY = float(os.environ.get('LLM_RETRY_MAX_DELAY', 8))
+    LLM_BREAKER_FAILURES = int(os.environ.get('LLM_BREAKER_FAILURES', 5))  # Consecutive failures that open the circuit, 0 disables
+    LLM_BREAKER_RESET = float(os.environ.get('LLM_BREAKER_RESET', 30))  # Seconds before a trial call is let through
+    LLM_HEDGE_DELAY = float(os.environ.get('LLM_HEDGE_DELAY', 0))  # Duplicate calls slower than this, 0 disables
+    LLM_HEDGE_FUNCTIONS = os.environ.get('LLM_HEDGE_FUNCTIONS', 'analyze_document').split(',')  # Idempotent LLM functions that may be hedged
+    
+    # Serve completions from an in-process fake server, for offline development and tests
+    LLM_FAKE_SERVER = os.environ.get('LLM_FAKE_SERVER', 'False') == 'True'
+    LLM_FAKE_LATENCY = float(os.environ.get('LLM_FAKE_LATENCY', 0))
+    LLM_FAKE_ERROR_RATE = float(os.environ.get('LLM_FAKE_ERROR_RATE', 0))  # Fraction of requests answered with 429 or 500
+    LLM_FAKE_STALL_RATE = float(os.environ.get('LLM_FAKE_STALL_RATE', 0))  # Fraction of requests that stall
+    LLM_FAKE_STALL_SECONDS = float(os.environ.get('LLM_FAKE_STALL_SECONDS', 30))
+    
+    # Long documents are analyzed in chunks of this many tokens, with at most
+    # ANALYSIS_MAX_CONCURRENCY chunk requests in flight
+    ANALYSIS_CHUNK_TOKENS = int(os.environ.get('ANALYSIS_CHUNK_TOKENS', 2000))
+    ANALYSIS_MAX_CONCURRENCY = int(os.environ.get('ANALYSIS_MAX_CONCURRENCY', 4))
+    
+    # Analysis cache settings
+    ANALYSIS_CACHE_ENABLED = os.environ.get('ANALYSIS_CACHE_ENABLED', 'True') == 'True'
+    ANALYSIS_CACHE_MEMORY_BYTES = int(os.environ.get('ANALYSIS_CACHE_MEMORY_BYTES', 16 * 1024 * 1024))
+    ANALYSIS_CACHE_DB_BYTES = int(os.environ.get('ANALYSIS_CACHE_DB_BYTES', 256 * 1024 * 1024))
+    
+    # Retrieval-augmented chat over the user's documents
+    RAG_ENABLED = os.environ.get('RAG_ENABLED', 'True') == 'True'
+    RAG_TOP_K = int(os.environ.get('RAG_TOP_K', 5))
+    RAG_MIN_SCORE = float(os.environ.get('RAG_MIN_SCORE', 0.1))  # Minimum cosine similarity
+    RAG_CHUNK_TOKENS = int(os.environ.get('RAG_CHUNK_TOKENS', 300))
+    EMBEDDING_PROVIDER = os.environ.get('EMBEDDING_PROVIDER', 'local')  # local or openai
+    EMBEDDING_MODEL = os.environ.get('EMBEDDING_MODEL', 'text-embedding-3-small')
+    EMBEDDING_DIMENSIONS = int(os.environ.get('EMBEDDING_DIMENSIONS', 256))  # Must match the model; ada-002 is fixed at 1536
+    VECTOR_INDEX_FOLDER = os.path.join(os.getcwd(), 'vector_index')
+    
+    # Server-side chat sessions: older turns are summarized once the history exceeds the budget
+    CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get('CHAT_HISTORY_TOKEN_BUDGET', 3000))
+    CHAT_KEEP_RECENT_MESSAGES = int(os.environ.get('CHAT_KEEP_RECENT_MESSAGES', 4))
+    CHAT_COMPACTION_TARGET = float(os.environ.get('CHAT_COMPACTION_TARGET', 0.5))  # Fraction of the budget
+    
+    # Background job settings
+    JOBS_WORKERS = int(os.environ.get('JOBS_WORKERS', 2))
+    JOBS_MAX_PER_USER = int(os.environ.get('JOBS_MAX_PER_USER', 2))  # Concurrently running jobs
+    JOBS_MAX_ATTEMPTS = int(os.environ.get('JOBS_MAX_ATTEMPTS', 3))
+    JOBS_RETRY_DELAY = float(os.environ.get('JOBS_RETRY_DELAY', 5))  # Seconds, doubled per attempt
+    JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 2))
+    JOBS_LEASE = int(os.environ.get('JOBS_LEASE', 60))  # Seconds a running job stays claimed without a worker heartbeat
     
     # File upload settings
     UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
-    MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB max upload size
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB max upload size
+    UPLOAD_CHUNK_SIZE = 64 * 1024  # Uploads are streamed to disk in chunks of this size
+    
+    # File storage backend: local (hash-sharded folders under UPLOAD_FOLDER), s3, or memory (in-process S3 stand-in)
+    STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'local')
+    S3_BUCKET = os.environ.get('S3_BUCKET')
+    S3_PREFIX = os.environ.get('S3_PREFIX', 'documents')
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL')  # For S3-compatible services such as MinIO
+    STORAGE_GC_GRACE_SECONDS = int(os.environ.get('STORAGE_GC_GRACE_SECONDS', 24 * 3600))
+    
+    # Precompressed download variants, written at upload for text-like files (zstd needs the zstandard package)
+    PRECOMPRESS_ENCODINGS = os.environ.get('PRECOMPRESS_ENCODINGS', 'zstd,gzip').split(',')
+    PRECOMPRESS_FILE_TYPES = os.environ.get('PRECOMPRESS_FILE_TYPES', 'txt,md,markdown,csv,json,log,html,htm').split(',')
+    PRECOMPRESS_MIN_SIZE = int(os.environ.get('PRECOMPRESS_MIN_SIZE', 1024))  # Bytes
+    PRECOMPRESS_MIN_RATIO = float(os.environ.get('PRECOMPRESS_MIN_RATIO', 0.9))  # Keep variants at most this fraction of the original
+    
+    # Document list pagination
+    DOCUMENTS_PAGE_SIZE = int(os.environ.get('DOCUMENTS_PAGE_SIZE', 50))
+    DOCUMENTS_MAX_PAGE_SIZE = int(os.environ.get('DOCUMENTS_MAX_PAGE_SIZE', 200))
+    
+    # Opt-in cache of chat and generation replies, keyed on the normalized messages and model parameters
+    RESPONSE_CACHE_ENABLED = os.environ.get('RESPONSE_CACHE_ENABLED', 'False') == 'True'
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND', 'memory')  # memory (per process) or database (shared)
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 3600))  # Seconds
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+    RESPONSE_CACHE_BYPASS_HEADER = os.environ.get('RESPONSE_CACHE_BYPASS_HEADER', 'X-Cache-Bypass')  # Set to 1 for a fresh reply
+    
+    # Document revision history: each edit is stored as a compressed diff, with a full snapshot every interval revisions
+    REVISIONS_ENABLED = os.environ.get('REVISIONS_ENABLED', 'True') == 'True'
+    REVISION_SNAPSHOT_INTERVAL = int(os.environ.get('REVISION_SNAPSHOT_INTERVAL', 20))  # Most diffs applied to read a revision
+    REVISION_KEEP_MAX = int(os.environ.get('REVISION_KEEP_MAX', 100))  # Revisions kept per document, 0 keeps all
+    REVISION_KEEP_DAYS = int(os.environ.get('REVISION_KEEP_DAYS', 0))  # revisions-prune drops older revisions, 0 disables
+    
+    # Near-duplicate detection: MinHash signatures of document text, bucketed per user with LSH
+    DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', 'True') == 'True'
+    DEDUP_NUM_PERM = int(os.environ.get('DEDUP_NUM_PERM', 128))  # Signature length, a multiple of DEDUP_BANDS
+    DEDUP_BANDS = int(os.environ.get('DEDUP_BANDS', 16))  # More bands find less similar candidates
+    DEDUP_SHINGLE_SIZE = int(os.environ.get('DEDUP_SHINGLE_SIZE', 5))  # Words per shingle
+    DEDUP_THRESHOLD = float(os.environ.get('DEDUP_THRESHOLD', 0.8))  # Estimated Jaccard similarity of duplicates
+    DEDUP_REUSE_ANALYSIS_THRESHOLD = float(os.environ.get('DEDUP_REUSE_ANALYSIS_THRESHOLD', 0.95))  # Copy a duplicate's analysis at ingest above this
+    
+    # Batch endpoints
+    BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', 500))  # Documents or files per request
+    
+    # Request metrics, served in the Prometheus text format at /api/metrics
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'True') == 'True'
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token required to scrape; unset, only loopback may scrape
+    SLOW_REQUEST_THRESHOLD = float(os.environ.get('SLOW_REQUEST_THRESHOLD', 0))  # Seconds; log slower requests with a breakdown, 0 disables
\ No newline at end of file
@@ -1,3 +1,13 @@
 # Import models here to make them available when importing the models package
 from models.user import User
-from models.document import Document
\ No newline at end of file
+from models.document import Document
+from models.analysis_cache import AnalysisCacheEntry
+from models.job import Job
+from models.chat_session import ChatSession, ChatMessage
+from models.document_text import DocumentText
+from models.stored_file import StoredFile
+from models.tag import Tag, document_tags
+from models.response_cache import ResponseCacheEntry
+from models.document_chunk import DocumentChunk
+from models.document_revision import DocumentRevision
+from models.document_signature import DocumentSignature, document_lsh_buckets
\ No newline at end of file
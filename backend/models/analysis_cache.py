@@ -0,0 +1,16 @@
+from app import db
+from datetime import datetime
+
+class AnalysisCacheEntry(db.Model):
+    __tablename__ = 'analysis_cache'
+    
+    # SHA-256 of (normalized content, prompt version, model)
+    key = db.Column(db.String(64), primary_key=True)
+    analysis = db.Column(db.Text, nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # Size of the analysis in bytes
+    hits = db.Column(db.Integer, default=0)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
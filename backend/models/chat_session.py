@@ -0,0 +1,59 @@
+from app import db
+from datetime import datetime
+
+class ChatSession(db.Model):
+    __table_args__ = (
+        db.Index('ix_chat_session_user_id_updated_at', 'user_id', 'updated_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    title = db.Column(db.String(255), nullable=True)
+    summary = db.Column(db.Text, nullable=True)  # Rolling summary of compacted turns
+    summary_tokens = db.Column(db.Integer, default=0)
+    
+    # Foreign keys
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    # Relationships
+    messages = db.relationship('ChatMessage', backref='session', lazy='dynamic',
+                               cascade='all, delete-orphan', order_by='ChatMessage.id')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'summary': self.summary,
+            'created_at': self.created_at.isoformat(),
+            'updated_at': self.updated_at.isoformat(),
+            'user_id': self.user_id
+        }
+
+class ChatMessage(db.Model):
+    __table_args__ = (
+        db.Index('ix_chat_message_session_id_compacted', 'session_id', 'compacted', 'id'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    role = db.Column(db.String(20), nullable=False)  # user, assistant
+    content = db.Column(db.Text, nullable=False)
+    token_count = db.Column(db.Integer, nullable=False)
+    compacted = db.Column(db.Boolean, default=False)  # Folded into the session summary
+    
+    # Foreign keys
+    session_id = db.Column(db.Integer, db.ForeignKey('chat_session.id'), nullable=False, index=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'role': self.role,
+            'content': self.content,
+            'compacted': self.compacted,
+            'created_at': self.created_at.isoformat()
+        }
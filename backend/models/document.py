@@ -2,13 +2,28 @@ from app import db
 from datetime import datetime
 import json
 
+MAX_TAG_LENGTH = 100  # Matches tag.name
+
 class Document(db.Model):
+    __table_args__ = (
+        # Every list query filters by owner and pages by (updated_at, id)
+        db.Index('ix_document_user_id_updated_at', 'user_id', 'updated_at', 'id'),
+        db.Index('ix_document_user_id_status_updated_at', 'user_id', 'status', 'updated_at', 'id'),
+    )
+    
+    # Fields that can be requested through to_dict(fields=...)
+    SERIALIZABLE_FIELDS = (
+        'id', 'title', 'content', 'file_type', 'file_size', 'status',
+        'tags', 'created_at', 'updated_at', 'user_id'
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
     content = db.Column(db.Text, nullable=True)
     file_path = db.Column(db.String(255), nullable=True)
     file_type = db.Column(db.String(50), nullable=True)
     file_size = db.Column(db.Integer, nullable=True)  # Size in bytes
+    content_hash = db.Column(db.String(64), db.ForeignKey('stored_file.sha256'), nullable=True, index=True)  # SHA-256 of the file
     status = db.Column(db.String(20), default='draft')  # draft, final, archived
     tags = db.Column(db.Text, nullable=True)  # Stored as JSON string
     analysis = db.Column(db.Text, nullable=True)  # AI analysis results
@@ -20,24 +35,42 @@ class Document(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Relationships
+    extracted = db.relationship('DocumentText', uselist=False, lazy='select', cascade='all, delete-orphan')
+    chunks = db.relationship('DocumentChunk', lazy='dynamic', cascade='all, delete-orphan',
+                             order_by='DocumentChunk.position')
+    
+    @staticmethod
+    def normalize_tags(tags_list):
+        """Strip, drop empty and de-duplicate tag names, keeping their order"""
+        names = []
+        for tag in tags_list or []:
+            name = str(tag).strip()[:MAX_TAG_LENGTH]
+            if name and name not in names:
+                names.append(name)
+        return names
+    
     def set_tags(self, tags_list):
-        self.tags = json.dumps(tags_list)
+        self.tags = json.dumps(self.normalize_tags(tags_list))
     
     def get_tags(self):
         if self.tags:
             return json.loads(self.tags)
         return []
     
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'title': self.title,
-            'content': self.content,
-            'file_type': self.file_type,
-            'file_size': self.file_size,
-            'status': self.status,
-            'tags': self.get_tags(),
-            'created_at': self.created_at.isoformat(),
-            'updated_at': self.updated_at.isoformat(),
-            'user_id': self.user_id
-        }
\ No newline at end of file
+    def to_dict(self, fields=None):
+        data = {
+            'id': lambda: self.id,
+            'title': lambda: self.title,
+            'content': lambda: self.content,
+            'file_type': lambda: self.file_type,
+            'file_size': lambda: self.file_size,
+            'status': lambda: self.status,
+            'tags': self.get_tags,
+            'created_at': lambda: self.created_at.isoformat(),
+            'updated_at': lambda: self.updated_at.isoformat(),
+            'user_id': lambda: self.user_id
+        }
+        
+        # Only touch the requested attributes so deferred columns stay unloaded
+        return {field: data[field]() for field in (fields or self.SERIALIZABLE_FIELDS)}
\ No newline at end of file
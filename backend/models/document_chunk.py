@@ -0,0 +1,26 @@
+from app import db
+from datetime import datetime
+
+class DocumentChunk(db.Model):
+    """One section of a document's last analysis, kept so unchanged sections are not analyzed again"""
+    __tablename__ = 'document_chunk'
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    chunk_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the normalized chunk text
+    token_count = db.Column(db.Integer, nullable=False)
+    analysis = db.Column(db.Text, nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    prompt_version = db.Column(db.Integer, nullable=False)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'position': self.position,
+            'chunk_hash': self.chunk_hash,
+            'token_count': self.token_count,
+            'model': self.model,
+            'created_at': self.created_at.isoformat()
+        }
@@ -0,0 +1,35 @@
+from app import db
+from datetime import datetime
+
+class DocumentRevision(db.Model):
+    """One saved version of a document's content, stored whole or as a diff from the previous one"""
+    __tablename__ = 'document_revision'
+    __table_args__ = (
+        db.UniqueConstraint('document_id', 'number', name='uq_document_revision_document_id_number'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id', ondelete='CASCADE'), nullable=False)
+    number = db.Column(db.Integer, nullable=False)  # 1, 2, ... per document
+    kind = db.Column(db.String(10), nullable=False)  # snapshot or delta
+    snapshot_number = db.Column(db.Integer, nullable=False)  # Snapshot the chain of deltas up to this revision starts from
+    data = db.Column(db.LargeBinary, nullable=False)  # zlib-compressed content (snapshot) or line diff (delta)
+    title = db.Column(db.String(255), nullable=True)
+    size = db.Column(db.Integer, nullable=False)  # Content length in characters
+    stored_size = db.Column(db.Integer, nullable=False)  # Bytes in data
+    content_hash = db.Column(db.String(64), nullable=False)  # SHA-256 of the content
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'number': self.number,
+            'kind': self.kind,
+            'title': self.title,
+            'size': self.size,
+            'stored_size': self.stored_size,
+            'content_hash': self.content_hash,
+            'created_at': self.created_at.isoformat()
+        }
@@ -0,0 +1,24 @@
+from app import db
+from datetime import datetime
+
+# LSH buckets of each signature band; documents sharing any (band, bucket) of one user are duplicate candidates
+document_lsh_buckets = db.Table(
+    'document_lsh_bucket',
+    db.Column('user_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
+    db.Column('band', db.Integer, primary_key=True),
+    db.Column('bucket', db.String(16), primary_key=True),  # Hex hash of the band's signature values
+    db.Column('document_id', db.Integer, db.ForeignKey('document.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_document_lsh_bucket_document_id', 'document_id')
+)
+
+class DocumentSignature(db.Model):
+    """MinHash signature of a document's text, used to find near-duplicate documents"""
+    __tablename__ = 'document_signature'
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id', ondelete='CASCADE'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    signature = db.Column(db.LargeBinary, nullable=False)  # uint32 minimum hash per permutation
+    shingle_count = db.Column(db.Integer, nullable=False)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
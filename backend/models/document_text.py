@@ -0,0 +1,42 @@
+from app import db
+from datetime import datetime
+import json
+
+class DocumentText(db.Model):
+    """Normalized text extracted once from an uploaded file"""
+    __tablename__ = 'document_text'
+    
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id', ondelete='CASCADE'), primary_key=True)
+    text = db.Column(db.Text, nullable=False)
+    sections = db.Column(db.Text, nullable=True)  # JSON list of page/section offsets into text
+    extractor = db.Column(db.String(50), nullable=False)  # e.g. text, pdf, docx
+    char_count = db.Column(db.Integer, nullable=False)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def set_sections(self, sections):
+        self.sections = json.dumps(sections)
+    
+    def get_sections(self):
+        if self.sections:
+            return json.loads(self.sections)
+        return []
+    
+    def copy(self):
+        """Copy the extracted text for another document with the same file"""
+        return DocumentText(
+            text=self.text,
+            sections=self.sections,
+            extractor=self.extractor,
+            char_count=self.char_count
+        )
+    
+    def to_dict(self):
+        return {
+            'document_id': self.document_id,
+            'extractor': self.extractor,
+            'char_count': self.char_count,
+            'sections': self.get_sections(),
+            'created_at': self.created_at.isoformat()
+        }
@@ -0,0 +1,54 @@
+from app import db
+from datetime import datetime
+import json
+
+class Job(db.Model):
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after', 'created_at'),  # Worker claims
+        db.Index('ix_job_user_id_status', 'user_id', 'status'),  # Per-user running caps
+        db.Index('ix_job_user_id_created_at', 'user_id', 'created_at', 'id'),  # Job list
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # e.g. analyze_document
+    status = db.Column(db.String(20), default='queued', index=True)  # queued, running, succeeded, failed, cancelled
+    payload = db.Column(db.Text, nullable=True)  # Stored as JSON string
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    
+    # Foreign keys
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    document_id = db.Column(db.Integer, db.ForeignKey('document.id', ondelete='SET NULL'), nullable=True)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)  # Delays retries
+    started_at = db.Column(db.DateTime, nullable=True)
+    lease_expires_at = db.Column(db.DateTime, nullable=True)  # Extended by the worker's heartbeat while running
+    finished_at = db.Column(db.DateTime, nullable=True)
+    
+    def set_payload(self, payload):
+        self.payload = json.dumps(payload)
+    
+    def get_payload(self):
+        if self.payload:
+            return json.loads(self.payload)
+        return {}
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'result': self.result,
+            'error': self.error,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'document_id': self.document_id,
+            'user_id': self.user_id,
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
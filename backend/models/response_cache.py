@@ -0,0 +1,17 @@
+from app import db
+from datetime import datetime
+
+class ResponseCacheEntry(db.Model):
+    __tablename__ = 'response_cache'
+    
+    # SHA-256 of (normalized messages, model parameters)
+    key = db.Column(db.String(64), primary_key=True)
+    response = db.Column(db.Text, nullable=False)
+    model = db.Column(db.String(100), nullable=False)
+    size = db.Column(db.Integer, nullable=False)  # Size of the response in bytes
+    hits = db.Column(db.Integer, default=0)
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+    last_accessed_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,24 @@
+from app import db
+from datetime import datetime
+import json
+
+class StoredFile(db.Model):
+    """A file stored once by content hash and shared by every document that uploaded it"""
+    __tablename__ = 'stored_file'
+    
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(255), nullable=False, index=True)
+    size = db.Column(db.Integer, nullable=False)  # Size in bytes
+    ref_count = db.Column(db.Integer, nullable=False, default=0)  # Documents referencing the file
+    variants = db.Column(db.Text, nullable=True)  # Precompressed copies as JSON {encoding: size}
+    
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def set_variants(self, variants):
+        self.variants = json.dumps(variants) if variants else None
+    
+    def get_variants(self):
+        if self.variants:
+            return json.loads(self.variants)
+        return {}
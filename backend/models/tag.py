@@ -0,0 +1,22 @@
+from app import db
+
+# Which documents carry which tags; (tag_id, document_id) serves lookups by tag
+document_tags = db.Table(
+    'document_tag',
+    db.Column('document_id', db.Integer, db.ForeignKey('document.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('tag_id', db.Integer, db.ForeignKey('tag.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_document_tag_tag_id', 'tag_id', 'document_id')
+)
+
+class Tag(db.Model):
+    """A tag name owned by one user, shared by all of that user's documents that carry it"""
+    __tablename__ = 'tag'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'name', name='uq_tag_user_id_name'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    
+    # Foreign keys
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
@@ -1,6 +1,13 @@
-from flask import Blueprint, request, jsonify, current_app
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from services.ai_service import generate_chat_response
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
+from flask_jwt_extended import jwt_required, get_jwt_identity, verify_jwt_in_request
+from app import db
+from models.chat_session import ChatSession
+from services.ai_service import generate_chat_response, stream_chat_response
+from services.chat_service import create_session, add_exchange, get_history, compact_session
+from services.llm_client import LLMBusyError
+from services.response_cache import cache_headers
+from services.vector_index import retrieve_chunks
+from utils.helpers import format_sse, retry_after_header, wants_stream
 
 chat_bp = Blueprint('chat', __name__)
 
@@ -19,8 +26,159 @@ def chat():
         # Log the incoming request for debugging
         current_app.logger.info(f"Chat request received with {len(data['messages'])} messages")
         
-        response = generate_chat_response(data['messages'])
-        return jsonify({'response': response}), 200
+        context_chunks = get_context_chunks(last_user_message(data['messages']), data.get('use_documents', True))
+        
+        if wants_stream(data, request.headers.get('Accept')):
+            return stream_chat(data['messages'], context_chunks)
+        
+        response = generate_chat_response(data['messages'], context_chunks)
+        return jsonify({'response': response, 'sources': format_sources(context_chunks)}), 200, cache_headers()
+    except LLMBusyError as e:
+        current_app.logger.warning(str(e))
+        return jsonify({'error': 'The AI service is busy, please retry shortly'}), 503, retry_after_header(e)
     except Exception as e:
         current_app.logger.error(f"Error in chat endpoint: {str(e)}")
-        return jsonify({'error': f'Failed to generate response: {str(e)}'}), 500
\ No newline at end of file
+        return jsonify({'error': f'Failed to generate response: {str(e)}'}), 500
+
+def last_user_message(messages):
+    return next((message.get('content') for message in reversed(messages) if message.get('role') == 'user'), None)
+
+def get_context_chunks(query, use_documents=True):
+    """Retrieve excerpts of the signed-in user's documents relevant to query"""
+    if not current_app.config['RAG_ENABLED'] or not use_documents or not query:
+        return []
+    
+    verify_jwt_in_request(optional=True)
+    current_user_id = get_jwt_identity()
+    if not current_user_id:
+        return []
+    
+    return retrieve_chunks(current_user_id, query)
+
+def format_sources(context_chunks):
+    return [
+        {'document_id': chunk['document_id'], 'position': chunk['position'], 'score': chunk['score']}
+        for chunk in context_chunks
+    ]
+
+def stream_chat(messages, context_chunks, on_complete=None):
+    """Stream the response as Server-Sent Events, one event per text delta.
+    
+    on_complete(text) is called with the full response, or with the partial
+    response if the stream is interrupted. The upstream stream is opened
+    before returning, so LLMBusyError and other errors opening it propagate
+    to the caller instead of becoming an error event after a 200.
+    """
+    deltas = stream_chat_response(messages, context_chunks)
+    
+    def events():
+        parts = []
+        try:
+            if context_chunks:
+                yield format_sse({'sources': format_sources(context_chunks)}, event='sources')
+            for delta in deltas:
+                parts.append(delta)
+                yield format_sse({'delta': delta})
+            yield format_sse({}, event='done')
+        except Exception as e:
+            current_app.logger.error(f"Error streaming chat response: {str(e)}")
+            yield format_sse({'error': 'Failed to generate response'}, event='error')
+        finally:
+            if on_complete and parts:
+                on_complete(''.join(parts))
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'  # Disable proxy buffering so deltas arrive immediately
+    })
+
+@chat_bp.route('/sessions', methods=['GET'])
+@jwt_required()
+def get_sessions():
+    current_user_id = get_jwt_identity()
+    
+    sessions = ChatSession.query.filter_by(user_id=current_user_id).order_by(ChatSession.updated_at.desc()).all()
+    
+    return jsonify({'sessions': [session.to_dict() for session in sessions]}), 200
+
+@chat_bp.route('/sessions', methods=['POST'])
+@jwt_required()
+def create_session_endpoint():
+    current_user_id = get_jwt_identity()
+    data = request.get_json(silent=True) or {}
+    
+    session = create_session(current_user_id, title=data.get('title'))
+    
+    return jsonify({'session': session.to_dict()}), 201
+
+@chat_bp.route('/sessions/<int:session_id>', methods=['GET'])
+@jwt_required()
+def get_session(session_id):
+    current_user_id = get_jwt_identity()
+    
+    session = ChatSession.query.filter_by(id=session_id, user_id=current_user_id).first()
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    result = session.to_dict()
+    result['messages'] = [message.to_dict() for message in session.messages]
+    
+    return jsonify({'session': result}), 200
+
+@chat_bp.route('/sessions/<int:session_id>', methods=['DELETE'])
+@jwt_required()
+def delete_session(session_id):
+    current_user_id = get_jwt_identity()
+    
+    session = ChatSession.query.filter_by(id=session_id, user_id=current_user_id).first()
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    db.session.delete(session)
+    db.session.commit()
+    
+    return jsonify({'message': 'Session deleted successfully'}), 200
+
+@chat_bp.route('/sessions/<int:session_id>/messages', methods=['POST'])
+@jwt_required()
+def send_session_message(session_id):
+    """Send only the new user message; the server keeps and compacts the history"""
+    current_user_id = get_jwt_identity()
+    
+    session = ChatSession.query.filter_by(id=session_id, user_id=current_user_id).first()
+    
+    if not session:
+        return jsonify({'error': 'Session not found'}), 404
+    
+    data = request.get_json()
+    
+    if not data or not data.get('content'):
+        return jsonify({'error': 'Missing content in request'}), 400
+    
+    try:
+        compact_session(session)
+        
+        # The new message is only stored along with its reply
+        history = get_history(session) + [{'role': 'user', 'content': data['content']}]
+        context_chunks = get_context_chunks(data['content'], data.get('use_documents', True))
+        
+        if wants_stream(data, request.headers.get('Accept')):
+            return stream_chat(history, context_chunks,
+                               on_complete=lambda text: add_exchange(session, data['content'], text))
+        
+        response = generate_chat_response(history, context_chunks)
+        message = add_exchange(session, data['content'], response)
+        
+        return jsonify({
+            'response': response,
+            'message': message.to_dict(),
+            'sources': format_sources(context_chunks)
+        }), 200, cache_headers()
+    except LLMBusyError as e:
+        current_app.logger.warning(str(e))
+        return jsonify({'error': 'The AI service is busy, please retry shortly'}), 503, retry_after_header(e)
+    except Exception as e:
+        current_app.logger.error(f"Error in chat session endpoint: {str(e)}")
+        return jsonify({'error': f'Failed to generate response: {str(e)}'}), 500
@@ -1,15 +1,102 @@
-from flask import Blueprint, request, jsonify, current_app, send_file
+from flask import Blueprint, request, jsonify, current_app, send_file, Response
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import os
+from sqlalchemy.orm import load_only
 from werkzeug.utils import secure_filename
 from app import db
 from models.document import Document
+from models.stored_file import StoredFile
 from models.user import User
-from services.ai_service import analyze_document
-from services.document_service import save_document_file, get_document_path
+from services.batch_service import bulk_update_documents, bulk_delete_documents
+from services.compression_service import ENCODING_SUFFIXES, variant_key
+from services.document_service import (
+    save_document_file, get_document_path, has_document_text, extract_document_text,
+    release_document_file, remove_file
+)
+from services.duplicate_service import duplicate_clusters, find_near_duplicates, reuse_duplicate_analysis
+from services.job_service import enqueue_job, notify_workers
+from services.search_service import search_documents
+from services.tag_service import tagged_document_ids, tag_facets
+from services.storage_service import StorageError, delete_files, file_exists, get_local_path, open_file_lazily
+from utils.helpers import encode_cursor, decode_cursor, encode_rank_cursor, decode_rank_cursor, make_etag
 
 documents_bp = Blueprint('documents', __name__)
 
+def parse_fields(default):
+    """Parse the comma separated fields= projection, raising ValueError on unknown fields"""
+    raw = request.args.get('fields')
+    if not raw:
+        return list(default)
+    
+    fields = [field.strip() for field in raw.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in Document.SERIALIZABLE_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+def parse_limit():
+    """Parse the page size, clamped to the configured maximum"""
+    default = current_app.config['DOCUMENTS_PAGE_SIZE']
+    maximum = current_app.config['DOCUMENTS_MAX_PAGE_SIZE']
+    try:
+        limit = int(request.args.get('limit', default))
+    except ValueError:
+        raise ValueError('limit must be an integer')
+    return max(1, min(limit, maximum))
+
+def parse_tags():
+    """Parse tag filters given as repeated tag= parameters or comma separated lists"""
+    names = []
+    for value in request.args.getlist('tag'):
+        names.extend(value.split(','))
+    return Document.normalize_tags(names)
+
+def projection_options(fields):
+    """Only load the columns needed for the requested fields; analysis, and content unless requested, stay deferred"""
+    columns = {'id', 'updated_at'} | set(fields)
+    return load_only(*[getattr(Document, column) for column in columns])
+
+def choose_encoding(variants):
+    """Pick the precompressed variant the client accepts best, or None for the original file"""
+    if not variants:
+        return None
+    offered = [encoding for encoding in ENCODING_SUFFIXES if encoding in variants]
+    return request.accept_encodings.best_match(offered)
+
+def list_etag(user_id, status, resource='documents'):
+    """Version of a document list response, from one aggregate query that loads no rows.
+    
+    Any insert or update raises max(updated_at) and any delete lowers the
+    count, so the pair changes whenever the listed documents can have.
+    """
+    query = db.session.query(db.func.max(Document.updated_at), db.func.count(Document.id)).filter(
+        Document.user_id == user_id
+    )
+    if status:
+        query = query.filter(Document.status == status)
+    latest, count = query.one()
+    
+    # Pagination, projection and search parameters are part of the response too
+    params = sorted(request.args.items(multi=True))
+    return make_etag(resource, user_id, params, latest, count)
+
+def not_modified(etag):
+    """A 304 response if the client already holds this version, else None"""
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+        return with_etag(response, etag)
+    return None
+
+def with_etag(response, etag):
+    """Tag a response so clients can revalidate it with If-None-Match"""
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
 @documents_bp.route('', methods=['GET'])
 @jwt_required()
 def get_documents():
@@ -18,35 +105,190 @@ def get_documents():
     # Get query parameters
     status = request.args.get('status')
     search = request.args.get('search')
+    cursor = request.args.get('cursor')
+    tags = parse_tags()
+    
+    try:
+        fields = parse_fields(Document.SERIALIZABLE_FIELDS)
+        limit = parse_limit()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # Polling clients get a 304 before any document is loaded
+    etag = list_etag(current_user_id, status)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    if search:
+        # Ranked full-text search over title, content, tags and analysis
+        after = None
+        if cursor:
+            try:
+                after = decode_rank_cursor(cursor)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+        
+        # Fetch one extra hit to know whether another page exists
+        hits = search_documents(current_user_id, search, status=status, tags=tags, limit=limit + 1, after=after)
+        
+        next_cursor = None
+        if len(hits) > limit:
+            hits = hits[:limit]
+            next_cursor = encode_rank_cursor(hits[-1]['rank'], hits[-1]['id'])
+        
+        documents = Document.query.options(projection_options(fields)).filter(
+            Document.id.in_([hit['id'] for hit in hits])
+        ).all()
+        documents_by_id = {doc.id: doc for doc in documents}
+        
+        results = []
+        for hit in hits:
+            document = documents_by_id.get(hit['id'])
+            if document:
+                result = document.to_dict(fields)
+                result['search'] = {
+                    'rank': hit['rank'],
+                    'title_highlight': hit['title_highlight'],
+                    'snippet': hit['snippet']
+                }
+                results.append(result)
+        
+        return with_etag(jsonify({'documents': results, 'next_cursor': next_cursor}), etag)
     
     # Base query
-    query = Document.query.filter_by(user_id=current_user_id)
+    query = Document.query.options(projection_options(fields)).filter_by(user_id=current_user_id)
     
     # Apply filters
     if status:
         query = query.filter_by(status=status)
     
-    if search:
-        query = query.filter(Document.title.ilike(f'%{search}%'))
+    # Documents must carry every requested tag
+    if tags:
+        query = query.filter(Document.id.in_(tagged_document_ids(current_user_id, tags)))
+    
+    # Keyset pagination on (updated_at, id) so every page costs the same
+    if cursor:
+        try:
+            cursor_updated_at, cursor_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        query = query.filter(db.or_(
+            Document.updated_at < cursor_updated_at,
+            db.and_(Document.updated_at == cursor_updated_at, Document.id < cursor_id)
+        ))
+    
+    # Execute query, fetching one extra row to know whether another page exists
+    documents = query.order_by(Document.updated_at.desc(), Document.id.desc()).limit(limit + 1).all()
+    
+    next_cursor = None
+    if len(documents) > limit:
+        documents = documents[:limit]
+        next_cursor = encode_cursor(documents[-1].updated_at, documents[-1].id)
     
-    # Execute query
-    documents = query.order_by(Document.updated_at.desc()).all()
+    response = jsonify({
+        'documents': [doc.to_dict(fields) for doc in documents],
+        'next_cursor': next_cursor
+    })
+    return with_etag(response, etag)
+
+@documents_bp.route('/tags', methods=['GET'])
+@jwt_required()
+def get_tag_facets():
+    current_user_id = get_jwt_identity()
+    
+    # Counts follow the same status and tag filters as the document list
+    etag = list_etag(current_user_id, request.args.get('status'), resource='tags')
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    return jsonify({
-        'documents': [doc.to_dict() for doc in documents]
-    }), 200
+    facets = tag_facets(current_user_id, status=request.args.get('status'), tags=parse_tags())
+    
+    return with_etag(jsonify({'tags': facets}), etag)
+
+@documents_bp.route('/duplicates', methods=['GET'])
+@jwt_required()
+def get_duplicate_clusters():
+    current_user_id = get_jwt_identity()
+    
+    clusters = duplicate_clusters(current_user_id, threshold=request.args.get('threshold', type=float))
+    
+    ids = [document_id for cluster in clusters for document_id, _ in cluster]
+    documents = {
+        document.id: document for document in Document.query.options(
+            load_only(Document.id, Document.title, Document.created_at)
+        ).filter(Document.user_id == current_user_id, Document.id.in_(ids))
+    } if ids else {}
+    
+    return jsonify({'clusters': [
+        duplicate_summaries((documents[document_id], score) for document_id, score in cluster if document_id in documents)
+        for cluster in clusters
+    ]}), 200
 
 @documents_bp.route('/<int:document_id>', methods=['GET'])
 @jwt_required()
 def get_document(document_id):
     current_user_id = get_jwt_identity()
     
+    # Check the version first so unchanged documents are never loaded
+    version = db.session.query(Document.updated_at).filter_by(id=document_id, user_id=current_user_id).first()
+    
+    if not version:
+        return jsonify({'error': 'Document not found'}), 404
+    
+    etag = make_etag('document', document_id, version.updated_at)
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
     document = Document.query.filter_by(id=document_id, user_id=current_user_id).first()
     
     if not document:
         return jsonify({'error': 'Document not found'}), 404
     
-    return jsonify({'document': document.to_dict()}), 200
+    return with_etag(jsonify({'document': document.to_dict()}), make_etag('document', document.id, document.updated_at))
+
+def create_file_document(file, user_id, title):
+    """Store an uploaded file and add its document to the session, described by the form fields"""
+    description = request.form.get('description', '')
+    tags = request.form.get('tags', '').split(',') if request.form.get('tags') else []
+    
+    # Save file
+    filename = secure_filename(file.filename)
+    stored_file = save_document_file(file)
+    
+    # Create document record
+    document = Document(
+        title=title,
+        content=description,
+        file_path=stored_file.path,
+        file_type=os.path.splitext(filename)[1][1:],  # Get extension without dot
+        file_size=stored_file.size,
+        content_hash=stored_file.sha256,
+        user_id=user_id
+    )
+    
+    document.set_tags(tags)
+    
+    # Extract text once so analysis, search and retrieval never re-parse the file
+    extract_document_text(document)
+    
+    db.session.add(document)
+    return document
+
+def duplicate_summaries(duplicates):
+    return [
+        {**duplicate.to_dict(fields=('id', 'title', 'created_at')), 'similarity': round(score, 3)}
+        for duplicate, score in duplicates
+    ]
+
+def existing_duplicate_response(duplicates):
+    """Drop the new document and answer with the most similar existing one instead"""
+    db.session.rollback()
+    existing, score = duplicates[0]
+    return jsonify({'document': existing.to_dict(), 'duplicate_of': existing.id, 'similarity': round(score, 3)}), 200
 
 @documents_bp.route('', methods=['POST'])
 @jwt_required()
@@ -61,41 +303,8 @@ def create_document():
         if file.filename == '':
             return jsonify({'error': 'No file selected'}), 400
         
-        # Get form data
-        title = request.form.get('title', file.filename)
-        description = request.form.get('description', '')
-        tags = request.form.get('tags', '').split(',') if request.form.get('tags') else []
-        
-        # Save file
-        filename = secure_filename(file.filename)
-        file_path = save_document_file(file, current_user_id)
-        
-        # Create document record
-        document = Document(
-            title=title,
-            content=description,
-            file_path=file_path,
-            file_type=os.path.splitext(filename)[1][1:],  # Get extension without dot
-            file_size=os.path.getsize(file_path),
-            user_id=current_user_id
-        )
-        
-        document.set_tags(tags)
-        
-        # Analyze document if requested
-        if request.form.get('analyze') == 'true':
-            try:
-                with open(file_path, 'r') as f:
-                    content = f.read()
-                analysis = analyze_document(content)
-                document.analysis = analysis
-            except Exception as e:
-                current_app.logger.error(f"Error analyzing document: {str(e)}")
-        
-        db.session.add(document)
-        db.session.commit()
-        
-        return jsonify({'document': document.to_dict()}), 201
+        document = create_file_document(file, current_user_id, request.form.get('title', file.filename))
+        options = request.form
     else:
         # Handle JSON data for document creation
         data = request.get_json()
@@ -114,9 +323,33 @@ def create_document():
             document.set_tags(data['tags'])
         
         db.session.add(document)
-        db.session.commit()
-        
-        return jsonify({'document': document.to_dict()}), 201
+        options = data
+    
+    # Flushing writes the new document's signature, which the lookup compares against
+    db.session.flush()
+    duplicates = find_near_duplicates(document)
+    
+    # on_duplicate=existing keeps a near-duplicate upload from being stored, indexed and analyzed again
+    if duplicates and options.get('on_duplicate') == 'existing':
+        return existing_duplicate_response(duplicates)
+    
+    reused_from = reuse_duplicate_analysis(document, duplicates)
+    # Summarized before the commit expires the duplicates' loaded attributes
+    summaries = duplicate_summaries(duplicates)
+    db.session.commit()
+    
+    response = {'document': document.to_dict()}
+    if summaries:
+        response['duplicates'] = summaries
+    if reused_from:
+        response['analysis_reused_from'] = reused_from
+    
+    # Queue analysis in the background if requested, unless a duplicate's analysis was reused
+    if str(options.get('analyze')).lower() == 'true' and not reused_from:
+        job = enqueue_job('analyze_document', current_user_id, document_id=document.id)
+        response['job'] = job.to_dict()
+    
+    return jsonify(response), 201
 
 @documents_bp.route('/<int:document_id>', methods=['PUT'])
 @jwt_required()
@@ -144,6 +377,11 @@ def update_document(document_id):
     
     db.session.commit()
     
+    # Re-analyze after an edit if requested; unchanged sections keep their analysis
+    if data.get('analyze') and has_document_text(document):
+        job = enqueue_job('analyze_document', current_user_id, document_id=document.id)
+        return jsonify({'document': document.to_dict(), 'job': job.to_dict()}), 200
+    
     return jsonify({'document': document.to_dict()}), 200
 
 @documents_bp.route('/<int:document_id>', methods=['DELETE'])
@@ -156,15 +394,122 @@ def delete_document(document_id):
     if not document:
         return jsonify({'error': 'Document not found'}), 404
     
-    # Delete file if exists
-    if document.file_path and os.path.exists(document.file_path):
-        os.remove(document.file_path)
+    # Drop the file reference; shared files are left to storage-gc once unreferenced
+    orphaned_path = release_document_file(document)
     
     db.session.delete(document)
     db.session.commit()
     
+    remove_file(orphaned_path)
+    
     return jsonify({'message': 'Document deleted successfully'}), 200
 
+def parse_batch_ids(data):
+    """Parse the ids of a batch request, raising ValueError if missing, malformed or too many"""
+    ids = (data or {}).get('ids')
+    if not isinstance(ids, list) or not ids:
+        raise ValueError('ids must be a non-empty list of document ids')
+    if len(ids) > current_app.config['BATCH_MAX_ITEMS']:
+        raise ValueError(f"At most {current_app.config['BATCH_MAX_ITEMS']} documents per batch")
+    try:
+        return list(dict.fromkeys(int(document_id) for document_id in ids))
+    except (TypeError, ValueError):
+        raise ValueError('ids must be a non-empty list of document ids')
+
+def batch_response(results, success_status=200):
+    """Per-item results, with 207 Multi-Status when some items failed"""
+    failed = sum(1 for result in results if result['status'] >= 400)
+    status = 207 if failed else success_status
+    return jsonify({'results': results, 'succeeded': len(results) - failed, 'failed': failed}), status
+
+@documents_bp.route('/batch', methods=['POST'])
+@jwt_required()
+def batch_upload():
+    current_user_id = get_jwt_identity()
+    
+    files = request.files.getlist('files') + request.files.getlist('file')
+    if not files:
+        return jsonify({'error': 'No files uploaded'}), 400
+    if len(files) > current_app.config['BATCH_MAX_ITEMS']:
+        return jsonify({'error': f"At most {current_app.config['BATCH_MAX_ITEMS']} files per batch"}), 400
+    
+    created = []
+    results = []
+    for file in files:
+        if not file.filename:
+            results.append({'filename': '', 'status': 400, 'error': 'No file selected'})
+            continue
+        
+        # A file that cannot be stored fails on its own without undoing the others
+        try:
+            with db.session.begin_nested():
+                document = create_file_document(file, current_user_id, file.filename)
+        except (StorageError, OSError) as e:
+            current_app.logger.error(f"Error storing uploaded file: {str(e)}")
+            results.append({'filename': file.filename, 'status': 500, 'error': 'Could not store file'})
+            continue
+        
+        result = {'filename': file.filename, 'status': 201}
+        results.append(result)
+        created.append((result, document))
+    
+    db.session.flush()
+    
+    # All documents and their analysis jobs are committed together
+    analyze = request.form.get('analyze') == 'true'
+    jobs = [enqueue_job('analyze_document', current_user_id, document_id=document.id, commit=False)
+            for _, document in created] if analyze else []
+    db.session.commit()
+    if jobs:
+        notify_workers()
+    
+    for index, (result, document) in enumerate(created):
+        result['document'] = document.to_dict()
+        if jobs:
+            result['job'] = jobs[index].to_dict()
+    
+    return batch_response(results, success_status=201)
+
+@documents_bp.route('/batch', methods=['PUT'])
+@jwt_required()
+def batch_update():
+    current_user_id = get_jwt_identity()
+    
+    data = request.get_json(silent=True)
+    try:
+        ids = parse_batch_ids(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    changes = {key: data[key] for key in ('status', 'tags', 'add_tags', 'remove_tags') if data.get(key) is not None}
+    if not changes:
+        return jsonify({'error': 'Nothing to update; set status, tags, add_tags or remove_tags'}), 400
+    if any(not isinstance(changes[key], list) for key in ('tags', 'add_tags', 'remove_tags') if key in changes):
+        return jsonify({'error': 'tags, add_tags and remove_tags must be lists'}), 400
+    
+    results = bulk_update_documents(current_user_id, ids, **changes)
+    db.session.commit()
+    
+    return batch_response(results)
+
+@documents_bp.route('/batch', methods=['DELETE'])
+@jwt_required()
+def batch_delete():
+    current_user_id = get_jwt_identity()
+    
+    try:
+        ids = parse_batch_ids(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    results, orphaned_paths = bulk_delete_documents(current_user_id, ids)
+    db.session.commit()
+    
+    # Files go only once nothing references them any more
+    delete_files(orphaned_paths)
+    
+    return batch_response(results)
+
 @documents_bp.route('/<int:document_id>/download', methods=['GET'])
 @jwt_required()
 def download_document(document_id):
@@ -175,10 +520,57 @@ def download_document(document_id):
     if not document:
         return jsonify({'error': 'Document not found'}), 404
     
-    if not document.file_path or not os.path.exists(document.file_path):
+    if not document.file_path:
         return jsonify({'error': 'Document file not found'}), 404
     
-    return send_file(document.file_path, as_attachment=True, download_name=f"{document.title}.{document.file_type}")
+    download_name = f"{document.title}.{document.file_type}"
+    stored_file = db.session.get(StoredFile, document.content_hash) if document.content_hash else None
+    
+    if stored_file is None:
+        # Files stored before content addressing are validated by mtime and size
+        if not file_exists(document.file_path):
+            return jsonify({'error': 'Document file not found'}), 404
+        response = send_file(get_local_path(document.file_path), as_attachment=True,
+                             download_name=download_name, conditional=True)
+        response.cache_control.private = True
+        return response
+    
+    # Stored content never changes, so its hash is a strong validator
+    variants = stored_file.get_variants()
+    encoding = choose_encoding(variants)
+    if encoding:
+        key = variant_key(stored_file.path, encoding)
+        size = variants[encoding]
+        etag = f"{stored_file.sha256}-{encoding}"
+    else:
+        key = stored_file.path
+        size = stored_file.size
+        etag = stored_file.sha256
+    
+    # Local files go out through send_file, which uses the server's zero-copy file wrapper
+    # (or X-Sendfile with USE_X_SENDFILE); remote objects are read lazily with ranged reads
+    local_path = get_local_path(key)
+    if local_path:
+        if not os.path.exists(local_path):
+            return jsonify({'error': 'Document file not found'}), 404
+        response = send_file(local_path, as_attachment=True, download_name=download_name,
+                             etag=etag, last_modified=stored_file.created_at, conditional=True)
+    else:
+        response = send_file(open_file_lazily(key, size), as_attachment=True, download_name=download_name,
+                             etag=etag, last_modified=stored_file.created_at, conditional=False)
+        response.content_length = size
+        response.make_conditional(request, accept_ranges=True, complete_length=size)
+        if response.status_code != 304 and not file_exists(key):
+            response.close()
+            return jsonify({'error': 'Document file not found'}), 404
+    
+    response.cache_control.private = True
+    if variants:
+        response.vary.add('Accept-Encoding')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    
+    return response
 
 @documents_bp.route('/<int:document_id>/analyze', methods=['POST'])
 @jwt_required()
@@ -190,24 +582,10 @@ def analyze_document_endpoint(document_id):
     if not document:
         return jsonify({'error': 'Document not found'}), 404
     
-    try:
-        content = ""
-        if document.file_path and os.path.exists(document.file_path):
-            with open(document.file_path, 'r') as f:
-                content = f.read()
-        elif document.content:
-            content = document.content
-        else:
-            return jsonify({'error': 'No content to analyze'}), 400
-        
-        analysis = analyze_document(content)
-        document.analysis = analysis
-        db.session.commit()
-        
-        return jsonify({
-            'analysis': analysis,
-            'document': document.to_dict()
-        }), 200
-    except Exception as e:
-        current_app.logger.error(f"Error analyzing document: {str(e)}")
-        return jsonify({'error': 'Failed to analyze document'}), 500
\ No newline at end of file
+    if not has_document_text(document):
+        return jsonify({'error': 'No content to analyze'}), 400
+    
+    # Analysis runs on the job workers; poll /api/jobs/<id> for the result
+    job = enqueue_job('analyze_document', current_user_id, document_id=document.id)
+    
+    return jsonify({'job': job.to_dict()}), 202
\ No newline at end of file
@@ -1,8 +1,11 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify, current_app, Response, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
 from models.document import Document
-from services.ai_service import generate_document_content
+from services.ai_service import generate_document_content, stream_document_content
+from services.llm_client import LLMBusyError
+from services.response_cache import cache_headers
+from utils.helpers import format_sse, retry_after_header, wants_stream
 
 generate_bp = Blueprint('generate', __name__)
 
@@ -15,6 +18,9 @@ def generate_document():
     if not data or not data.get('title') or not data.get('type') or not data.get('description'):
         return jsonify({'error': 'Missing required fields: title, type, or description'}), 400
     
+    if wants_stream(data, request.headers.get('Accept')):
+        return stream_generation(data, current_user_id)
+    
     try:
         # Generate document content
         content = generate_document_content(
@@ -24,24 +30,78 @@ def generate_document():
         )
         
         # Create document in database
-        document = Document(
-            title=data['title'],
-            content=content,
-            file_type='md',  # Markdown format
-            status='draft',
-            user_id=current_user_id
-        )
-        
-        if 'tags' in data:
-            document.set_tags(data['tags'])
-        
-        db.session.add(document)
-        db.session.commit()
+        document = save_generated_document(data, current_user_id, content)
         
         return jsonify({
             'document': document.to_dict(),
             'content': content
-        }), 201
+        }), 201, cache_headers()
+    except LLMBusyError as e:
+        current_app.logger.warning(str(e))
+        return jsonify({'error': 'The AI service is busy, please retry shortly'}), 503, retry_after_header(e)
+    except Exception as e:
+        current_app.logger.error(f"Error generating document: {str(e)}")
+        return jsonify({'error': 'Failed to generate document'}), 500
+
+def save_generated_document(data, user_id, content):
+    """Create the document for generated content"""
+    document = Document(
+        title=data['title'],
+        content=content,
+        file_type='md',  # Markdown format
+        status='draft',
+        user_id=user_id
+    )
+    
+    if 'tags' in data:
+        document.set_tags(data['tags'])
+    
+    db.session.add(document)
+    db.session.commit()
+    
+    return document
+
+def stream_generation(data, user_id):
+    """Stream generated content as Server-Sent Events and save the document at the end.
+    
+    If the client disconnects mid-stream, the content received so far is saved
+    as a draft so the work is not lost.
+    """
+    try:
+        deltas = stream_document_content(
+            document_type=data['type'],
+            title=data['title'],
+            description=data['description']
+        )
+    except LLMBusyError as e:
+        current_app.logger.warning(str(e))
+        return jsonify({'error': 'The AI service is busy, please retry shortly'}), 503, retry_after_header(e)
     except Exception as e:
         current_app.logger.error(f"Error generating document: {str(e)}")
-        return jsonify({'error': 'Failed to generate document'}), 500
\ No newline at end of file
+        return jsonify({'error': 'Failed to generate document'}), 500
+    
+    def events():
+        parts = []
+        completed = False
+        try:
+            for delta in deltas:
+                parts.append(delta)
+                yield format_sse({'delta': delta})
+            
+            completed = True
+            document = save_generated_document(data, user_id, ''.join(parts))
+            yield format_sse({'document': document.to_dict()}, event='done')
+        except Exception as e:
+            current_app.logger.error(f"Error generating document: {str(e)}")
+            yield format_sse({'error': 'Failed to generate document'}, event='error')
+        finally:
+            # GeneratorExit on client disconnect lands here with completed still False
+            if not completed and parts:
+                deltas.close()
+                document = save_generated_document(data, user_id, ''.join(parts))
+                current_app.logger.info(f"Saved partial generated document {document.id} after interrupted stream")
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
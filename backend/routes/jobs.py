@@ -0,0 +1,54 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from models.job import Job
+from services.job_service import cancel_job
+
+jobs_bp = Blueprint('jobs', __name__)
+
+@jobs_bp.route('', methods=['GET'])
+@jwt_required()
+def get_jobs():
+    current_user_id = get_jwt_identity()
+    
+    # Get query parameters
+    status = request.args.get('status')
+    document_id = request.args.get('document_id', type=int)
+    
+    query = Job.query.filter_by(user_id=current_user_id)
+    
+    if status:
+        query = query.filter_by(status=status)
+    
+    if document_id:
+        query = query.filter_by(document_id=document_id)
+    
+    jobs = query.order_by(Job.created_at.desc(), Job.id.desc()).limit(50).all()
+    
+    return jsonify({'jobs': [job.to_dict() for job in jobs]}), 200
+
+@jobs_bp.route('/<int:job_id>', methods=['GET'])
+@jwt_required()
+def get_job(job_id):
+    current_user_id = get_jwt_identity()
+    
+    job = Job.query.filter_by(id=job_id, user_id=current_user_id).first()
+    
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    return jsonify({'job': job.to_dict()}), 200
+
+@jobs_bp.route('/<int:job_id>/cancel', methods=['POST'])
+@jwt_required()
+def cancel_job_endpoint(job_id):
+    current_user_id = get_jwt_identity()
+    
+    job = Job.query.filter_by(id=job_id, user_id=current_user_id).first()
+    
+    if not job:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    if not cancel_job(job):
+        return jsonify({'error': f'Job is already {job.status}'}), 409
+    
+    return jsonify({'job': job.to_dict()}), 200
@@ -0,0 +1,27 @@
+import hmac
+from flask import Blueprint, Response, current_app, jsonify, request
+from services.metrics_service import get_metrics
+
+metrics_bp = Blueprint('metrics', __name__)
+
+LOOPBACK_ADDRESSES = ('127.0.0.1', '::1')
+
+def is_local_request():
+    """Whether the request came straight from this host rather than through a proxy"""
+    return request.remote_addr in LOOPBACK_ADDRESSES and 'X-Forwarded-For' not in request.headers
+
+@metrics_bp.route('', methods=['GET'])
+def export_metrics():
+    if not current_app.config['METRICS_ENABLED']:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    
+    # Scrapers authenticate with a static token rather than a user JWT; without one only local scrapes are served
+    token = current_app.config['METRICS_TOKEN']
+    if token:
+        header = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(header.encode(), f'Bearer {token}'.encode()):
+            return jsonify({'error': 'Invalid metrics token'}), 401
+    elif not is_local_request():
+        return jsonify({'error': 'Set METRICS_TOKEN to scrape metrics from another host'}), 403
+    
+    return Response(get_metrics().render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,65 @@
+from flask import Blueprint, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from app import db
+from models.document import Document
+from models.document_revision import DocumentRevision
+from services.revision_service import get_revision_content, list_revisions, revision_storage
+
+revisions_bp = Blueprint('revisions', __name__)
+
+@revisions_bp.route('/<int:document_id>/revisions', methods=['GET'])
+@jwt_required()
+def get_revisions(document_id):
+    current_user_id = get_jwt_identity()
+    
+    if not Document.query.filter_by(id=document_id, user_id=current_user_id).count():
+        return jsonify({'error': 'Document not found'}), 404
+    
+    # Newest first; pass the last number seen as before= for the next page
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    before = request.args.get('before', type=int)
+    revisions = list_revisions(document_id, limit=limit, before=before)
+    
+    return jsonify({
+        'revisions': [revision.to_dict() for revision in revisions],
+        'next_before': revisions[-1].number if len(revisions) == limit else None,
+        'storage': revision_storage(document_id)
+    }), 200
+
+@revisions_bp.route('/<int:document_id>/revisions/<int:number>', methods=['GET'])
+@jwt_required()
+def get_revision(document_id, number):
+    current_user_id = get_jwt_identity()
+    
+    if not Document.query.filter_by(id=document_id, user_id=current_user_id).count():
+        return jsonify({'error': 'Document not found'}), 404
+    
+    revision = DocumentRevision.query.options(db.defer(DocumentRevision.data)).filter_by(
+        document_id=document_id, number=number
+    ).first()
+    
+    if not revision:
+        return jsonify({'error': 'Revision not found'}), 404
+    
+    return jsonify({'revision': {**revision.to_dict(), 'content': get_revision_content(document_id, number)}}), 200
+
+@revisions_bp.route('/<int:document_id>/revisions/<int:number>/restore', methods=['POST'])
+@jwt_required()
+def restore_revision(document_id, number):
+    current_user_id = get_jwt_identity()
+    
+    document = Document.query.filter_by(id=document_id, user_id=current_user_id).first()
+    
+    if not document:
+        return jsonify({'error': 'Document not found'}), 404
+    
+    content = get_revision_content(document_id, number)
+    
+    if content is None:
+        return jsonify({'error': 'Revision not found'}), 404
+    
+    # Restoring saves the old content as a new revision, so the restore can be undone too
+    document.content = content
+    db.session.commit()
+    
+    return jsonify({'document': document.to_dict()}), 200
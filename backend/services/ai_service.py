@@ -1,20 +1,24 @@
-import openai
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
 from flask import current_app
 import json
+from services.analysis_cache import cached_analysis, chunk_hash, load_chunk_analyses, save_chunk_analyses
+from services.chunking_service import estimate_tokens, iter_chunks
+from services.llm_client import get_llm_client
+from services.metrics_service import track_llm
+from services.model_router import get_model_router, route_completion
+from services.response_cache import cached_completion
+
+# Bump whenever the analysis prompt changes so cached results are not reused
+ANALYSIS_PROMPT_VERSION = 2
 
 def get_openai_client():
-    """Get OpenAI client with API key from config"""
-    api_key = current_app.config['OPENAI_API_KEY']
-    if not api_key:
-        raise ValueError("OpenAI API key is not set")
-    
-    client = openai.OpenAI(api_key=api_key)
-    return client
+    """Get the shared, connection-pooled OpenAI client"""
+    return get_llm_client()
 
-def generate_chat_response(messages):
-    """Generate a response using OpenAI's chat completion API"""
-    client = get_openai_client()
-    
+def format_chat_messages(messages, context_chunks=None):
+    """Prepare client chat messages for the OpenAI API"""
     # Prepare messages for OpenAI API
     formatted_messages = []
     
@@ -41,6 +45,20 @@ def generate_chat_response(messages):
             Always maintain a helpful, professional tone."""
         })
     
+    # Add excerpts retrieved from the user's documents
+    if context_chunks:
+        excerpts = "\n\n".join(
+            f"[Document {chunk['document_id']}, part {chunk['position'] + 1}]\n{chunk['text']}"
+            for chunk in context_chunks
+        )
+        formatted_messages.append({
+            "role": "system",
+            "content": f"""The following excerpts from the user's own documents may be relevant to the conversation.
+            Use them when they help answer the question and cite the document they came from.
+            
+            {excerpts}"""
+        })
+    
     # Add user messages
     for message in messages:
         formatted_messages.append({
@@ -48,75 +66,294 @@ def generate_chat_response(messages):
             "content": message.get('content')
         })
     
-    # Call OpenAI API
-    response = client.chat.completions.create(
-        model="gpt-4-turbo",
+    return formatted_messages
+
+@track_llm('generate_chat_response')
+def generate_chat_response(messages, context_chunks=None):
+    """Generate a response using OpenAI's chat completion API"""
+    formatted_messages = format_chat_messages(messages, context_chunks)
+    route = route_completion('chat', formatted_messages)
+    params = {'model': route['model'], 'temperature': 0.7, 'max_tokens': route['max_tokens']}
+    
+    def complete():
+        # Call OpenAI API
+        response = get_openai_client().chat.completions.create(messages=formatted_messages, **params)
+        return response.choices[0].message.content
+    
+    return cached_completion(formatted_messages, params, complete)
+
+@track_llm('stream_chat_response')
+def stream_chat_response(messages, context_chunks=None):
+    """Generate a chat response, yielding text deltas as the model produces them"""
+    client = get_openai_client()
+    formatted_messages = format_chat_messages(messages, context_chunks)
+    route = route_completion('chat', formatted_messages)
+    
+    return _stream_completion(
+        client,
+        model=route['model'],
         messages=formatted_messages,
         temperature=0.7,
-        max_tokens=1000
+        max_tokens=route['max_tokens']
     )
-    
-    return response.choices[0].message.content
 
-def analyze_document(content):
-    """Analyze document content and extract key information"""
+@track_llm('summarize_conversation')
+def summarize_conversation(previous_summary, messages):
+    """Fold older conversation turns into a rolling summary"""
     client = get_openai_client()
     
-    # Truncate content if too long
-    max_length = 8000
-    if len(content) > max_length:
-        content = content[:max_length] + "..."
+    transcript = "\n\n".join(f"{message['role']}: {message['content']}" for message in messages)
+    prior = f"Summary of the conversation so far:\n{previous_summary}\n\n" if previous_summary else ""
+    
+    messages = [
+        {
+            "role": "system",
+            "content": "You maintain a running summary of a conversation between a user and DocuMind, a document assistant."
+        },
+        {
+            "role": "user",
+            "content": f"""{prior}Update the summary with the following turns. Keep facts, decisions, document
+                details and open questions the assistant will need later; drop pleasantries. Be concise.
+                
+                {transcript}"""
+        }
+    ]
+    route = route_completion('summarize', messages)
     
     # Call OpenAI API
     response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": "You are an expert document analyzer. Extract key information, summarize content, and identify main themes."
-            },
-            {
-                "role": "user",
-                "content": f"""Analyze the following document and provide:
-                1. A brief summary (3-5 sentences)
+        model=route['model'],
+        messages=messages,
+        temperature=0.3,
+        max_tokens=route['max_tokens']
+    )
+    
+    return response.choices[0].message.content
+
+def _stream_completion(client, **kwargs):
+    """Open a streamed chat completion and return an iterator over its text deltas.
+    
+    The upstream request is made here, not when iteration starts, so busy and
+    unavailable errors reach the caller before any response is sent.
+    """
+    stream = client.chat.completions.create(stream=True, **kwargs)
+    return _iter_deltas(stream)
+
+def _iter_deltas(stream):
+    """Yield the text deltas of a streamed completion"""
+    try:
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        # Closing the stream releases the connection if the consumer stops early
+        if hasattr(stream, 'close'):
+            stream.close()
+
+@track_llm('analyze_document')
+def analyze_document(content, document_id=None):
+    """Analyze document content and extract key information.
+    
+    Given the document_id, sections unchanged since the document's last
+    analysis keep their analysis and only the changed ones go to the model.
+    """
+    # Analyses are cached per model, so content the router sends to another tier is analyzed again
+    model = get_model_router().route('analyze', [{'content': content}], record=False)['model']
+    return cached_analysis(content, ANALYSIS_PROMPT_VERSION, model,
+                           lambda content: _analyze_content(content, document_id=document_id))
+
+ANALYZER_SYSTEM_PROMPT = "You are an expert document analyzer. Extract key information, summarize content, and identify main themes."
+
+ANALYSIS_INSTRUCTIONS = """1. A brief summary (3-5 sentences)
                 2. Key points (bullet points)
                 3. Main themes or topics
-                4. Any action items or next steps mentioned
+                4. Any action items or next steps mentioned"""
+
+def _analyze_content(content, client=None, chunk_tokens=None, max_workers=None, document_id=None):
+    """Call the model to analyze content, bypassing the cache.
+    
+    Content that fits in one chunk is analyzed with a single call. Longer
+    content is split into stable chunks, the chunks are analyzed in parallel
+    and the partial analyses are merged in a reduce step. Chunks of the
+    document's previous analysis are reused by hash, so after an edit only
+    the changed chunks are analyzed before the reduce runs again.
+    """
+    client = client or get_openai_client()
+    chunk_tokens = chunk_tokens or current_app.config['ANALYSIS_CHUNK_TOKENS']
+    max_workers = max_workers or current_app.config['ANALYSIS_MAX_CONCURRENCY']
+    
+    if estimate_tokens(content) <= chunk_tokens:
+        return _complete_analysis(client, f"""Analyze the following document and provide:
+                {ANALYSIS_INSTRUCTIONS}
                 
                 Document content:
-                {content}"""
-            }
-        ],
+                {content}""", task='analyze')
+    
+    previous = load_chunk_analyses(document_id, ANALYSIS_PROMPT_VERSION) if document_id else {}
+    
+    # Map: analyze each changed chunk, chunks are produced lazily as workers free up
+    sections = _run_bounded(
+        lambda index, chunk: _analyze_chunk(client, index, chunk, previous),
+        iter_chunks(content, chunk_tokens, stable=True),
+        max_workers
+    )
+    if document_id:
+        save_chunk_analyses(document_id, sections, ANALYSIS_PROMPT_VERSION)
+    partials = [section['analysis'] for section in sections]
+    
+    # Reduce: merge the partial analyses, in document order
+    return _reduce_partials(client, partials, chunk_tokens, max_workers)
+
+def _analysis_messages(prompt):
+    return [
+        {
+            "role": "system",
+            "content": ANALYZER_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": prompt
+        }
+    ]
+
+def _complete_analysis(client, prompt, task):
+    """Send one analysis prompt to the model the router picks for its task and size"""
+    messages = _analysis_messages(prompt)
+    route = route_completion(task, messages)
+    
+    response = client.chat.completions.create(
+        model=route['model'],
+        messages=messages,
         temperature=0.5,
-        max_tokens=1000
+        max_tokens=route['max_tokens']
     )
     
     return response.choices[0].message.content
 
-def generate_document_content(document_type, title, description):
-    """Generate document content based on type, title, and description"""
-    client = get_openai_client()
+def _analyze_chunk(client, index, chunk, previous=None):
+    """Analyze one section of a long document, reusing its previous analysis if the section is unchanged"""
+    prompt = f"""The following is section {index + 1} of a longer document.
+                Concisely list its key points, themes and any action items or next steps.
+                
+                Section content:
+                {chunk}"""
+    digest = chunk_hash(chunk)
+    model = get_model_router().route('analyze_section', _analysis_messages(prompt), record=False)['model']
     
-    # Call OpenAI API
-    response = client.chat.completions.create(
-        model="gpt-4-turbo",
-        messages=[
-            {
-                "role": "system",
-                "content": "You are an expert document creator. Generate professional, well-structured documents based on user requirements."
-            },
-            {
-                "role": "user",
-                "content": f"""Create a {document_type} document with the title "{title}" based on the following description:
+    known = (previous or {}).get(digest)
+    reused = known is not None and known['model'] == model
+    analysis = known['analysis'] if reused else _complete_analysis(client, prompt, task='analyze_section')
+    
+    return {
+        'chunk_hash': digest,
+        'token_count': estimate_tokens(chunk),
+        'analysis': analysis,
+        'model': model,
+        'reused': reused
+    }
+
+def _combine_partials(client, partials):
+    """Merge analyses of consecutive sections into one partial analysis"""
+    return _complete_analysis(client, f"""The following are analyses of consecutive sections of a longer document.
+                Merge them into one concise analysis of key points, themes and action items, keeping document order.
+                
+                {_join_partials(partials)}""", task='analyze_section')
+
+def _join_partials(partials):
+    return "\n\n".join(f"Section {i + 1}:\n{partial}" for i, partial in enumerate(partials))
+
+def _reduce_partials(client, partials, chunk_tokens, max_workers):
+    """Merge partial analyses into the final analysis, in several rounds if they do not fit in one prompt"""
+    while len(partials) > 1 and estimate_tokens(_join_partials(partials)) > chunk_tokens:
+        groups = []
+        group = []
+        group_tokens = 0
+        for partial in partials:
+            tokens = estimate_tokens(partial)
+            # Always pair at least two partials so every round shrinks the list
+            if len(group) >= 2 and group_tokens + tokens > chunk_tokens:
+                groups.append(group)
+                group = []
+                group_tokens = 0
+            group.append(partial)
+            group_tokens += tokens
+        groups.append(group)
+        
+        partials = _run_bounded(
+            lambda index, group: group[0] if len(group) == 1 else _combine_partials(client, group),
+            groups,
+            max_workers
+        )
+    
+    return _complete_analysis(client, f"""The following are analyses of consecutive sections of one document.
+                Combine them into a single analysis of the whole document and provide:
+                {ANALYSIS_INSTRUCTIONS}
+                
+                {_join_partials(partials)}""", task='analyze')
+
+def _run_bounded(func, items, max_workers):
+    """Apply func(index, item) on a thread pool and return results in input order.
+    
+    At most 2 * max_workers items are in flight, so a lazy iterable of items is
+    never materialized all at once.
+    """
+    results = []
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index, item in enumerate(items):
+            if len(pending) >= max_workers * 2:
+                results.append(pending.popleft().result())
+            # Each task runs in a copy of the caller's context so its LLM calls keep their metrics label
+            pending.append(executor.submit(contextvars.copy_context().run, func, index, item))
+        
+        while pending:
+            results.append(pending.popleft().result())
+    
+    return results
+
+def document_generation_messages(document_type, title, description):
+    """Build the prompt for generating a document"""
+    return [
+        {
+            "role": "system",
+            "content": "You are an expert document creator. Generate professional, well-structured documents based on user requirements."
+        },
+        {
+            "role": "user",
+            "content": f"""Create a {document_type} document with the title "{title}" based on the following description:
                 
                 {description}
                 
                 Generate a complete, professional document with appropriate sections, formatting, and content.
                 Format the response in Markdown."""
-            }
-        ],
+        }
+    ]
+
+@track_llm('generate_document_content')
+def generate_document_content(document_type, title, description):
+    """Generate document content based on type, title, and description"""
+    messages = document_generation_messages(document_type, title, description)
+    route = route_completion('generate', messages)
+    params = {'model': route['model'], 'temperature': 0.7, 'max_tokens': route['max_tokens']}
+    
+    def complete():
+        # Call OpenAI API
+        response = get_openai_client().chat.completions.create(messages=messages, **params)
+        return response.choices[0].message.content
+    
+    return cached_completion(messages, params, complete)
+
+@track_llm('stream_document_content')
+def stream_document_content(document_type, title, description):
+    """Generate document content, yielding text deltas as the model produces them"""
+    client = get_openai_client()
+    messages = document_generation_messages(document_type, title, description)
+    route = route_completion('generate', messages)
+    
+    return _stream_completion(
+        client,
+        model=route['model'],
+        messages=messages,
         temperature=0.7,
-        max_tokens=2000
+        max_tokens=route['max_tokens']
     )
-    
-    return response.choices[0].message.content
\ No newline at end of file
@@ -0,0 +1,251 @@
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from app import db
+from models.analysis_cache import AnalysisCacheEntry
+from models.document_chunk import DocumentChunk
+from services.database_service import upsert
+
+
+def normalize_content(content):
+    """Normalize content so trivially different copies share a cache key"""
+    content = unicodedata.normalize('NFC', content or '')
+    content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return '\n'.join(line.rstrip() for line in content.split('\n')).strip()
+
+
+def make_cache_key(content, prompt_version, model):
+    """Hash normalized content together with the prompt version and model"""
+    digest = hashlib.sha256()
+    for part in (str(prompt_version), model, normalize_content(content)):
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+class MemoryLRU:
+    """Thread-safe LRU mapping bounded by the total size of its values in bytes"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key, value):
+        size = len(value.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= len(self._entries.pop(key).encode('utf-8'))
+            self._entries[key] = value
+            self.current_bytes += size
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted.encode('utf-8'))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class AnalysisCache:
+    """Two-tier analysis cache: an in-process LRU in front of a database table.
+
+    Table reads and writes run in a savepoint of the caller's transaction,
+    so cache bookkeeping never commits the caller's pending work and a
+    failed cache write only costs a future miss. Rows are stored when the
+    caller commits.
+    """
+
+    def __init__(self, memory_bytes, db_bytes, metrics=None):
+        self.memory = MemoryLRU(memory_bytes)
+        self.db_bytes = db_bytes
+        self.metrics = metrics
+        # Upper bound of the table's size: summed once, then grown by every store until it crosses db_bytes
+        self._db_total = None
+        self._total_lock = threading.Lock()
+
+    def _count(self, event, amount=1):
+        if self.metrics is not None:
+            self.metrics.analysis_cache_events.inc(amount, event=event)
+
+    def get(self, key):
+        analysis = self.memory.get(key)
+        if analysis is not None:
+            self._count('memory_hit')
+            return analysis
+
+        table = AnalysisCacheEntry.__table__
+        try:
+            with db.session.begin_nested():
+                connection = db.session.connection()
+                analysis = connection.execute(select(table.c.analysis).where(table.c.key == key)).scalar()
+                if analysis is not None:
+                    connection.execute(update(table).where(table.c.key == key).values(
+                        hits=func.coalesce(table.c.hits, 0) + 1,
+                        last_accessed_at=datetime.utcnow()
+                    ))
+        except SQLAlchemyError as e:
+            current_app.logger.warning(f"Analysis cache lookup failed: {str(e)}")
+            analysis = None
+
+        if analysis is None:
+            self._count('miss')
+            return None
+
+        self.memory.set(key, analysis)
+        self._count('db_hit')
+        return analysis
+
+    def set(self, key, analysis, model):
+        self.memory.set(key, analysis)
+
+        size = len(analysis.encode('utf-8'))
+        now = datetime.utcnow()
+        try:
+            with db.session.begin_nested():
+                # Concurrent misses on the same content both store it; the last write wins
+                upsert(db.session.connection(), AnalysisCacheEntry.__table__, {
+                    'key': key, 'analysis': analysis, 'model': model, 'size': size,
+                    'hits': 0, 'created_at': now, 'last_accessed_at': now
+                }, ('analysis', 'model', 'size', 'last_accessed_at'))
+        except SQLAlchemyError as e:
+            current_app.logger.warning(f"Analysis cache store failed: {str(e)}")
+            return
+
+        self._count('store')
+        with self._total_lock:
+            if self._db_total is None:
+                self._db_total = self._table_bytes()
+            else:
+                self._db_total += size
+            over_budget = self._db_total > self.db_bytes
+        if over_budget:
+            self._evict()
+
+    def _table_bytes(self):
+        return db.session.execute(select(func.coalesce(func.sum(AnalysisCacheEntry.size), 0))).scalar()
+
+    def _evict(self):
+        """Drop least recently used rows until the table fits its size budget"""
+        table = AnalysisCacheEntry.__table__
+        try:
+            with db.session.begin_nested():
+                connection = db.session.connection()
+                total = connection.execute(select(func.coalesce(func.sum(table.c.size), 0))).scalar()
+                evicted = []
+                if total > self.db_bytes:
+                    oldest_first = connection.execution_options(yield_per=100).execute(
+                        select(table.c.key, table.c.size).order_by(table.c.last_accessed_at.asc())
+                    )
+                    for key, size in oldest_first:
+                        if total <= self.db_bytes:
+                            break
+                        evicted.append(key)
+                        total -= size
+                    oldest_first.close()
+                if evicted:
+                    connection.execute(delete(table).where(table.c.key.in_(evicted)))
+        except SQLAlchemyError as e:
+            current_app.logger.warning(f"Analysis cache eviction failed: {str(e)}")
+            return
+
+        with self._total_lock:
+            self._db_total = total
+        if evicted:
+            self._count('eviction', len(evicted))
+
+
+def get_analysis_cache():
+    """Get the analysis cache for the current app, creating it on first use"""
+    cache = current_app.extensions.get('analysis_cache')
+    if cache is None:
+        cache = AnalysisCache(
+            memory_bytes=current_app.config['ANALYSIS_CACHE_MEMORY_BYTES'],
+            db_bytes=current_app.config['ANALYSIS_CACHE_DB_BYTES'],
+            metrics=current_app.extensions.get('metrics')
+        )
+        current_app.extensions['analysis_cache'] = cache
+    return cache
+
+
+def cached_analysis(content, prompt_version, model, analyze):
+    """Return a cached analysis for content, calling analyze(content) on a miss"""
+    if not current_app.config['ANALYSIS_CACHE_ENABLED']:
+        return analyze(content)
+
+    cache = get_analysis_cache()
+    key = make_cache_key(content, prompt_version, model)
+
+    analysis = cache.get(key)
+    if analysis is None:
+        analysis = analyze(content)
+        cache.set(key, analysis, model)
+    return analysis
+
+
+def chunk_hash(chunk):
+    """Hash of a chunk's normalized text, the same whatever document or position it is in"""
+    return hashlib.sha256(normalize_content(chunk).encode('utf-8')).hexdigest()
+
+
+def load_chunk_analyses(document_id, prompt_version):
+    """Section analyses from a document's last analysis, by chunk hash"""
+    rows = DocumentChunk.query.filter_by(document_id=document_id, prompt_version=prompt_version).all()
+    return {row.chunk_hash: {'analysis': row.analysis, 'model': row.model} for row in rows}
+
+
+def save_chunk_analyses(document_id, sections, prompt_version):
+    """Replace a document's stored sections with those of its latest analysis.
+
+    The rows are written in a savepoint of the caller's session and saved
+    when the caller commits the analysis itself.
+    """
+    table = DocumentChunk.__table__
+    try:
+        with db.session.begin_nested():
+            connection = db.session.connection()
+            connection.execute(delete(table).where(table.c.document_id == document_id))
+            if sections:
+                connection.execute(table.insert(), [
+                    {
+                        'document_id': document_id,
+                        'position': position,
+                        'chunk_hash': section['chunk_hash'],
+                        'token_count': section['token_count'],
+                        'analysis': section['analysis'],
+                        'model': section['model'],
+                        'prompt_version': prompt_version
+                    }
+                    for position, section in enumerate(sections)
+                ])
+    except IntegrityError:
+        # Another analysis of the same document saved its sections first
+        pass
+
+    reused = sum(1 for section in sections if section['reused'])
+    registry = current_app.extensions.get('metrics')
+    if registry is not None:
+        registry.analysis_chunks.inc(reused, result='reused')
+        registry.analysis_chunks.inc(len(sections) - reused, result='analyzed')
+    current_app.logger.info(f"Analyzed document {document_id}: {len(sections) - reused} of {len(sections)} sections changed")
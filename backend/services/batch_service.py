@@ -0,0 +1,129 @@
+import json
+from collections import Counter
+from datetime import datetime
+from flask import current_app
+from sqlalchemy import bindparam, delete, update
+from app import db
+from models.document import Document
+from models.document_chunk import DocumentChunk
+from models.document_revision import DocumentRevision
+from models.document_signature import DocumentSignature, document_lsh_buckets
+from models.document_text import DocumentText
+from models.job import Job
+from models.stored_file import StoredFile
+from models.tag import document_tags
+from services.search_service import get_search_backend
+from services.tag_service import sync_tags
+
+# Bulk statements skip the ORM, so the mapper events that keep the search index,
+# tag tables and vector index in sync do not fire; each operation updates them itself.
+
+
+def _results(ids, found, status):
+    """Per-item results in request order, 404 for ids the user does not own"""
+    return [
+        {'id': document_id, 'status': status} if document_id in found
+        else {'id': document_id, 'status': 404, 'error': 'Document not found'}
+        for document_id in ids
+    ]
+
+
+def _decode_tags(tags):
+    try:
+        return json.loads(tags) if tags else []
+    except (TypeError, ValueError):
+        return []
+
+
+def bulk_update_documents(user_id, ids, status=None, tags=None, add_tags=None, remove_tags=None):
+    """Set the status and/or tags of many documents in the current transaction.
+
+    tags replaces the tag list; add_tags and remove_tags edit it. Returns
+    per-document results; the caller commits.
+    """
+    found = dict(db.session.query(Document.id, Document.tags).filter(
+        Document.user_id == user_id, Document.id.in_(ids)
+    ).all())
+    if not found:
+        return _results(ids, found, 200)
+
+    values = {'updated_at': datetime.utcnow()}
+    if status is not None:
+        values['status'] = status
+
+    connection = db.session.connection()
+    table = Document.__table__
+
+    if tags is None and not add_tags and not remove_tags:
+        connection.execute(update(table).where(table.c.id.in_(list(found))).values(**values))
+        return _results(ids, found, 200)
+
+    removed = set(Document.normalize_tags(remove_tags))
+    tags_by_document = {}
+    for document_id, current in found.items():
+        names = Document.normalize_tags((_decode_tags(current) if tags is None else tags) + list(add_tags or []))
+        tags_by_document[document_id] = [name for name in names if name not in removed]
+
+    # Tag lists differ per document, so this is one executemany rather than one UPDATE
+    connection.execute(
+        update(table).where(table.c.id == bindparam('document_id')).values(tags=bindparam('tags_json'), **values),
+        [{'document_id': document_id, 'tags_json': json.dumps(names)} for document_id, names in tags_by_document.items()]
+    )
+    sync_tags(connection, user_id, tags_by_document)
+    get_search_backend().update_tags(connection, {
+        document_id: json.dumps(names) for document_id, names in tags_by_document.items()
+    })
+
+    return _results(ids, found, 200)
+
+
+def bulk_delete_documents(user_id, ids):
+    """Delete many documents in the current transaction.
+
+    Returns (per-document results, file paths to delete after commit).
+    """
+    rows = db.session.query(Document.id, Document.content_hash, Document.file_path).filter(
+        Document.user_id == user_id, Document.id.in_(ids)
+    ).all()
+    found = {row.id for row in rows}
+    if not found:
+        return _results(ids, found, 200), []
+
+    connection = db.session.connection()
+    document_ids = list(found)
+
+    connection.execute(delete(DocumentText.__table__).where(DocumentText.document_id.in_(document_ids)))
+    connection.execute(delete(DocumentChunk.__table__).where(DocumentChunk.document_id.in_(document_ids)))
+    connection.execute(delete(DocumentRevision.__table__).where(DocumentRevision.document_id.in_(document_ids)))
+    connection.execute(delete(document_lsh_buckets).where(document_lsh_buckets.c.document_id.in_(document_ids)))
+    connection.execute(delete(DocumentSignature.__table__).where(DocumentSignature.document_id.in_(document_ids)))
+    connection.execute(delete(document_tags).where(document_tags.c.document_id.in_(document_ids)))
+    connection.execute(update(Job.__table__).where(Job.document_id.in_(document_ids)).values(document_id=None))
+    get_search_backend().remove_many(connection, document_ids)
+    connection.execute(delete(Document.__table__).where(Document.id.in_(document_ids)))
+
+    # Files uploaded before content addressing belong to one document only
+    orphaned_paths = [row.file_path for row in rows if row.file_path and not row.content_hash]
+
+    # One reference is dropped per deleted document and rows left without any go too;
+    # their objects are left to storage-gc, as in release_document_file
+    references = Counter(row.content_hash for row in rows if row.content_hash)
+    if references:
+        stored_file = StoredFile.__table__
+        connection.execute(
+            update(stored_file).where(stored_file.c.sha256 == bindparam('sha')).values(
+                ref_count=stored_file.c.ref_count - bindparam('released')
+            ),
+            [{'sha': sha256, 'released': count} for sha256, count in references.items()]
+        )
+        connection.execute(delete(stored_file).where(
+            stored_file.c.sha256.in_(list(references)), stored_file.c.ref_count <= 0
+        ))
+
+    if current_app.config['RAG_ENABLED']:
+        from services.vector_index import queue_index_changes
+        queue_index_changes(db.session, [
+            {'user_id': user_id, 'document_id': document_id} for document_id in document_ids
+        ])
+
+    return _results(ids, found, 200), orphaned_paths
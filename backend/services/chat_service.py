@@ -0,0 +1,98 @@
+from datetime import datetime
+from flask import current_app
+from app import db
+from models.chat_session import ChatSession, ChatMessage
+from services.ai_service import summarize_conversation
+from services.chunking_service import estimate_tokens
+
+def create_session(user_id, title=None):
+    """Create an empty chat session"""
+    session = ChatSession(user_id=user_id, title=title)
+    
+    db.session.add(session)
+    db.session.commit()
+    
+    return session
+
+def add_message(session, role, content, commit=True):
+    """Append a message to a session, naming the session after its first user message"""
+    message = ChatMessage(
+        session_id=session.id,
+        role=role,
+        content=content,
+        token_count=estimate_tokens(content)
+    )
+    
+    if not session.title and role == 'user':
+        session.title = content[:60]
+    
+    # Adding a message leaves the session row unchanged, so onupdate would not move it up the list
+    session.updated_at = datetime.utcnow()
+    
+    db.session.add(message)
+    if commit:
+        db.session.commit()
+    
+    return message
+
+def add_exchange(session, content, reply):
+    """Store a user message together with the reply to it, so a failed reply leaves no dangling turn"""
+    add_message(session, 'user', content, commit=False)
+    message = add_message(session, 'assistant', reply, commit=False)
+    db.session.commit()
+    
+    return message
+
+def get_history(session):
+    """Build the messages to send to the model: the rolling summary plus uncompacted turns"""
+    history = []
+    
+    if session.summary:
+        history.append({
+            'role': 'system',
+            'content': f"Summary of the earlier part of this conversation:\n{session.summary}"
+        })
+    
+    for message in session.messages.filter_by(compacted=False):
+        history.append({'role': message.role, 'content': message.content})
+    
+    return history
+
+def compact_session(session):
+    """Fold the oldest turns into the rolling summary once the history exceeds its token budget.
+    
+    Compaction goes down to a fraction of the budget rather than just under
+    it, so it runs once every few turns instead of on every turn.
+    """
+    budget = current_app.config['CHAT_HISTORY_TOKEN_BUDGET']
+    keep_recent = current_app.config['CHAT_KEEP_RECENT_MESSAGES']
+    target = int(budget * current_app.config['CHAT_COMPACTION_TARGET'])
+    
+    active = session.messages.filter_by(compacted=False).all()
+    total = (session.summary_tokens or 0) + sum(message.token_count for message in active)
+    if total <= budget:
+        return False
+    
+    foldable = active[:-keep_recent] if keep_recent else active
+    to_fold = []
+    for message in foldable:
+        if total <= target:
+            break
+        to_fold.append(message)
+        total -= message.token_count
+    
+    if not to_fold:
+        return False
+    
+    summary = summarize_conversation(
+        session.summary,
+        [{'role': message.role, 'content': message.content} for message in to_fold]
+    )
+    
+    session.summary = summary
+    session.summary_tokens = estimate_tokens(summary)
+    for message in to_fold:
+        message.compacted = True
+    db.session.commit()
+    
+    return True
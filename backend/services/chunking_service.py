@@ -0,0 +1,103 @@
+import hashlib
+import math
+import re
+
+# Rough characters-per-token ratio for English prose
+CHARS_PER_TOKEN = 4
+
+BLOCK_SEPARATOR = re.compile(r'\n[ \t]*\n')
+HEADING_PATTERN = re.compile(r'^(#{1,6}\s+\S|[A-Z0-9][A-Z0-9 \t.:\-]{2,79}$)')
+SENTENCE_END = re.compile(r'(?<=[.!?])\s+')
+
+
+def estimate_tokens(text):
+    """Estimate the number of model tokens in text"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def is_heading(block):
+    """Check whether a block starts with a Markdown or all-caps heading line"""
+    first_line = block.lstrip().split('\n', 1)[0].strip()
+    return bool(first_line) and bool(HEADING_PATTERN.match(first_line))
+
+
+def iter_blocks(content):
+    """Yield paragraph blocks lazily without splitting the whole document up front"""
+    start = 0
+    for match in BLOCK_SEPARATOR.finditer(content):
+        block = content[start:match.start()].strip()
+        if block:
+            yield block
+        start = match.end()
+
+    block = content[start:].strip()
+    if block:
+        yield block
+
+
+def split_oversized_block(block, max_tokens):
+    """Split a block larger than the budget on sentences, then on raw length"""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    piece = ''
+
+    for sentence in SENTENCE_END.split(block):
+        while len(sentence) > max_chars:
+            if piece:
+                yield piece
+                piece = ''
+            yield sentence[:max_chars]
+            sentence = sentence[max_chars:]
+
+        if piece and len(piece) + 1 + len(sentence) > max_chars:
+            yield piece
+            piece = sentence
+        else:
+            piece = f'{piece} {sentence}' if piece else sentence
+
+    if piece:
+        yield piece
+
+
+def _cut_after(piece, target_chars):
+    """Content-defined boundary: about one cut per target_chars characters, decided by the piece alone"""
+    value = int.from_bytes(hashlib.blake2b(piece.encode('utf-8'), digest_size=8).digest(), 'little')
+    return value % target_chars < len(piece)
+
+
+def iter_chunks(content, max_tokens, stable=False):
+    """Group blocks into chunks within max_tokens, preferring to break at headings.
+
+    A heading starts a new chunk once the current one is at least a quarter
+    full, so sections stay together without producing tiny chunks.
+
+    With stable=True a chunk also ends after any block whose hash picks it
+    as a boundary, so most chunks end well before the limit and boundaries
+    depend on nearby content only. An edit moves the boundaries around it,
+    while the chunks before and after keep the same text, and so the same
+    hash, as before the edit.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    target_chars = max(1, max_chars // 2)
+    parts = []
+    size = 0
+
+    for block in iter_blocks(content):
+        pieces = [block] if len(block) <= max_chars else split_oversized_block(block, max_tokens)
+
+        for piece in pieces:
+            starts_section = is_heading(piece) and size >= max_chars // 4
+            if parts and (starts_section or size + 2 + len(piece) > max_chars):
+                yield '\n\n'.join(parts)
+                parts = []
+                size = 0
+
+            parts.append(piece)
+            size += len(piece) + (2 if size else 0)
+
+            if stable and size >= max_chars // 4 and _cut_after(piece, target_chars):
+                yield '\n\n'.join(parts)
+                parts = []
+                size = 0
+
+    if parts:
+        yield '\n\n'.join(parts)
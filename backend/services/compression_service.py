@@ -0,0 +1,85 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+COPY_CHUNK_SIZE = 64 * 1024
+
+# Content-Encoding -> suffix appended to the storage key of the variant
+ENCODING_SUFFIXES = {
+    'zstd': '.zst',
+    'gzip': '.gz'
+}
+
+
+def _compress_gzip(source, target):
+    # mtime=0 keeps the output identical for identical input
+    with gzip.GzipFile(fileobj=target, mode='wb', compresslevel=9, mtime=0) as compressed:
+        shutil.copyfileobj(source, compressed, COPY_CHUNK_SIZE)
+
+
+def _compress_zstd(source, target):
+    import zstandard
+    zstandard.ZstdCompressor(level=19).copy_stream(source, target, read_size=COPY_CHUNK_SIZE)
+
+
+COMPRESSORS = {
+    'zstd': _compress_zstd,
+    'gzip': _compress_gzip
+}
+
+
+def available_encodings(requested):
+    """The requested encodings that can be produced here; zstd needs the zstandard package"""
+    encodings = []
+    for encoding in requested:
+        if encoding not in COMPRESSORS:
+            continue
+        if encoding == 'zstd':
+            try:
+                import zstandard  # noqa: F401
+            except ImportError:
+                continue
+        encodings.append(encoding)
+    return encodings
+
+
+def variant_key(key, encoding):
+    """Storage key of a precompressed variant of an object"""
+    return key + ENCODING_SUFFIXES[encoding]
+
+
+def base_key(key):
+    """Storage key of the object a variant belongs to, or the key itself"""
+    for suffix in ENCODING_SUFFIXES.values():
+        if key.endswith(suffix):
+            return key[:-len(suffix)]
+    return key
+
+
+def compress_file(source_path, encodings, min_ratio):
+    """Write compressed copies of a file next to it.
+
+    Returns {encoding: (temp_path, size)} for every encoding whose output is
+    at most min_ratio of the original size; the others are discarded.
+    """
+    original_size = os.path.getsize(source_path)
+    variants = {}
+
+    for encoding in encodings:
+        with open(source_path, 'rb') as source, tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(source_path), delete=False
+        ) as target:
+            try:
+                COMPRESSORS[encoding](source, target)
+            except BaseException:
+                os.remove(target.name)
+                raise
+
+        size = os.path.getsize(target.name)
+        if size <= original_size * min_ratio:
+            variants[encoding] = (target.name, size)
+        else:
+            os.remove(target.name)
+
+    return variants
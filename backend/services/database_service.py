@@ -0,0 +1,57 @@
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+
+def engine_options(config):
+    """SQLAlchemy engine options for the configured database"""
+    options = {'pool_pre_ping': config['DB_POOL_PRE_PING']}
+
+    # SQLite serializes writers itself; pool sizing is for server databases such as Postgres
+    if make_url(config['SQLALCHEMY_DATABASE_URI']).get_backend_name() != 'sqlite':
+        options.update({
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE']
+        })
+
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def init_sqlite_pragmas(engine, config):
+    """Set journal mode, sync level and lock timeout on every new SQLite connection"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            # WAL lets readers run while a writer commits; NORMAL only syncs at checkpoints
+            cursor.execute(f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}")
+            cursor.execute(f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}")
+            cursor.execute(f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}")
+        finally:
+            cursor.close()
+
+    event.listen(engine, 'connect', set_pragmas)
+
+
+def upsert(connection, table, values, update_columns):
+    """Insert a row, or update update_columns of the row with the same primary key"""
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table).values(**values)
+        statement = statement.on_conflict_do_update(
+            index_elements=[column.name for column in table.primary_key.columns],
+            set_={column: statement.excluded[column] for column in update_columns}
+        )
+    else:
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table).values(**values)
+        statement = statement.on_duplicate_key_update({column: statement.inserted[column] for column in update_columns})
+    connection.execute(statement)
@@ -1,7 +1,17 @@
+import hashlib
 import os
+import tempfile
 from flask import current_app
-from werkzeug.utils import secure_filename
-import uuid
+from sqlalchemy.exc import IntegrityError
+from app import db
+from models.document import Document
+from models.document_text import DocumentText
+from models.stored_file import StoredFile
+from services.compression_service import available_encodings, compress_file, variant_key
+from services.extraction_service import build_document_text, ExtractionError
+from services.storage_service import (
+    get_storage, shard_key, file_exists, delete_file, local_copy, StorageError
+)
 
 def get_upload_folder():
     """Get the upload folder path, creating it if it doesn't exist"""
@@ -12,32 +22,163 @@ def get_upload_folder():
     
     return upload_folder
 
-def get_user_folder(user_id):
-    """Get the user's folder path, creating it if it doesn't exist"""
-    user_folder = os.path.join(get_upload_folder(), str(user_id))
+def stream_to_temp_file(stream):
+    """Copy an upload stream to a temp file in chunks, hashing it in the same pass"""
+    temp_folder = os.path.join(get_upload_folder(), 'tmp')
+    os.makedirs(temp_folder, exist_ok=True)
     
-    if not os.path.exists(user_folder):
-        os.makedirs(user_folder)
+    digest = hashlib.sha256()
+    size = 0
+    chunk_size = current_app.config['UPLOAD_CHUNK_SIZE']
     
-    return user_folder
+    with tempfile.NamedTemporaryFile(dir=temp_folder, delete=False) as temp_file:
+        try:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                temp_file.write(chunk)
+                size += len(chunk)
+        except BaseException:
+            os.remove(temp_file.name)
+            raise
+    
+    return temp_file.name, digest.hexdigest(), size
 
-def save_document_file(file, user_id):
-    """Save a document file to the user's folder"""
-    user_folder = get_user_folder(user_id)
+def store_compressed_variants(temp_path, key, file_type, size):
+    """Store precompressed copies of a text-like upload for downloads, returning {encoding: size}"""
+    config = current_app.config
+    if file_type not in config['PRECOMPRESS_FILE_TYPES'] or size < config['PRECOMPRESS_MIN_SIZE']:
+        return {}
+    
+    encodings = available_encodings(config['PRECOMPRESS_ENCODINGS'])
+    variants = compress_file(temp_path, encodings, config['PRECOMPRESS_MIN_RATIO'])
+    
+    storage = get_storage()
+    for encoding, (variant_path, _) in variants.items():
+        storage.put_file(variant_path, variant_key(key, encoding))
+    
+    return {encoding: variant_size for encoding, (_, variant_size) in variants.items()}
+
+def save_document_file(file):
+    """Store an uploaded file by content hash, reusing the existing copy of identical files"""
+    temp_path, sha256, size = stream_to_temp_file(file.stream)
+    
+    # Another reference to a file we already have costs no extra disk
+    if acquire_stored_file(sha256):
+        os.remove(temp_path)
+        return db.session.get(StoredFile, sha256)
+    
+    key = shard_key(sha256)
+    file_type = os.path.splitext(file.filename or '')[1][1:].lower()
+    try:
+        variants = store_compressed_variants(temp_path, key, file_type, size)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    get_storage().put_file(temp_path, key)
+    
+    stored_file = StoredFile(sha256=sha256, path=key, size=size, ref_count=1)
+    stored_file.set_variants(variants)
+    try:
+        with db.session.begin_nested():
+            db.session.add(stored_file)
+    except IntegrityError:
+        # A concurrent upload of the same bytes created the row first
+        acquire_stored_file(sha256)
+        stored_file = db.session.get(StoredFile, sha256)
+    
+    return stored_file
+
+def acquire_stored_file(sha256):
+    """Add a reference to a stored file, returning False if it is not stored yet"""
+    updated = StoredFile.query.filter_by(sha256=sha256).update(
+        {'ref_count': StoredFile.ref_count + 1}, synchronize_session=False
+    )
+    return updated > 0
+
+def release_document_file(document):
+    """Drop a document's reference to its file.
+    
+    Returns the path to delete once the transaction commits for files that
+    belong to this document alone, or None otherwise. Content addressed files
+    are never removed here: once their row is gone a concurrent upload of the
+    same bytes may store the object again, so storage-gc removes it after its
+    grace period instead.
+    """
+    if not document.file_path:
+        return None
     
-    # Generate unique filename
-    filename = secure_filename(file.filename)
-    unique_filename = f"{uuid.uuid4()}_{filename}"
-    file_path = os.path.join(user_folder, unique_filename)
+    # Files uploaded before content addressing belong to one document only
+    if not document.content_hash:
+        return document.file_path
     
-    # Save file
-    file.save(file_path)
+    StoredFile.query.filter_by(sha256=document.content_hash).update(
+        {'ref_count': StoredFile.ref_count - 1}, synchronize_session=False
+    )
+    StoredFile.query.filter(
+        StoredFile.sha256 == document.content_hash, StoredFile.ref_count <= 0
+    ).delete(synchronize_session=False)
     
-    return file_path
+    return None
+
+def remove_file(path):
+    """Delete a stored file if it still exists"""
+    delete_file(path)
 
 def get_document_path(document):
     """Get the full path to a document file"""
     if not document.file_path:
         return None
     
-    return document.file_path
\ No newline at end of file
+    return document.file_path
+
+def extract_document_text(document):
+    """Extract the text of a document's file once and attach it to the document"""
+    # Identical files share their extracted text
+    if document.content_hash:
+        existing = DocumentText.query.join(Document).filter(
+            Document.content_hash == document.content_hash,
+            Document.file_type == document.file_type
+        ).first()
+        if existing:
+            document.extracted = existing.copy()
+            return document.extracted
+    
+    try:
+        with local_copy(document.file_path) as path:
+            document.extracted = build_document_text(path, document.file_type)
+    except (ExtractionError, StorageError) as e:
+        current_app.logger.warning(f"Could not extract text from document file: {str(e)}")
+        return None
+    
+    return document.extracted
+
+def get_document_text(document):
+    """Get the text to analyze for a document, preferring text extracted from its file"""
+    if document.extracted:
+        return document.extracted.text
+    
+    # Files uploaded before extraction existed are extracted on first use
+    if document.file_path and file_exists(document.file_path):
+        if extract_document_text(document):
+            db.session.commit()
+            return document.extracted.text
+    
+    return document.content or ''
+
+def has_document_text(document):
+    """Check whether a document has a file or content to analyze, without reading it"""
+    if document.extracted:
+        return document.extracted.char_count > 0
+    
+    if document.file_path and file_exists(document.file_path):
+        return True
+    
+    return bool(document.content)
+
+def get_index_text(document):
+    """Body text to index for search and retrieval: the content plus any extracted file text"""
+    extracted = document.extracted.text if document.extracted else None
+    return '\n\n'.join(part for part in (document.content, extracted) if part)
@@ -0,0 +1,289 @@
+import hashlib
+import re
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, inspect, select
+from app import db
+from models.document import Document
+from models.document_signature import DocumentSignature, document_lsh_buckets
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Odd multiplier combining the word hashes of a shingle
+SHINGLE_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+# Shingles hashed per permutation at once, bounding memory on long documents
+HASH_BLOCK = 4096
+
+signatures = DocumentSignature.__table__
+
+
+def _word_hash(word):
+    return int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def shingle_hashes(text, size):
+    """64-bit hashes of the distinct word n-grams of a text.
+
+    Each distinct word is hashed once and n-gram hashes are combined from
+    them with numpy, so long documents cost little Python per word.
+    """
+    words = TOKEN_PATTERN.findall((text or '').lower())
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    hashes = {word: _word_hash(word) for word in set(words)}
+    word_hashes = np.fromiter((hashes[word] for word in words), dtype=np.uint64, count=len(words))
+
+    count = max(1, len(words) - size + 1)
+    shingles = np.zeros(count, dtype=np.uint64)
+    for offset in range(min(size, len(words))):
+        shingles = shingles * SHINGLE_MULTIPLIER + word_hashes[offset:offset + count]
+    return np.unique(shingles)
+
+
+class MinHasher:
+    """MinHash signatures with LSH banding.
+
+    Two documents agree on each signature value with probability equal to
+    the Jaccard similarity of their shingle sets. Splitting the signature
+    into bands and bucketing each band makes documents above roughly
+    (1 / bands) ** (1 / rows per band) similarity share a bucket, so
+    candidates are found without comparing every pair.
+    """
+
+    def __init__(self, num_perm=128, bands=16, shingle_size=5, seed=1):
+        if num_perm % bands:
+            raise ValueError(f"DEDUP_NUM_PERM ({num_perm}) must be a multiple of DEDUP_BANDS ({bands})")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        # Multiply-shift hash functions: the top 32 bits of (a * x + b) mod 2^64, with odd a
+        rng = np.random.RandomState(seed)
+        self.a = rng.randint(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64) | np.uint64(1)
+        self.b = rng.randint(0, np.iinfo(np.uint64).max, num_perm, dtype=np.uint64)
+
+    def signature(self, text):
+        """Return (signature, shingle count), or (None, 0) for text without words"""
+        hashes = shingle_hashes(text, self.shingle_size)
+        if not len(hashes):
+            return None, 0
+
+        signature = np.full(self.num_perm, np.iinfo(np.uint64).max, dtype=np.uint64)
+        for start in range(0, len(hashes), HASH_BLOCK):
+            values = hashes[start:start + HASH_BLOCK, None] * self.a + self.b
+            np.minimum(signature, values.min(axis=0), out=signature)
+        return (signature >> np.uint64(32)).astype(np.uint32), len(hashes)
+
+    def buckets(self, signature):
+        """One bucket per band: a hash of the band's signature values"""
+        return [
+            hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).hexdigest()
+            for band in range(self.bands)
+        ]
+
+
+def similarity(a, b):
+    """Estimated Jaccard similarity of two signatures"""
+    return float(np.mean(a == b))
+
+
+def get_minhasher():
+    """Get the MinHasher configured for the current app"""
+    hasher = current_app.extensions.get('minhasher')
+    if hasher is None:
+        config = current_app.config
+        hasher = MinHasher(config['DEDUP_NUM_PERM'], config['DEDUP_BANDS'], config['DEDUP_SHINGLE_SIZE'])
+        current_app.extensions['minhasher'] = hasher
+    return hasher
+
+
+def get_signature_text(document):
+    """Text compared for duplicates: the text extracted from the file, else the content"""
+    if document.extracted:
+        return document.extracted.text
+    return document.content or ''
+
+
+def index_document(connection, document_id, user_id, text):
+    """Replace a document's signature and LSH buckets"""
+    remove_documents(connection, [document_id])
+
+    hasher = get_minhasher()
+    signature, shingle_count = hasher.signature(text)
+    if signature is None:
+        return
+
+    connection.execute(signatures.insert().values(
+        document_id=document_id, user_id=user_id, signature=signature.tobytes(), shingle_count=shingle_count
+    ))
+    connection.execute(document_lsh_buckets.insert(), [
+        {'user_id': user_id, 'band': band, 'bucket': bucket, 'document_id': document_id}
+        for band, bucket in enumerate(hasher.buckets(signature))
+    ])
+
+
+def remove_documents(connection, document_ids):
+    connection.execute(document_lsh_buckets.delete().where(document_lsh_buckets.c.document_id.in_(document_ids)))
+    connection.execute(signatures.delete().where(signatures.c.document_id.in_(document_ids)))
+
+
+def _load_signatures(connection, document_ids):
+    """Signatures by document id, skipping ones made with a different DEDUP_NUM_PERM"""
+    num_perm = get_minhasher().num_perm
+    loaded = {}
+    for document_id, data in connection.execute(
+        select(signatures.c.document_id, signatures.c.signature).where(signatures.c.document_id.in_(document_ids))
+    ):
+        signature = np.frombuffer(data, dtype=np.uint32)
+        if len(signature) == num_perm:
+            loaded[document_id] = signature
+    return loaded
+
+
+def find_near_duplicates(document, threshold=None, limit=5):
+    """Other documents of the same user whose text is near-identical, as (document, similarity), most similar first.
+
+    The document must have been flushed so its signature exists.
+    """
+    if not current_app.config['DEDUP_ENABLED']:
+        return []
+    threshold = threshold or current_app.config['DEDUP_THRESHOLD']
+    connection = db.session.connection()
+
+    own, other = document_lsh_buckets.alias('own'), document_lsh_buckets.alias('other')
+    candidates = [row[0] for row in connection.execute(
+        select(other.c.document_id).distinct()
+        .join(own, (own.c.user_id == other.c.user_id) & (own.c.band == other.c.band) & (own.c.bucket == other.c.bucket))
+        .where(own.c.document_id == document.id, other.c.document_id != document.id)
+    )]
+
+    loaded = _load_signatures(connection, candidates + [document.id])
+    own_signature = loaded.pop(document.id, None)
+    if own_signature is None:
+        return []
+    matches = []
+    if loaded:
+        # Score every candidate in one comparison against the stacked signatures
+        ids = list(loaded)
+        scores = (np.stack([loaded[document_id] for document_id in ids]) == own_signature).mean(axis=1)
+        matches = sorted(
+            ((document_id, float(score)) for document_id, score in zip(ids, scores) if score >= threshold),
+            key=lambda match: (-match[1], match[0])
+        )[:limit]
+
+    _record_lookup(bool(matches))
+    if not matches:
+        return []
+    documents = {d.id: d for d in Document.query.filter(
+        Document.user_id == document.user_id, Document.id.in_([document_id for document_id, _ in matches])
+    )}
+    return [(documents[document_id], score) for document_id, score in matches if document_id in documents]
+
+
+def reuse_duplicate_analysis(document, duplicates):
+    """Copy the analysis of a near-identical duplicate, returning its id or None"""
+    threshold = current_app.config['DEDUP_REUSE_ANALYSIS_THRESHOLD']
+    for duplicate, score in duplicates:
+        if score >= threshold and duplicate.analysis:
+            document.analysis = duplicate.analysis
+            return duplicate.id
+    return None
+
+
+def duplicate_clusters(user_id, threshold=None):
+    """Groups of a user's documents that are near-duplicates of each other, largest first.
+
+    Pairs sharing an LSH bucket are checked against their signatures and
+    linked if similar enough; clusters are the connected groups. Each
+    cluster lists (document id, similarity to its oldest document).
+    """
+    threshold = threshold or current_app.config['DEDUP_THRESHOLD']
+    connection = db.session.connection()
+
+    first, second = document_lsh_buckets.alias('first'), document_lsh_buckets.alias('second')
+    pairs = connection.execute(
+        select(first.c.document_id, second.c.document_id).distinct()
+        .join(second, (second.c.user_id == first.c.user_id) & (second.c.band == first.c.band)
+              & (second.c.bucket == first.c.bucket) & (second.c.document_id > first.c.document_id))
+        .where(first.c.user_id == user_id)
+    ).all()
+    loaded = _load_signatures(connection, list({document_id for pair in pairs for document_id in pair}))
+
+    parent = {}
+
+    def find(document_id):
+        parent.setdefault(document_id, document_id)
+        while parent[document_id] != document_id:
+            parent[document_id] = parent[parent[document_id]]
+            document_id = parent[document_id]
+        return document_id
+
+    for a, b in pairs:
+        if a in loaded and b in loaded and similarity(loaded[a], loaded[b]) >= threshold:
+            parent[find(b)] = find(a)
+
+    groups = {}
+    for document_id in parent:
+        groups.setdefault(find(document_id), []).append(document_id)
+
+    clusters = []
+    for members in groups.values():
+        members.sort()
+        clusters.append([(document_id, similarity(loaded[members[0]], loaded[document_id])) for document_id in members])
+    clusters.sort(key=lambda cluster: (-len(cluster), cluster[0][0]))
+    return clusters
+
+
+def index_documents(rebuild=False, batch_size=200):
+    """Compute signatures for documents that have none, or for every document when rebuilding.
+
+    Needed for documents stored before duplicate detection, and after
+    changing DEDUP_NUM_PERM, DEDUP_BANDS or DEDUP_SHINGLE_SIZE. Returns the
+    number of documents processed.
+    """
+    processed = 0
+    last_id = 0
+    while True:
+        query = Document.query.filter(Document.id > last_id)
+        if not rebuild:
+            query = query.outerjoin(DocumentSignature, DocumentSignature.document_id == Document.id).filter(
+                DocumentSignature.document_id.is_(None)
+            )
+        documents = query.order_by(Document.id).limit(batch_size).all()
+        if not documents:
+            return processed
+
+        connection = db.session.connection()
+        for document in documents:
+            index_document(connection, document.id, document.user_id, get_signature_text(document))
+        db.session.commit()
+        processed += len(documents)
+        last_id = documents[-1].id
+
+
+def _record_lookup(found):
+    registry = current_app.extensions.get('metrics')
+    if registry is not None:
+        registry.duplicate_lookups.inc(result='found' if found else 'none')
+
+
+def init_duplicate_index(app):
+    """Keep document signatures in sync with document content"""
+    if not event.contains(Document, 'after_insert', _after_insert):
+        event.listen(Document, 'after_insert', _after_insert)
+        event.listen(Document, 'after_update', _after_update)
+        event.listen(Document, 'before_delete', _before_delete)
+
+
+def _after_insert(mapper, connection, document):
+    index_document(connection, document.id, document.user_id, get_signature_text(document))
+
+
+def _after_update(mapper, connection, document):
+    if inspect(document).attrs.content.history.has_changes():
+        index_document(connection, document.id, document.user_id, get_signature_text(document))
+
+
+def _before_delete(mapper, connection, document):
+    remove_documents(connection, [document.id])
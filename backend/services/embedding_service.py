@@ -0,0 +1,134 @@
+import hashlib
+import re
+import time
+import numpy as np
+from flask import current_app
+from services.metrics_service import observe_llm_call
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+# Models whose vectors always have this many dimensions
+FIXED_DIMENSION_MODELS = {'text-embedding-ada-002': 1536}
+
+# Models that shorten their vectors to a requested size, up to this many dimensions
+SHORTENABLE_MODELS = {'text-embedding-3-small': 1536, 'text-embedding-3-large': 3072}
+
+
+class HashingEmbeddingProvider:
+    """Deterministic local stand-in for a real embedding model.
+
+    Words and word bigrams are hashed into a fixed number of signed buckets
+    and the result is L2-normalized, so texts sharing vocabulary score a
+    high cosine similarity. Needs no network and always gives the same
+    vector for the same text.
+    """
+
+    name = 'local'
+
+    def __init__(self, dimensions=256):
+        self.dimensions = dimensions
+
+    def _bucket(self, feature):
+        digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+        value = int.from_bytes(digest, 'little')
+        return value % self.dimensions, 1.0 if value >> 63 else -1.0
+
+    def embed(self, texts):
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            words = [word.lower() for word in TOKEN_PATTERN.findall(text)]
+            features = words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+            for feature in features:
+                bucket, sign = self._bucket(feature)
+                vectors[row, bucket] += sign
+        return normalize_rows(vectors)
+
+
+class OpenAIEmbeddingProvider:
+    """Embeddings from the OpenAI API through the shared LLM client"""
+
+    name = 'openai'
+
+    def __init__(self, model, dimensions, batch_size=100):
+        self.model = model
+        self.dimensions = dimensions
+        self.batch_size = batch_size
+
+    def embed(self, texts):
+        from services.llm_client import get_llm_client
+        manager = get_llm_client()
+
+        vectors = []
+        for start in range(0, len(texts), self.batch_size):
+            batch = texts[start:start + self.batch_size]
+            response = manager.resilience.call(lambda timeout: self._embed_batch(manager, batch, timeout))
+            vectors.extend(item.embedding for item in sorted(response.data, key=lambda item: item.index))
+
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(texts), -1)
+        if vectors.shape[1] != self.dimensions:
+            raise ValueError(
+                f"Embedding model '{self.model}' returned {vectors.shape[1]} dimensions, "
+                f"but EMBEDDING_DIMENSIONS is {self.dimensions}"
+            )
+        return normalize_rows(vectors)
+
+    def _embed_batch(self, manager, batch, timeout):
+        manager.acquire()
+        start = time.perf_counter()
+        outcome = 'error'
+        try:
+            # Ask models that can shorten their vectors for the configured size
+            extra_body = {'dimensions': self.dimensions} if self.model in SHORTENABLE_MODELS else None
+            response = manager.client.embeddings.create(
+                model=self.model, input=batch, timeout=timeout, extra_body=extra_body
+            )
+            outcome = 'ok'
+            return response
+        finally:
+            manager.release()
+            usage = getattr(response, 'usage', None) if outcome == 'ok' else None
+            observe_llm_call(manager.metrics, 'embed', self.model, time.perf_counter() - start, outcome=outcome,
+                             prompt_tokens=getattr(usage, 'prompt_tokens', None))
+
+
+# Provider name -> factory(config)
+EMBEDDING_PROVIDERS = {
+    'local': lambda config: HashingEmbeddingProvider(config['EMBEDDING_DIMENSIONS']),
+    'openai': lambda config: OpenAIEmbeddingProvider(config['EMBEDDING_MODEL'], config['EMBEDDING_DIMENSIONS'])
+}
+
+
+def normalize_rows(vectors):
+    """Scale each row to unit length so a dot product is the cosine similarity"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def validate_embedding_config(config):
+    """Fail at startup when EMBEDDING_DIMENSIONS cannot match what EMBEDDING_MODEL returns"""
+    if config['EMBEDDING_PROVIDER'] != 'openai':
+        return
+    model, dimensions = config['EMBEDDING_MODEL'], config['EMBEDDING_DIMENSIONS']
+    if model in FIXED_DIMENSION_MODELS and FIXED_DIMENSION_MODELS[model] != dimensions:
+        raise ValueError(
+            f"Embedding model '{model}' returns {FIXED_DIMENSION_MODELS[model]} dimensions; "
+            f"set EMBEDDING_DIMENSIONS to match, not {dimensions}"
+        )
+    if model in SHORTENABLE_MODELS and not 0 < dimensions <= SHORTENABLE_MODELS[model]:
+        raise ValueError(
+            f"Embedding model '{model}' supports at most {SHORTENABLE_MODELS[model]} dimensions, "
+            f"not EMBEDDING_DIMENSIONS={dimensions}"
+        )
+
+
+def get_embedding_provider():
+    """Get the embedding provider configured for the current app"""
+    provider = current_app.extensions.get('embedding_provider')
+    if provider is None:
+        name = current_app.config['EMBEDDING_PROVIDER']
+        if name not in EMBEDDING_PROVIDERS:
+            raise ValueError(f"Unknown embedding provider '{name}'")
+        provider = EMBEDDING_PROVIDERS[name](current_app.config)
+        current_app.extensions['embedding_provider'] = provider
+    return provider
@@ -0,0 +1,251 @@
+import codecs
+import re
+import unicodedata
+import zipfile
+from html.parser import HTMLParser
+from xml.etree import ElementTree
+from models.document_text import DocumentText
+
+READ_CHUNK_SIZE = 64 * 1024
+
+CONTROL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f\x7f]')
+EXCESS_BLANK_LINES = re.compile(r'\n{3,}')
+MARKDOWN_HEADING = re.compile(r'^(#{1,6})\s+(.+)$', re.MULTILINE)
+
+WORD_NAMESPACE = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+
+
+class ExtractionError(Exception):
+    """Raised when text cannot be extracted from a file"""
+
+
+def normalize_text(text):
+    """Normalize Unicode, line endings and whitespace of extracted text"""
+    text = unicodedata.normalize('NFC', text)
+    text = text.replace('\r\n', '\n').replace('\r', '\n')
+    text = CONTROL_CHARACTERS.sub('', text)
+    text = '\n'.join(line.rstrip() for line in text.split('\n'))
+    return EXCESS_BLANK_LINES.sub('\n\n', text)
+
+
+class TextBuilder:
+    """Accumulates normalized text and records where each page or section starts"""
+
+    def __init__(self):
+        self.parts = []
+        self.length = 0
+        self.sections = []
+
+    def start_section(self, kind, label):
+        self._close_section()
+        # The start offset is filled in by the next append, after its separator
+        self.sections.append({'type': kind, 'label': label, 'start': None, 'end': None})
+
+    def append(self, text):
+        if not text:
+            return
+        separator = ''
+        if self.parts and not self.parts[-1].endswith('\n\n'):
+            separator = '\n' if self.parts[-1].endswith('\n') else '\n\n'
+        if self.sections and self.sections[-1]['start'] is None:
+            self.sections[-1]['start'] = self.length + len(separator)
+        self.parts.append(separator + text)
+        self.length += len(separator) + len(text)
+
+    def extend(self, text):
+        """Continue the last appended text without a separator, for text read in pieces"""
+        self.parts.append(text)
+        self.length += len(text)
+
+    def _close_section(self):
+        if self.sections and self.sections[-1]['end'] is None:
+            if self.sections[-1]['start'] is None:
+                self.sections[-1]['start'] = self.length
+            self.sections[-1]['end'] = self.length
+
+    def build(self):
+        self._close_section()
+        return ''.join(self.parts), self.sections
+
+
+def iter_decoded(file_path):
+    """Stream a text file as decoded chunks, as UTF-8 when valid and Latin-1 otherwise"""
+    with open(file_path, 'rb') as f:
+        head = f.read(READ_CHUNK_SIZE)
+        encoding = 'utf-8-sig'
+        try:
+            head.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # A multi-byte character cut at the end of a full chunk is still UTF-8
+            if len(head) < READ_CHUNK_SIZE or e.start < len(head) - 3:
+                encoding = 'latin-1'
+
+        decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+        chunk = head
+        while chunk:
+            yield decoder.decode(chunk)
+            chunk = f.read(READ_CHUNK_SIZE)
+        yield decoder.decode(b'', final=True)
+
+
+def iter_normalized(file_path):
+    """Stream a text file as normalized pieces that join into the normalized whole file.
+
+    Pieces end on complete lines so CRLF pairs are never split across
+    chunks. Newlines at the end of a piece move into the next one, so blank
+    line runs collapse across chunk boundaries too.
+    """
+    pending = ''
+    for chunk in iter_decoded(file_path):
+        pending += chunk
+        cut = pending.rfind('\n')
+        if cut >= 0:
+            text = normalize_text(pending[:cut + 1])
+            piece = text.rstrip('\n')
+            pending = text[len(piece):] + pending[cut + 1:]
+            yield piece
+    yield normalize_text(pending).rstrip('\n')
+
+
+def extract_plain_text(file_path, builder):
+    started = False
+    for piece in iter_normalized(file_path):
+        if started:
+            builder.extend(piece)
+        else:
+            piece = piece.lstrip('\n')
+            started = bool(piece)
+            builder.append(piece)
+
+
+def extract_markdown(file_path, builder):
+    text = normalize_text(''.join(iter_decoded(file_path)))
+
+    position = 0
+    for match in MARKDOWN_HEADING.finditer(text):
+        builder.append(text[position:match.start()].strip('\n'))
+        builder.start_section('section', match.group(2).strip())
+        position = match.start()
+    builder.append(text[position:].strip('\n'))
+
+
+class _HTMLTextParser(HTMLParser):
+    BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'section', 'article'}
+    SKIP_TAGS = {'script', 'style', 'head'}
+
+    def __init__(self, builder):
+        super().__init__()
+        self.builder = builder
+        self.buffer = []
+        self.skipping = 0
+        self.heading = None
+
+    def flush(self):
+        text = normalize_text(' '.join(''.join(self.buffer).split()))
+        self.buffer = []
+        if self.heading is not None and text:
+            self.builder.start_section('section', text)
+        self.builder.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP_TAGS:
+            self.skipping += 1
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+            if re.fullmatch(r'h[1-6]', tag):
+                self.heading = tag
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP_TAGS:
+            self.skipping = max(self.skipping - 1, 0)
+        elif tag in self.BLOCK_TAGS:
+            self.flush()
+            self.heading = None
+
+    def handle_data(self, data):
+        if not self.skipping:
+            self.buffer.append(data)
+
+
+def extract_html(file_path, builder):
+    parser = _HTMLTextParser(builder)
+    for chunk in iter_decoded(file_path):
+        parser.feed(chunk)
+    parser.close()
+    parser.flush()
+
+
+def extract_pdf(file_path, builder):
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise ExtractionError('PDF extraction requires the pypdf package')
+
+    try:
+        reader = PdfReader(file_path)
+        for number, page in enumerate(reader.pages, start=1):
+            builder.start_section('page', str(number))
+            builder.append(normalize_text(page.extract_text() or '').strip('\n'))
+    except Exception as e:
+        raise ExtractionError(f'Could not read PDF: {str(e)}')
+
+
+def extract_docx(file_path, builder):
+    try:
+        with zipfile.ZipFile(file_path) as archive, archive.open('word/document.xml') as xml:
+            # iterparse keeps memory flat by discarding each paragraph once read
+            for _, element in ElementTree.iterparse(xml):
+                if element.tag != f'{WORD_NAMESPACE}p':
+                    continue
+
+                text = normalize_text(''.join(node.text or '' for node in element.iter(f'{WORD_NAMESPACE}t')))
+                style = element.find(f'{WORD_NAMESPACE}pPr/{WORD_NAMESPACE}pStyle')
+                style_name = style.get(f'{WORD_NAMESPACE}val', '') if style is not None else ''
+
+                if text and style_name.lower().startswith(('heading', 'title')):
+                    builder.start_section('section', text)
+                builder.append(text)
+                element.clear()
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        raise ExtractionError(f'Could not read DOCX: {str(e)}')
+
+
+# File type -> extractor(file_path, builder)
+EXTRACTORS = {
+    'txt': extract_plain_text,
+    'csv': extract_plain_text,
+    'json': extract_plain_text,
+    'log': extract_plain_text,
+    'md': extract_markdown,
+    'markdown': extract_markdown,
+    'html': extract_html,
+    'htm': extract_html,
+    'pdf': extract_pdf,
+    'docx': extract_docx
+}
+
+
+def extract_text(file_path, file_type):
+    """Extract normalized text and page/section offsets from a file"""
+    file_type = (file_type or '').lower()
+    extractor = EXTRACTORS.get(file_type)
+    if extractor is None:
+        raise ExtractionError(f"Unsupported file type '{file_type}'")
+
+    builder = TextBuilder()
+    extractor(file_path, builder)
+    text, sections = builder.build()
+    return text, sections
+
+
+def build_document_text(file_path, file_type):
+    """Extract a file into a DocumentText row, to be attached to its document"""
+    text, sections = extract_text(file_path, file_type)
+
+    document_text = DocumentText(
+        text=text,
+        extractor=(file_type or '').lower(),
+        char_count=len(text)
+    )
+    document_text.set_sections(sections)
+    return document_text
@@ -0,0 +1,227 @@
+import hashlib
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def estimate_usage(messages, completion):
+    """Rough token usage in the shape the OpenAI API reports it"""
+    prompt_chars = sum(len(message.get('content') or '') for message in messages)
+    prompt_tokens = max(1, prompt_chars // 4)
+    completion_tokens = max(1, len(completion) // 4)
+    return {
+        'prompt_tokens': prompt_tokens,
+        'completion_tokens': completion_tokens,
+        'total_tokens': prompt_tokens + completion_tokens
+    }
+
+
+def default_completion(messages):
+    """Deterministic reply derived from the last user message"""
+    last_user = next(
+        (message.get('content') or '' for message in reversed(messages) if message.get('role') == 'user'),
+        ''
+    )
+    return f"Fake response to: {last_user[:200]}"
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """Serves the subset of the OpenAI HTTP API that the app uses"""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+
+        if self.path.rstrip('/').endswith('/chat/completions'):
+            handle = self.chat_completion
+        elif self.path.rstrip('/').endswith('/embeddings'):
+            handle = self.embeddings
+        else:
+            self.send_json(404, {'error': {'message': f'Unknown path {self.path}'}})
+            return
+
+        self.server.count_request()
+        fault = self.server.next_fault()
+        if fault is not None and fault[0] == 'stall':
+            time.sleep(fault[1])
+        else:
+            time.sleep(self.server.latency)
+
+        if fault is not None and fault[0] == 'error':
+            status = fault[1]
+            self.send_json(status, {'error': {'message': f'Injected fault {status}', 'type': 'server_error'}},
+                           headers={'Retry-After': '1'} if status == 429 else None)
+            return
+        handle(body)
+
+    def chat_completion(self, body):
+        messages = body.get('messages', [])
+        completion = self.server.completion(messages)
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get('model', 'fake-model')
+
+        if not body.get('stream'):
+            self.send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': completion},
+                    'finish_reason': 'stop'
+                }],
+                'usage': estimate_usage(messages, completion)
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+
+        for i in range(0, len(completion), self.server.stream_chunk_size):
+            self.write_event({
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': created,
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'delta': {'content': completion[i:i + self.server.stream_chunk_size]},
+                    'finish_reason': None
+                }]
+            })
+            time.sleep(self.server.stream_delay)
+
+        self.write_event({
+            'id': completion_id,
+            'object': 'chat.completion.chunk',
+            'created': created,
+            'model': model,
+            'choices': [{'index': 0, 'delta': {}, 'finish_reason': 'stop'}]
+        })
+        self.wfile.write(b'data: [DONE]\n\n')
+        self.wfile.flush()
+        self.close_connection = True
+
+    def embeddings(self, body):
+        inputs = body.get('input', [])
+        if isinstance(inputs, str):
+            inputs = [inputs]
+
+        data = []
+        for index, text in enumerate(inputs):
+            # Seeded from the text so the same input always gets the same vector
+            seed = int.from_bytes(hashlib.sha256(text.encode('utf-8')).digest()[:8], 'little')
+            rng = random.Random(seed)
+            data.append({
+                'object': 'embedding',
+                'index': index,
+                'embedding': [rng.uniform(-1, 1) for _ in range(self.server.embedding_dimensions)]
+            })
+
+        tokens = sum(max(1, len(text) // 4) for text in inputs)
+        self.send_json(200, {
+            'object': 'list',
+            'data': data,
+            'model': body.get('model', 'fake-embedding-model'),
+            'usage': {'prompt_tokens': tokens, 'total_tokens': tokens}
+        })
+
+    def write_event(self, payload):
+        self.wfile.write(f"data: {json.dumps(payload)}\n\n".encode('utf-8'))
+        self.wfile.flush()
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    """In-process OpenAI-compatible server for running the app offline.
+
+    Replies are produced by `completion(messages)`, after `latency` seconds;
+    streamed replies are sent `stream_chunk_size` characters at a time.
+
+    For resilience testing, a fraction `error_rate` of requests is answered
+    with 429 or 500 and a fraction `stall_rate` stalls for `stall_seconds`;
+    `inject_faults` queues faults for the next requests instead.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, latency=0.0, completion=None,
+                 stream_chunk_size=8, stream_delay=0.0, embedding_dimensions=256,
+                 error_rate=0.0, stall_rate=0.0, stall_seconds=30.0, seed=None):
+        super().__init__((host, port), FakeLLMHandler)
+        self.latency = latency
+        self.completion = completion or default_completion
+        self.stream_chunk_size = stream_chunk_size
+        self.stream_delay = stream_delay
+        self.embedding_dimensions = embedding_dimensions
+        self.error_rate = error_rate
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self._random = random.Random(seed)
+        self._faults = []
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def count_request(self):
+        with self._count_lock:
+            self.request_count += 1
+
+    def handle_error(self, request, client_address):
+        # Clients that time out on a stalled request close their end before the reply is written
+        if not isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            super().handle_error(request, client_address)
+
+    def inject_faults(self, *faults):
+        """Queue faults for the next requests: ('error', status) or ('stall', seconds)"""
+        with self._count_lock:
+            self._faults.extend(faults)
+
+    def next_fault(self):
+        with self._count_lock:
+            if self._faults:
+                return self._faults.pop(0)
+            roll = self._random.random()
+        if roll < self.error_rate:
+            return ('error', self._random.choice((429, 500)))
+        if roll < self.error_rate + self.stall_rate:
+            return ('stall', self.stall_seconds)
+        return None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-llm-server', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
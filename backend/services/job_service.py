@@ -0,0 +1,291 @@
+import random
+import threading
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import func, select
+from app import db
+from models.job import Job
+
+# Job kind -> function(job) returning the job result
+JOB_HANDLERS = {}
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+def job_handler(kind):
+    """Register a function as the handler for a job kind"""
+    def decorator(func):
+        JOB_HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+class JobCancelled(Exception):
+    """Raised by a handler that notices its job was cancelled"""
+
+
+class JobQueue:
+    """Local worker pool that runs jobs persisted in the jobs table.
+
+    Workers claim jobs with a conditional UPDATE, so several processes can
+    share one database without running a job twice. A claimed job holds a
+    lease that its worker extends while the handler runs; jobs whose lease
+    ran out, because their process died, are requeued.
+    """
+
+    def __init__(self, app, workers, max_per_user, poll_interval, retry_delay, lease):
+        self.app = app
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self.poll_interval = poll_interval
+        self.retry_delay = retry_delay
+        self.lease = lease
+        self._next_requeue = 0
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        """Wake idle workers after a job was enqueued"""
+        self._wakeup.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                try:
+                    job_id = self._claim()
+                    if job_id is not None:
+                        self._execute(job_id)
+                        continue
+                    self._requeue_expired()
+                except Exception as e:
+                    self.app.logger.error(f"Job worker error: {str(e)}")
+                    db.session.rollback()
+
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _claim(self):
+        """Atomically move the oldest runnable job to running, honoring per-user caps"""
+        now = datetime.utcnow()
+        candidates = Job.query.filter(
+            Job.status == 'queued',
+            Job.run_after <= now
+        ).order_by(Job.created_at.asc(), Job.id.asc()).limit(50).all()
+
+        jobs = Job.__table__
+        skipped = set()
+        for job in candidates:
+            if job.user_id in skipped:
+                continue
+
+            # The cap is checked in the claiming UPDATE itself, so two workers cannot both take the last slot.
+            # The derived table lets MySQL read the table it updates.
+            running = select(func.count()).select_from(
+                select(jobs.c.id).where(jobs.c.user_id == job.user_id, jobs.c.status == 'running').subquery()
+            ).scalar_subquery()
+            claimed = Job.query.filter(
+                Job.id == job.id,
+                Job.status == 'queued',
+                running < self.max_per_user
+            ).update({
+                'status': 'running',
+                'started_at': now,
+                'lease_expires_at': now + timedelta(seconds=self.lease),
+                'attempts': Job.attempts + 1
+            }, synchronize_session=False)
+            db.session.commit()
+
+            if claimed:
+                return job.id
+            # Either the user is at the cap or another worker took the job; retry on the next poll
+            skipped.add(job.user_id)
+
+        db.session.rollback()
+        return None
+
+    def _requeue_expired(self):
+        """Requeue running jobs whose worker stopped renewing the lease, at most once per lease period"""
+        now = datetime.utcnow()
+        if now.timestamp() < self._next_requeue:
+            return
+        self._next_requeue = now.timestamp() + self.lease
+        requeue_expired_jobs(self.lease, now)
+
+    def _heartbeat(self, job_id, stopped):
+        """Extend the lease of a running job until stopped is set"""
+        while not stopped.wait(self.lease / 3):
+            try:
+                with self.app.app_context(), db.engine.begin() as connection:
+                    connection.execute(Job.__table__.update().where(
+                        Job.__table__.c.id == job_id, Job.__table__.c.status == 'running'
+                    ).values(lease_expires_at=datetime.utcnow() + timedelta(seconds=self.lease)))
+            except Exception as e:
+                self.app.logger.warning(f"Job {job_id} heartbeat failed: {str(e)}")
+
+    def _execute(self, job_id):
+        stopped = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, stopped), daemon=True).start()
+        try:
+            self._run_handler(job_id)
+        finally:
+            stopped.set()
+
+    def _run_handler(self, job_id):
+        job = db.session.get(Job, job_id)
+        handler = JOB_HANDLERS.get(job.kind)
+
+        try:
+            if handler is None:
+                raise ValueError(f"No handler registered for job kind '{job.kind}'")
+            result = handler(job)
+        except JobCancelled:
+            db.session.rollback()
+            return
+        except Exception as e:
+            db.session.rollback()
+            self.app.logger.error(f"Job {job_id} failed on attempt {job.attempts}: {str(e)}")
+            self._fail(job_id, str(e))
+            return
+
+        # Only record the outcome if the job was not cancelled meanwhile
+        Job.query.filter_by(id=job_id, status='running').update({
+            'status': 'succeeded',
+            'result': result,
+            'error': None,
+            'finished_at': datetime.utcnow()
+        }, synchronize_session=False)
+        db.session.commit()
+
+    def _fail(self, job_id, error):
+        """Requeue with exponential backoff and jitter, or give up after max_attempts"""
+        job = db.session.get(Job, job_id)
+        if job is None or job.status != 'running':
+            return
+
+        job.error = error
+        if job.attempts < job.max_attempts:
+            delay = self.retry_delay * (2 ** (job.attempts - 1))
+            job.status = 'queued'
+            job.run_after = datetime.utcnow() + timedelta(seconds=random.uniform(delay / 2, delay))
+        else:
+            job.status = 'failed'
+            job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+
+def requeue_expired_jobs(lease, now=None):
+    """Requeue running jobs whose lease ran out, leaving jobs of live workers in other processes alone"""
+    now = now or datetime.utcnow()
+    requeued = Job.query.filter(
+        Job.status == 'running',
+        (Job.lease_expires_at < now)
+        # Claimed before leases existed: fall back to how long ago the job started
+        | (Job.lease_expires_at.is_(None) & (Job.started_at < now - timedelta(seconds=lease)))
+    ).update({'status': 'queued', 'lease_expires_at': None}, synchronize_session=False)
+    db.session.commit()
+    return requeued
+
+
+def init_job_queue(app):
+    """Requeue jobs orphaned by a previous process and start the worker pool"""
+    requeue_expired_jobs(app.config['JOBS_LEASE'])
+
+    queue = JobQueue(
+        app,
+        workers=app.config['JOBS_WORKERS'],
+        max_per_user=app.config['JOBS_MAX_PER_USER'],
+        poll_interval=app.config['JOBS_POLL_INTERVAL'],
+        retry_delay=app.config['JOBS_RETRY_DELAY'],
+        lease=app.config['JOBS_LEASE']
+    )
+    app.extensions['job_queue'] = queue
+    queue.start()
+    return queue
+
+
+def enqueue_job(kind, user_id, document_id=None, payload=None, commit=True):
+    """Persist a new job and wake the worker pool"""
+    if kind not in JOB_HANDLERS:
+        raise ValueError(f"Unknown job kind '{kind}'")
+
+    job = Job(
+        kind=kind,
+        user_id=user_id,
+        document_id=document_id,
+        max_attempts=current_app.config['JOBS_MAX_ATTEMPTS']
+    )
+    job.set_payload(payload or {})
+
+    db.session.add(job)
+    if commit:
+        db.session.commit()
+        notify_workers()
+
+    return job
+
+
+def notify_workers():
+    """Wake the local workers after committing new jobs"""
+    # Without local workers the job waits for another process to claim it
+    queue = current_app.extensions.get('job_queue')
+    if queue is not None:
+        queue.notify()
+
+
+def cancel_job(job):
+    """Cancel a queued or running job; running handlers have their result discarded"""
+    if job.status not in ACTIVE_STATUSES:
+        return False
+
+    cancelled = Job.query.filter(Job.id == job.id, Job.status.in_(ACTIVE_STATUSES)).update({
+        'status': 'cancelled',
+        'finished_at': datetime.utcnow()
+    }, synchronize_session=False)
+    db.session.commit()
+    db.session.refresh(job)
+    return bool(cancelled)
+
+
+def is_cancelled(job_id):
+    """Check from inside a handler whether its job was cancelled"""
+    status = db.session.query(Job.status).filter_by(id=job_id).scalar()
+    return status == 'cancelled'
+
+
+@job_handler('analyze_document')
+def analyze_document_job(job):
+    """Run AI analysis for a document and store it on the document"""
+    from models.document import Document
+    from services.ai_service import analyze_document
+    from services.document_service import get_document_text
+
+    document = Document.query.filter_by(id=job.document_id, user_id=job.user_id).first()
+    if not document:
+        raise ValueError('Document not found')
+
+    content = get_document_text(document)
+    if not content:
+        raise ValueError('No content to analyze')
+
+    analysis = analyze_document(content, document_id=document.id)
+
+    if is_cancelled(job.id):
+        raise JobCancelled()
+
+    document.analysis = analysis
+    db.session.commit()
+    return analysis
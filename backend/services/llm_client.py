@@ -0,0 +1,216 @@
+import threading
+import time
+import httpx
+import openai
+from flask import current_app
+from services.metrics_service import current_llm_function, observe_llm_call
+from services.resilience import CircuitBreaker, LLMBusyError, LLMUnavailableError, ResiliencePolicy
+
+
+class BoundedCompletions:
+    """chat.completions proxy that holds a global slot for each in-flight request"""
+
+    def __init__(self, manager):
+        self._manager = manager
+
+    def create(self, **kwargs):
+        """Create a completion under the manager's resilience policy.
+
+        Non-streamed calls from the LLM functions the policy allows to hedge
+        may be sent twice when the first is slow.
+        """
+        resilience = self._manager.resilience
+        return resilience.call(
+            lambda timeout: self._attempt(timeout=timeout, **kwargs),
+            hedge=not kwargs.get('stream') and resilience.should_hedge(current_llm_function())
+        )
+
+    def _attempt(self, **kwargs):
+        self._manager.acquire()
+        function = current_llm_function()
+        model = kwargs.get('model', '')
+        start = time.perf_counter()
+        try:
+            response = self._manager.client.chat.completions.create(**kwargs)
+        except BaseException:
+            self._manager.release()
+            observe_llm_call(self._manager.metrics, function, model, time.perf_counter() - start, outcome='error')
+            raise
+
+        if not kwargs.get('stream'):
+            self._manager.release()
+            usage = getattr(response, 'usage', None)
+            observe_llm_call(
+                self._manager.metrics, function, model, time.perf_counter() - start,
+                prompt_tokens=getattr(usage, 'prompt_tokens', None),
+                completion_tokens=getattr(usage, 'completion_tokens', None)
+            )
+            return response
+
+        def on_close(outcome, first_token_seconds, completion_chars):
+            # Streams carry no usage, so tokens are estimated at about four characters each
+            prompt_chars = sum(len(message.get('content') or '') for message in kwargs.get('messages', []))
+            observe_llm_call(
+                self._manager.metrics, function, model, time.perf_counter() - start, outcome=outcome,
+                prompt_tokens=prompt_chars // 4, completion_tokens=completion_chars // 4,
+                first_token_seconds=first_token_seconds
+            )
+
+        # A stream occupies its slot until it is exhausted or closed
+        return BoundedStream(response, self._manager.release, on_close, start)
+
+
+class BoundedStream:
+    """Iterates a streamed completion and frees its slot exactly once when done"""
+
+    def __init__(self, stream, release, on_close=None, start=None):
+        self._stream = stream
+        self._release = release
+        self._on_close = on_close
+        self._start = start if start is not None else time.perf_counter()
+        self._first_token_seconds = None
+        self._chars = 0
+        self._outcome = 'cancelled'
+        self._closed = False
+
+    def __iter__(self):
+        try:
+            for chunk in self._stream:
+                if self._first_token_seconds is None:
+                    self._first_token_seconds = time.perf_counter() - self._start
+                for choice in getattr(chunk, 'choices', None) or []:
+                    self._chars += len(getattr(choice.delta, 'content', None) or '')
+                yield chunk
+            self._outcome = 'ok'
+        except Exception:
+            self._outcome = 'error'
+            raise
+        finally:
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+
+        # Drop the HTTP response so the connection is not left half-read
+        response = getattr(self._stream, 'response', None)
+        if response is not None:
+            response.close()
+        self._release()
+        if self._on_close is not None:
+            self._on_close(self._outcome, self._first_token_seconds, self._chars)
+
+    def __del__(self):
+        self.close()
+
+
+class BoundedChat:
+    def __init__(self, manager):
+        self.completions = BoundedCompletions(manager)
+
+
+class LLMClientManager:
+    """Process-wide OpenAI client with a shared keep-alive connection pool.
+
+    Every completion first takes a slot from a global semaphore, so at most
+    `max_in_flight` requests reach the upstream at once; callers wait up to
+    `acquire_timeout` seconds for a slot before LLMBusyError is raised.
+    """
+
+    def __init__(self, api_key, base_url=None, max_connections=20, max_keepalive_connections=10,
+                 timeout=60.0, connect_timeout=5.0, max_in_flight=16, acquire_timeout=10.0, resilience=None):
+        self.http_client = httpx.Client(
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_keepalive_connections
+            ),
+            timeout=httpx.Timeout(timeout, connect=connect_timeout)
+        )
+        # Retries are done by the resilience policy, which shares one deadline and circuit breaker
+        self.client = openai.OpenAI(api_key=api_key, base_url=base_url, http_client=self.http_client, max_retries=0)
+        self.resilience = resilience or ResiliencePolicy(timeout=timeout)
+        self.max_in_flight = max_in_flight
+        self.acquire_timeout = acquire_timeout
+        self.chat = BoundedChat(self)
+        self.metrics = None  # MetricsRegistry, when the app records metrics
+
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+
+    def acquire(self):
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise LLMBusyError(f"Too many concurrent LLM requests (limit {self.max_in_flight})")
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def close(self):
+        self.resilience.close()
+        self.http_client.close()
+
+
+_manager_lock = threading.Lock()
+
+
+def init_llm_client(app):
+    """Create the shared LLM client for an app, starting the fake server if configured"""
+    base_url = app.config['OPENAI_BASE_URL']
+    api_key = app.config['OPENAI_API_KEY']
+
+    if app.config['LLM_FAKE_SERVER']:
+        from services.fake_llm_server import FakeLLMServer
+        server = FakeLLMServer(
+            latency=app.config['LLM_FAKE_LATENCY'],
+            embedding_dimensions=app.config['EMBEDDING_DIMENSIONS'],
+            error_rate=app.config['LLM_FAKE_ERROR_RATE'],
+            stall_rate=app.config['LLM_FAKE_STALL_RATE'],
+            stall_seconds=app.config['LLM_FAKE_STALL_SECONDS']
+        ).start()
+        app.extensions['fake_llm_server'] = server
+        base_url = server.base_url
+        api_key = api_key or 'fake-key'
+
+    if not api_key:
+        raise ValueError("OpenAI API key is not set")
+
+    manager = LLMClientManager(
+        api_key=api_key,
+        base_url=base_url,
+        max_connections=app.config['LLM_MAX_CONNECTIONS'],
+        max_keepalive_connections=app.config['LLM_MAX_KEEPALIVE_CONNECTIONS'],
+        timeout=app.config['LLM_TIMEOUT'],
+        connect_timeout=app.config['LLM_CONNECT_TIMEOUT'],
+        max_in_flight=app.config['LLM_MAX_IN_FLIGHT'],
+        acquire_timeout=app.config['LLM_ACQUIRE_TIMEOUT'],
+        resilience=ResiliencePolicy(
+            timeout=app.config['LLM_TIMEOUT'],
+            deadline=app.config['LLM_DEADLINE'],
+            max_retries=app.config['LLM_MAX_RETRIES'],
+            base_delay=app.config['LLM_RETRY_BASE_DELAY'],
+            max_delay=app.config['LLM_RETRY_MAX_DELAY'],
+            breaker=CircuitBreaker(app.config['LLM_BREAKER_FAILURES'], app.config['LLM_BREAKER_RESET']),
+            hedge_delay=app.config['LLM_HEDGE_DELAY'],
+            hedge_workers=app.config['LLM_MAX_IN_FLIGHT'],
+            hedge_functions=app.config['LLM_HEDGE_FUNCTIONS']
+        )
+    )
+    manager.metrics = manager.resilience.metrics = app.extensions.get('metrics')
+    app.extensions['llm_client'] = manager
+    return manager
+
+
+def get_llm_client():
+    """Get the shared LLM client for the current app, creating it on first use"""
+    manager = current_app.extensions.get('llm_client')
+    if manager is None:
+        with _manager_lock:
+            manager = current_app.extensions.get('llm_client')
+            if manager is None:
+                manager = init_llm_client(current_app._get_current_object())
+    return manager
@@ -0,0 +1,346 @@
+import bisect
+import contextvars
+import functools
+import inspect
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+
+# Bucket upper bounds in seconds
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+LLM_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120)
+STORAGE_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 5)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+TOKEN_BUCKETS = (100, 250, 500, 1000, 2000, 4000, 8000)
+
+# Name of the ai_service function an LLM call is made for
+_llm_function = contextvars.ContextVar('llm_function', default='other')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per label combination"""
+
+    kind = 'counter'
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(label, '') for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for key, value in sorted(values.items()):
+            yield f'{self.name}{_format_labels(self.labels, key)} {_format_number(value)}'
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per label combination"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(label, '') for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def samples(self):
+        with self._lock:
+            values = {key: (list(counts), total) for key, (counts, total) in self._values.items()}
+        for key, (counts, total) in sorted(values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                labels = _format_labels(self.labels, key, [('le', _format_number(bound))])
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            yield f'{self.name}_sum{_format_labels(self.labels, key)} {_format_number(total)}'
+            yield f'{self.name}_count{_format_labels(self.labels, key)} {cumulative}'
+
+
+class MetricsRegistry:
+    """The metrics of one process, rendered in the Prometheus text format.
+
+    Each worker process keeps its own registry, so a scraper sees the process
+    that served the scrape request.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+        self.http_request_seconds = self.add(Histogram(
+            'documind_http_request_duration_seconds', 'Time spent handling HTTP requests',
+            ('method', 'endpoint', 'status')
+        ))
+        self.http_request_queries = self.add(Histogram(
+            'documind_http_request_db_queries', 'SQL statements executed per HTTP request',
+            ('endpoint',), QUERY_COUNT_BUCKETS
+        ))
+        self.http_component_seconds = self.add(Counter(
+            'documind_http_request_component_seconds_total', 'Request time spent in the database, storage and LLM',
+            ('endpoint', 'component')
+        ))
+        self.db_query_seconds = self.add(Histogram(
+            'documind_db_query_duration_seconds', 'Time spent executing SQL statements',
+            ('operation',), QUERY_BUCKETS
+        ))
+        self.llm_request_seconds = self.add(Histogram(
+            'documind_llm_request_duration_seconds', 'Time until an LLM completion finished, streamed or not',
+            ('function', 'model', 'outcome'), LLM_BUCKETS
+        ))
+        self.llm_first_token_seconds = self.add(Histogram(
+            'documind_llm_time_to_first_token_seconds', 'Time until a streamed LLM completion produced its first chunk',
+            ('function', 'model'), LLM_BUCKETS
+        ))
+        self.llm_tokens = self.add(Counter(
+            'documind_llm_tokens_total', 'LLM tokens used, as reported by the API or estimated for streams',
+            ('function', 'model', 'kind')
+        ))
+        self.llm_routes = self.add(Counter(
+            'documind_llm_routes_total', 'Model tier chosen for LLM calls per task',
+            ('task', 'tier', 'model')
+        ))
+        self.llm_route_max_tokens = self.add(Histogram(
+            'documind_llm_route_max_tokens', 'Output budget chosen for LLM calls per task',
+            ('task', 'tier'), TOKEN_BUCKETS
+        ))
+        self.llm_response_cache = self.add(Counter(
+            'documind_llm_response_cache_total', 'Response cache lookups by result: hit, miss or bypass',
+            ('function', 'result')
+        ))
+        self.llm_resilience_events = self.add(Counter(
+            'documind_llm_resilience_events_total',
+            'LLM retries, hedges, rejections by the open circuit and calls given up',
+            ('event',)
+        ))
+        self.analysis_cache_events = self.add(Counter(
+            'documind_analysis_cache_events_total',
+            'Analysis cache lookups and writes: memory_hit, db_hit, miss, store and eviction',
+            ('event',)
+        ))
+        self.analysis_chunks = self.add(Counter(
+            'documind_analysis_chunks_total', 'Document sections whose analysis was reused or redone',
+            ('result',)
+        ))
+        self.duplicate_lookups = self.add(Counter(
+            'documind_duplicate_lookups_total', 'Near-duplicate lookups at ingest by result: found or none',
+            ('result',)
+        ))
+        self.storage_seconds = self.add(Histogram(
+            'documind_storage_operation_duration_seconds', 'Time spent in file storage operations',
+            ('backend', 'operation'), STORAGE_BUCKETS
+        ))
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+def get_metrics(app=None):
+    """Get the metrics registry of an app, by default the current one"""
+    app = app or current_app._get_current_object()
+    registry = app.extensions.get('metrics')
+    if registry is None:
+        registry = MetricsRegistry()
+        app.extensions['metrics'] = registry
+    return registry
+
+
+def record_request_time(component, seconds):
+    """Add time spent in a component to the breakdown of the current request, if any"""
+    if has_request_context():
+        breakdown = g.get('metrics_breakdown')
+        if breakdown is not None:
+            count, total = breakdown.get(component, (0, 0.0))
+            breakdown[component] = (count + 1, total + seconds)
+
+
+def current_llm_function():
+    return _llm_function.get()
+
+
+def track_llm(name):
+    """Label the LLM calls made by a function, including ones made while its generator is consumed"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            token = _llm_function.set(name)
+            try:
+                result = func(*args, **kwargs)
+                if inspect.isgenerator(result):
+                    # Streams call the model lazily, so they keep the label in a context of their own
+                    return _run_generator_in(contextvars.copy_context(), result)
+                return result
+            finally:
+                _llm_function.reset(token)
+        return wrapper
+    return decorator
+
+
+def _run_generator_in(context, generator):
+    try:
+        while True:
+            try:
+                yield context.run(next, generator)
+            except StopIteration:
+                return
+    finally:
+        context.run(generator.close)
+
+
+def observe_llm_call(registry, function, model, seconds, outcome='ok', prompt_tokens=None,
+                     completion_tokens=None, first_token_seconds=None):
+    """Record one completion in the LLM metrics and the current request breakdown"""
+    if registry is None:
+        return
+    registry.llm_request_seconds.observe(seconds, function=function, model=model, outcome=outcome)
+    if first_token_seconds is not None:
+        registry.llm_first_token_seconds.observe(first_token_seconds, function=function, model=model)
+    if prompt_tokens:
+        registry.llm_tokens.inc(prompt_tokens, function=function, model=model, kind='prompt')
+    if completion_tokens:
+        registry.llm_tokens.inc(completion_tokens, function=function, model=model, kind='completion')
+    record_request_time('llm', seconds)
+
+
+class TimedStorage:
+    """Storage backend proxy that times each storage operation"""
+
+    TIMED_OPERATIONS = {'put_file', 'open', 'exists', 'size', 'delete', 'delete_many'}
+
+    def __init__(self, storage, registry):
+        self._storage = storage
+        self._registry = registry
+        self.name = storage.name
+
+    def __getattr__(self, name):
+        attribute = getattr(self._storage, name)
+        if name not in self.TIMED_OPERATIONS:
+            return attribute
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return attribute(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                self._registry.storage_seconds.observe(elapsed, backend=self.name, operation=name)
+                record_request_time('storage', elapsed)
+        return timed
+
+
+def _endpoint():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+    g.metrics_breakdown = {}
+
+
+def _after_request(response):
+    start = g.pop('metrics_start', None)
+    breakdown = g.pop('metrics_breakdown', None)
+    if start is None or request.endpoint == 'metrics.export_metrics':
+        return response
+
+    elapsed = time.perf_counter() - start
+    registry = get_metrics()
+    endpoint = _endpoint()
+
+    registry.http_request_seconds.observe(elapsed, method=request.method, endpoint=endpoint,
+                                          status=str(response.status_code))
+    registry.http_request_queries.observe(breakdown.get('db', (0, 0.0))[0], endpoint=endpoint)
+    for component, (_, seconds) in breakdown.items():
+        registry.http_component_seconds.inc(seconds, endpoint=endpoint, component=component)
+
+    threshold = current_app.config['SLOW_REQUEST_THRESHOLD']
+    if threshold and elapsed >= threshold:
+        parts = ', '.join(
+            f'{component} {seconds * 1000:.1f}ms in {count} call{"s" if count != 1 else ""}'
+            for component, (count, seconds) in sorted(breakdown.items())
+        )
+        other = elapsed - sum(seconds for _, seconds in breakdown.values())
+        current_app.logger.warning(
+            f"Slow request {request.method} {request.path} -> {response.status_code} took {elapsed * 1000:.1f}ms"
+            f" ({parts + ', ' if parts else ''}other {other * 1000:.1f}ms)"
+        )
+
+    return response
+
+
+def init_metrics(app, engine):
+    """Record request, SQL, storage and LLM metrics for an app"""
+    registry = get_metrics(app)
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        starts = conn.info.get('metrics_query_start')
+        if not starts:
+            return
+        elapsed = time.perf_counter() - starts.pop()
+        operation = statement.lstrip().split(None, 1)[0].lower() if statement.strip() else 'other'
+        if operation not in ('select', 'insert', 'update', 'delete'):
+            operation = 'other'
+        registry.db_query_seconds.observe(elapsed, operation=operation)
+        record_request_time('db', elapsed)
+
+    def handle_error(exception_context):
+        # Failed statements never reach after_cursor_execute
+        connection = exception_context.connection
+        if connection is not None and connection.info.get('metrics_query_start'):
+            connection.info['metrics_query_start'].pop()
+
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    event.listen(engine, 'handle_error', handle_error)
+
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    return registry
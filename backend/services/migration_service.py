@@ -0,0 +1,98 @@
+from datetime import datetime
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from app import db
+
+# Ordered (version, description, apply(connection)) entries; never edit or reorder released ones
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a schema migration.
+
+    New installs get the current schema from create_all, so every migration
+    must check what already exists and only add what is missing.
+    """
+    def decorator(apply):
+        MIGRATIONS.append((version, description, apply))
+        return apply
+    return decorator
+
+
+def _add_column(connection, table, column, ddl):
+    columns = {info['name'] for info in inspect(connection).get_columns(table)}
+    if column not in columns:
+        connection.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}'))
+
+
+def _create_indexes(connection, table, names):
+    indexes = {index.name: index for index in db.metadata.tables[table].indexes}
+    for name in names:
+        indexes[name].create(connection, checkfirst=True)
+
+
+@migration(1, 'Add columns introduced after their tables were created')
+def add_late_columns(connection):
+    _add_column(connection, 'document', 'content_hash', 'VARCHAR(64) REFERENCES stored_file (sha256)')
+    _add_column(connection, 'stored_file', 'variants', 'TEXT')
+
+
+@migration(2, 'Add composite indexes matching the per-user list, job and chat queries')
+def add_query_indexes(connection):
+    _create_indexes(connection, 'document', [
+        'ix_document_user_id_updated_at', 'ix_document_user_id_status_updated_at', 'ix_document_content_hash'
+    ])
+    _create_indexes(connection, 'job', ['ix_job_status_run_after', 'ix_job_user_id_status', 'ix_job_user_id_created_at'])
+    _create_indexes(connection, 'chat_session', ['ix_chat_session_user_id_updated_at'])
+    _create_indexes(connection, 'chat_message', ['ix_chat_message_session_id_compacted'])
+    _create_indexes(connection, 'stored_file', ['ix_stored_file_path'])
+
+
+@migration(3, 'Add the lease that workers extend while running a job')
+def add_job_lease(connection):
+    _add_column(connection, 'job', 'lease_expires_at', 'TIMESTAMP')
+
+
+def _ensure_version_table(connection):
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_migration ("
+        "version INTEGER PRIMARY KEY, description VARCHAR(255) NOT NULL, applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def applied_versions(engine):
+    """Versions already recorded in the schema_migration table"""
+    with engine.begin() as connection:
+        _ensure_version_table(connection)
+        return {version for (version,) in connection.execute(text("SELECT version FROM schema_migration"))}
+
+
+def run_migrations(engine):
+    """Apply pending migrations in order, each in its own transaction, and return their versions"""
+    done = applied_versions(engine)
+    applied = []
+
+    for version, description, apply in sorted(MIGRATIONS, key=lambda entry: entry[0]):
+        if version in done:
+            continue
+        try:
+            with engine.begin() as connection:
+                apply(connection)
+                connection.execute(
+                    text("INSERT INTO schema_migration (version, description, applied_at) "
+                         "VALUES (:version, :description, :applied_at)"),
+                    {'version': version, 'description': description, 'applied_at': datetime.utcnow()}
+                )
+        except IntegrityError:
+            # Another process starting at the same time recorded it first
+            continue
+        applied.append(version)
+
+    return applied
+
+
+def pending_migrations(engine):
+    """(version, description) of migrations not applied yet"""
+    done = applied_versions(engine)
+    return [(version, description) for version, description, _ in sorted(MIGRATIONS, key=lambda entry: entry[0])
+            if version not in done]
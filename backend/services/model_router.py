@@ -0,0 +1,83 @@
+import json
+import math
+from flask import current_app
+from services.chunking_service import estimate_tokens
+
+TIERS = ('small', 'large')
+
+# Task -> routing rule. Inputs of at most small_max_input tokens go to the small
+# tier (0 keeps the task on the large tier). The output budget is output_ratio
+# times the input tokens, clamped to [min_output, max_output]. A rule may also
+# pin a 'tier' or a 'model'.
+DEFAULT_ROUTES = {
+    'chat': {'small_max_input': 1500, 'min_output': 400, 'max_output': 1000, 'output_ratio': 1.0},
+    'summarize': {'small_max_input': 4000, 'min_output': 150, 'max_output': 500, 'output_ratio': 0.25},
+    'analyze': {'small_max_input': 1000, 'min_output': 300, 'max_output': 1000, 'output_ratio': 0.5},
+    'analyze_section': {'small_max_input': 2500, 'min_output': 150, 'max_output': 500, 'output_ratio': 0.25},
+    'generate': {'small_max_input': 0, 'min_output': 2000, 'max_output': 2000, 'output_ratio': 0}
+}
+
+
+def count_input_tokens(messages):
+    """Estimate the prompt tokens of a message list"""
+    return sum(estimate_tokens(message.get('content') or '') for message in messages)
+
+
+class ModelRouter:
+    """Picks the model and max_tokens of each LLM call from its task and input size.
+
+    With routing disabled every task uses the large tier and its max_output,
+    which is how calls were made before routing existed.
+    """
+
+    def __init__(self, models, routes=None, enabled=True, metrics=None):
+        self.models = models
+        self.routes = {task: dict(rule) for task, rule in DEFAULT_ROUTES.items()}
+        for task, rule in (routes or {}).items():
+            if task not in self.routes:
+                raise ValueError(f"Unknown LLM route: {task}")
+            if rule.get('tier') not in (None,) + TIERS:
+                raise ValueError(f"Unknown model tier for route {task}: {rule['tier']}")
+            self.routes[task].update(rule)
+        self.enabled = enabled
+        self.metrics = metrics
+
+    def route(self, task, messages, record=True):
+        """Return {'model', 'max_tokens', 'tier', 'input_tokens'} for a call"""
+        rule = self.routes[task]
+        input_tokens = count_input_tokens(messages)
+
+        if not self.enabled:
+            tier = 'large'
+            max_tokens = rule['max_output']
+        else:
+            small = rule['small_max_input'] and input_tokens <= rule['small_max_input']
+            tier = rule.get('tier') or ('small' if small else 'large')
+            budget = math.ceil(input_tokens * rule['output_ratio'])
+            max_tokens = min(rule['max_output'], max(rule['min_output'], budget))
+
+        model = (rule.get('model') if self.enabled else None) or self.models[tier]
+        if record and self.metrics is not None:
+            self.metrics.llm_routes.inc(task=task, tier=tier, model=model)
+            self.metrics.llm_route_max_tokens.observe(max_tokens, task=task, tier=tier)
+        return {'model': model, 'max_tokens': max_tokens, 'tier': tier, 'input_tokens': input_tokens}
+
+
+def get_model_router():
+    """Get the model router for the current app, creating it on first use"""
+    router = current_app.extensions.get('model_router')
+    if router is None:
+        config = current_app.config
+        router = ModelRouter(
+            models={'small': config['LLM_MODEL_SMALL'], 'large': config['LLM_MODEL_LARGE']},
+            routes=json.loads(config['LLM_ROUTES'] or '{}'),
+            enabled=config['LLM_ROUTING_ENABLED'],
+            metrics=current_app.extensions.get('metrics')
+        )
+        current_app.extensions['model_router'] = router
+    return router
+
+
+def route_completion(task, messages):
+    """Model and max_tokens for a call of the given task in the current app"""
+    return get_model_router().route(task, messages)
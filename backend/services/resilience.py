@@ -0,0 +1,215 @@
+import contextvars
+import math
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import openai
+
+# Upstream statuses worth another attempt: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUSES = {408, 409, 429}
+
+
+class LLMBusyError(Exception):
+    """Raised when no LLM request slot frees up within the acquire timeout"""
+
+    def __init__(self, message='', retry_after=5):
+        super().__init__(message)
+        self.retry_after = retry_after  # Seconds a client should wait before retrying
+
+
+class LLMUnavailableError(LLMBusyError):
+    """Raised when the upstream keeps failing, a call runs out of time, or the circuit is open.
+
+    It subclasses LLMBusyError so the routes answer 503 with Retry-After for both.
+    """
+
+
+def is_retryable(error):
+    """Whether an upstream error is transient"""
+    if isinstance(error, openai.APIConnectionError):  # Includes timeouts
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in RETRYABLE_STATUSES or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    """Seconds the upstream asked us to wait, if it said"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+class CircuitBreaker:
+    """Fails calls fast after repeated upstream failures.
+
+    After `failure_threshold` consecutive failures the circuit opens and calls
+    are rejected for `reset_timeout` seconds. Then one trial call is let
+    through: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = None
+        self._trial_running = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go out now; a half-open circuit allows one trial at a time"""
+        if self.failure_threshold <= 0:
+            return True
+        with self._lock:
+            if self.state == 'open' and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'closed':
+                return True
+            if self.state == 'half_open' and not self._trial_running:
+                self._trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = 'closed'
+            self.failures = 0
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_running = False
+            if self.state == 'half_open' or self.failures >= self.failure_threshold:
+                self.state = 'open'
+                self.opened_at = time.monotonic()
+
+    def cancel_trial(self):
+        """Let another trial call through after one ended without reaching the upstream"""
+        with self._lock:
+            self._trial_running = False
+
+    def retry_in(self):
+        """Seconds until the circuit lets a trial call through"""
+        with self._lock:
+            if self.state != 'open':
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+
+class ResiliencePolicy:
+    """Deadline, retry, circuit breaker and hedging around single upstream attempts.
+
+    `call(attempt)` runs `attempt(timeout)` until it succeeds, fails with a
+    non-transient error, runs out of retries, or the deadline passes.
+    Hedged calls start a duplicate attempt when the first one has not
+    finished after `hedge_delay` seconds and use whichever answers first,
+    so they are only for idempotent requests: the LLM functions named in
+    `hedge_functions`.
+    """
+
+    def __init__(self, timeout=60.0, deadline=120.0, max_retries=2, base_delay=0.5, max_delay=8.0,
+                 breaker=None, hedge_delay=0.0, hedge_workers=8, hedge_functions=()):
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge_delay = hedge_delay
+        self.hedge_functions = frozenset(hedge_functions)
+        self.metrics = None  # MetricsRegistry, when the app records metrics
+        self._hedge_executor = ThreadPoolExecutor(max_workers=hedge_workers, thread_name_prefix='llm-hedge') \
+            if hedge_delay > 0 else None
+
+    def _count(self, event):
+        if self.metrics is not None:
+            self.metrics.llm_resilience_events.inc(event=event)
+
+    def should_hedge(self, function):
+        """Whether calls made by the given LLM function may be hedged"""
+        return self._hedge_executor is not None and function in self.hedge_functions
+
+    def backoff(self, retry, error=None):
+        """Exponential delay with jitter before the given retry, at least what the upstream asked for"""
+        delay = min(self.max_delay, self.base_delay * (2 ** retry))
+        delay = random.uniform(delay / 2, delay)
+        requested = retry_after(error) if error is not None else None
+        return min(self.max_delay, max(delay, requested)) if requested else delay
+
+    def call(self, attempt, hedge=False):
+        deadline = time.monotonic() + self.deadline
+        retries = 0
+
+        while True:
+            if not self.breaker.allow():
+                self._count('circuit_open')
+                retry_in = self.breaker.retry_in()
+                raise LLMUnavailableError(
+                    f"LLM upstream is failing, retrying in {retry_in:.0f}s (circuit open)",
+                    retry_after=max(1, math.ceil(retry_in))
+                )
+
+            timeout = min(self.timeout, max(0.0, deadline - time.monotonic()))
+            try:
+                if hedge and self._hedge_executor is not None:
+                    result = self._hedged(attempt, timeout)
+                else:
+                    result = attempt(timeout)
+            except Exception as e:
+                if not is_retryable(e):
+                    if isinstance(e, openai.APIStatusError):
+                        # The upstream answered; the request itself was wrong
+                        self.breaker.record_success()
+                    else:
+                        self.breaker.cancel_trial()
+                    raise
+                self.breaker.record_failure()
+
+                delay = self.backoff(retries, e)
+                if retries >= self.max_retries or time.monotonic() + delay >= deadline:
+                    self._count('deadline_exceeded' if isinstance(e, openai.APITimeoutError) else 'gave_up')
+                    raise LLMUnavailableError(
+                        f"LLM request failed after {retries + 1} attempts: {e}",
+                        retry_after=max(1, math.ceil(self.breaker.retry_in() or retry_after(e) or self.max_delay))
+                    ) from e
+
+                retries += 1
+                self._count('retry')
+                time.sleep(delay)
+                continue
+
+            self.breaker.record_success()
+            return result
+
+    def _hedged(self, attempt, timeout):
+        """Run attempt, duplicating it if it is slow, and return the first success"""
+        # Copies of the caller's context keep the metrics label on the pool threads
+        first = self._hedge_executor.submit(contextvars.copy_context().run, attempt, timeout)
+        done, _ = wait([first], timeout=self.hedge_delay)
+        if done:
+            return first.result()
+
+        self._count('hedge')
+        second = self._hedge_executor.submit(contextvars.copy_context().run, attempt, timeout)
+        pending = {first, second}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is second:
+                        self._count('hedge_won')
+                    # The slower attempt finishes in the background and frees its own slot
+                    return future.result()
+                error = error or future.exception()
+        raise error
+
+    def close(self):
+        if self._hedge_executor is not None:
+            self._hedge_executor.shutdown(wait=False)
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from app import db
+from models.response_cache import ResponseCacheEntry
+from services.analysis_cache import normalize_content
+from services.database_service import upsert
+from services.metrics_service import current_llm_function
+
+# Header values that make a request skip cached responses
+BYPASS_VALUES = ('1', 'true', 'yes')
+
+
+def make_response_key(messages, params):
+    """Hash the normalized message list together with the model parameters"""
+    normalized = [
+        {'role': message.get('role'), 'content': normalize_content(message.get('content'))}
+        for message in messages
+    ]
+    payload = json.dumps({'messages': normalized, 'params': params}, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class MemoryResponseBackend:
+    """Per-process LRU of responses that expire after ttl seconds"""
+
+    name = 'memory'
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, response = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return response
+
+    def set(self, key, response, model):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.monotonic() + self.ttl, response)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class DatabaseResponseBackend:
+    """Responses in a database table, shared by every process using the same database.
+
+    The table is read and written on a connection of its own, so a lookup
+    or store never commits the caller's session. Cache errors are logged
+    and treated as a miss, so they never fail the request whose reply was
+    already paid for.
+    """
+
+    name = 'database'
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+
+    def get(self, key):
+        table = ResponseCacheEntry.__table__
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as connection:
+                row = connection.execute(
+                    select(table.c.response, table.c.expires_at).where(table.c.key == key)
+                ).first()
+                if row is None:
+                    return None
+                if row.expires_at <= now:
+                    connection.execute(delete(table).where(table.c.key == key, table.c.expires_at <= now))
+                    return None
+                connection.execute(update(table).where(table.c.key == key).values(
+                    hits=func.coalesce(table.c.hits, 0) + 1,
+                    last_accessed_at=now
+                ))
+                return row.response
+        except SQLAlchemyError as e:
+            current_app.logger.warning(f"Response cache lookup failed: {str(e)}")
+            return None
+
+    def set(self, key, response, model):
+        now = datetime.utcnow()
+        try:
+            with db.engine.begin() as connection:
+                # Identical concurrent prompts both miss and both store; the last write wins
+                upsert(connection, ResponseCacheEntry.__table__, {
+                    'key': key, 'response': response, 'model': model, 'size': len(response.encode('utf-8')),
+                    'hits': 0, 'created_at': now, 'expires_at': now + timedelta(seconds=self.ttl),
+                    'last_accessed_at': now
+                }, ('response', 'model', 'size', 'created_at', 'expires_at', 'last_accessed_at'))
+                self._evict(connection, now)
+        except SQLAlchemyError as e:
+            current_app.logger.warning(f"Response cache store failed: {str(e)}")
+
+    def _evict(self, connection, now):
+        """Drop expired rows, then least recently used ones beyond max_entries"""
+        table = ResponseCacheEntry.__table__
+        connection.execute(delete(table).where(table.c.expires_at <= now))
+
+        excess = connection.execute(select(func.count()).select_from(table)).scalar() - self.max_entries
+        if excess > 0:
+            evicted = list(connection.execute(
+                select(table.c.key).order_by(table.c.last_accessed_at.asc()).limit(excess)
+            ).scalars())
+            connection.execute(delete(table).where(table.c.key.in_(evicted)))
+
+    def clear(self):
+        with db.engine.begin() as connection:
+            connection.execute(delete(ResponseCacheEntry.__table__))
+
+
+# Backend name -> factory(config)
+RESPONSE_CACHE_BACKENDS = {
+    'memory': lambda config: MemoryResponseBackend(config['RESPONSE_CACHE_MAX_ENTRIES'], config['RESPONSE_CACHE_TTL']),
+    'database': lambda config: DatabaseResponseBackend(config['RESPONSE_CACHE_MAX_ENTRIES'], config['RESPONSE_CACHE_TTL'])
+}
+
+
+def get_response_cache():
+    """Get the response cache backend for the current app, creating it on first use"""
+    cache = current_app.extensions.get('response_cache')
+    if cache is None:
+        name = current_app.config['RESPONSE_CACHE_BACKEND']
+        if name not in RESPONSE_CACHE_BACKENDS:
+            raise ValueError(f"Unknown response cache backend: {name}")
+        cache = RESPONSE_CACHE_BACKENDS[name](current_app.config)
+        current_app.extensions['response_cache'] = cache
+    return cache
+
+
+def cache_bypassed():
+    """Whether the current request asked for a fresh response"""
+    if not has_request_context():
+        return False
+    value = request.headers.get(current_app.config['RESPONSE_CACHE_BYPASS_HEADER'], '')
+    return value.strip().lower() in BYPASS_VALUES
+
+
+def _record(result):
+    if has_request_context():
+        g.response_cache_result = result
+    registry = current_app.extensions.get('metrics')
+    if registry is not None:
+        registry.llm_response_cache.inc(function=current_llm_function(), result=result)
+
+
+def cached_completion(messages, params, complete):
+    """Return the stored reply to an identical request, calling complete() on a miss.
+
+    A bypassed request always calls complete() and replaces the stored reply.
+    """
+    if not current_app.config['RESPONSE_CACHE_ENABLED']:
+        return complete()
+
+    cache = get_response_cache()
+    key = make_response_key(messages, params)
+
+    if cache_bypassed():
+        result = 'bypass'
+    else:
+        response = cache.get(key)
+        if response is not None:
+            _record('hit')
+            return response
+        result = 'miss'
+
+    response = complete()
+    if response:
+        # The reply is already paid for; failing to store it must not fail the request
+        try:
+            cache.set(key, response, params.get('model', ''))
+        except Exception as e:
+            current_app.logger.warning(f"Response cache store failed: {str(e)}")
+    _record(result)
+    return response
+
+
+def cache_headers():
+    """Response headers telling the client whether its reply came from the cache"""
+    result = g.get('response_cache_result') if has_request_context() else None
+    return {'X-Response-Cache': result} if result else {}
@@ -0,0 +1,227 @@
+import difflib
+import hashlib
+import json
+import zlib
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import event, func, inspect, or_, select
+from app import db
+from models.document import Document
+from models.document_revision import DocumentRevision
+
+# Revisions are written from mapper events, inside the flush, so they use the Core table
+revisions = DocumentRevision.__table__
+
+
+def _compress(text):
+    return zlib.compress(text.encode('utf-8'), 6)
+
+
+def _decompress(data):
+    return zlib.decompress(data).decode('utf-8')
+
+
+def _content_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def make_delta(old, new):
+    """Line edits that turn old into new, as JSON [start, end, replacement lines] against old's lines"""
+    old_lines = old.splitlines(keepends=True)
+    new_lines = new.splitlines(keepends=True)
+    matcher = difflib.SequenceMatcher(None, old_lines, new_lines)
+    edits = [[i1, i2, new_lines[j1:j2]] for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != 'equal']
+    return json.dumps(edits, separators=(',', ':'))
+
+
+def apply_delta(old, delta):
+    lines = old.splitlines(keepends=True)
+    result = []
+    position = 0
+    for start, end, replacement in json.loads(delta):
+        result.extend(lines[position:start])
+        result.extend(replacement)
+        position = end
+    result.extend(lines[position:])
+    return ''.join(result)
+
+
+def _insert_snapshot(connection, document, number, content):
+    data = _compress(content)
+    connection.execute(revisions.insert().values(
+        document_id=document.id, number=number, kind='snapshot', snapshot_number=number, data=data,
+        title=document.title, size=len(content), stored_size=len(data),
+        content_hash=_content_hash(content), user_id=document.user_id
+    ))
+
+
+def record_revision(connection, document, previous_content=None):
+    """Add the document's current content as its newest revision.
+
+    Revisions are diffs from the one before, with a full snapshot every
+    REVISION_SNAPSHOT_INTERVAL revisions so reading any revision applies a
+    bounded number of diffs. A snapshot is also written whenever the diff
+    would not be much smaller, or the previous content is unknown.
+    """
+    content = document.content or ''
+    latest = connection.execute(
+        select(revisions.c.number, revisions.c.snapshot_number, revisions.c.content_hash)
+        .where(revisions.c.document_id == document.id)
+        .order_by(revisions.c.number.desc())
+        .limit(1)
+    ).first()
+
+    if latest is None:
+        # Keep the version from before history was recorded, so the first edit can be undone
+        if previous_content:
+            _insert_snapshot(connection, document, 1, previous_content)
+            latest = (1, 1, _content_hash(previous_content))
+        else:
+            _insert_snapshot(connection, document, 1, content)
+            return
+
+    number = latest[0] + 1
+    interval = current_app.config['REVISION_SNAPSHOT_INTERVAL']
+
+    # Content changed outside the ORM no longer matches the last revision, so a diff from it would be wrong
+    chain_intact = previous_content is not None and _content_hash(previous_content) == latest[2]
+    if not chain_intact or number - latest[1] >= interval:
+        _insert_snapshot(connection, document, number, content)
+    else:
+        data = _compress(make_delta(previous_content, content))
+        if len(data) * 2 > len(_compress(content)):
+            _insert_snapshot(connection, document, number, content)
+        else:
+            connection.execute(revisions.insert().values(
+                document_id=document.id, number=number, kind='delta', snapshot_number=latest[1], data=data,
+                title=document.title, size=len(content), stored_size=len(data),
+                content_hash=_content_hash(content), user_id=document.user_id
+            ))
+
+    keep = current_app.config['REVISION_KEEP_MAX']
+    if keep and number - keep >= 1:
+        prune_revisions(connection, document.id, keep_max=keep)
+
+
+def reconstruct(connection, document_id, number):
+    """Content of one revision: its snapshot with the diffs up to it applied, or None if there is none"""
+    snapshot_number = connection.execute(
+        select(revisions.c.snapshot_number).where(revisions.c.document_id == document_id, revisions.c.number == number)
+    ).scalar()
+    if snapshot_number is None:
+        return None
+
+    content = None
+    for kind, data in connection.execute(
+        select(revisions.c.kind, revisions.c.data)
+        .where(revisions.c.document_id == document_id, revisions.c.number.between(snapshot_number, number))
+        .order_by(revisions.c.number)
+    ):
+        content = _decompress(data) if kind == 'snapshot' else apply_delta(content, _decompress(data))
+    return content
+
+
+def prune_revisions(connection, document_id, keep_max=None, keep_after=None):
+    """Drop revisions beyond the newest keep_max and those created before keep_after.
+
+    The newest revision is always kept. If the oldest kept revision is a
+    diff, it is rewritten as a snapshot first so every kept revision can
+    still be read. Returns the number of revisions removed.
+    """
+    rows = connection.execute(
+        select(revisions.c.number, revisions.c.kind, revisions.c.created_at)
+        .where(revisions.c.document_id == document_id)
+        .order_by(revisions.c.number.desc())
+    ).all()
+    kept = rows[:keep_max] if keep_max else rows
+    if keep_after is not None:
+        kept = [row for row in kept if row.created_at >= keep_after] or rows[:1]
+    if not kept or len(kept) == len(rows):
+        return 0
+
+    oldest = kept[-1]
+    if oldest.kind == 'delta':
+        content = reconstruct(connection, document_id, oldest.number)
+        data = _compress(content)
+        connection.execute(revisions.update().where(
+            revisions.c.document_id == document_id, revisions.c.number == oldest.number
+        ).values(kind='snapshot', snapshot_number=oldest.number, data=data, stored_size=len(data)))
+        # Later diffs in the same chain now start from the new snapshot
+        connection.execute(revisions.update().where(
+            revisions.c.document_id == document_id,
+            revisions.c.number > oldest.number,
+            revisions.c.snapshot_number < oldest.number
+        ).values(snapshot_number=oldest.number))
+
+    connection.execute(revisions.delete().where(
+        revisions.c.document_id == document_id, revisions.c.number < oldest.number
+    ))
+    return len(rows) - len(kept)
+
+
+def prune_all_revisions(keep_max, keep_days):
+    """Apply the retention policy to every document's history"""
+    keep_after = datetime.utcnow() - timedelta(days=keep_days) if keep_days else None
+    over_limit = []
+    if keep_max:
+        over_limit.append(func.count() > keep_max)
+    if keep_after is not None:
+        over_limit.append(func.min(revisions.c.created_at) < keep_after)
+    if not over_limit:
+        return 0
+
+    removed = 0
+    with db.engine.begin() as connection:
+        query = select(revisions.c.document_id).group_by(revisions.c.document_id).having(or_(*over_limit))
+        for (document_id,) in connection.execute(query).all():
+            removed += prune_revisions(connection, document_id, keep_max=keep_max, keep_after=keep_after)
+    return removed
+
+
+def list_revisions(document_id, limit=50, before=None):
+    """Newest first revision metadata, without loading their content"""
+    query = DocumentRevision.query.options(db.defer(DocumentRevision.data)).filter_by(document_id=document_id)
+    if before:
+        query = query.filter(DocumentRevision.number < before)
+    return query.order_by(DocumentRevision.number.desc()).limit(limit).all()
+
+
+def get_revision_content(document_id, number):
+    return reconstruct(db.session.connection(), document_id, number)
+
+
+def revision_storage(document_id):
+    """Bytes stored for a document's history, next to what full copies of every revision would take"""
+    stored, full, count = db.session.query(
+        func.coalesce(func.sum(DocumentRevision.stored_size), 0),
+        func.coalesce(func.sum(DocumentRevision.size), 0),
+        func.count(DocumentRevision.id)
+    ).filter_by(document_id=document_id).one()
+    return {'revisions': count, 'stored_bytes': stored, 'full_copy_bytes': full}
+
+
+def init_revision_history(app):
+    """Record a revision whenever a document's content is saved"""
+    if not event.contains(Document, 'after_insert', _after_insert):
+        event.listen(Document, 'after_insert', _after_insert)
+        event.listen(Document, 'after_update', _after_update)
+        event.listen(Document, 'before_delete', _before_delete)
+
+
+def _after_insert(mapper, connection, document):
+    if document.content:
+        record_revision(connection, document)
+
+
+def _after_update(mapper, connection, document):
+    history = inspect(document).attrs.content.history
+    if not history.has_changes():
+        return
+    previous = history.deleted[0] if history.deleted else None
+    if previous is not None and (previous or '') == (document.content or ''):
+        return
+    record_revision(connection, document, previous)
+
+
+def _before_delete(mapper, connection, document):
+    connection.execute(revisions.delete().where(revisions.c.document_id == document.id))
@@ -0,0 +1,263 @@
+import json
+import re
+from flask import current_app
+from sqlalchemy import and_, column, event, func, literal_column, or_, select, table, text
+from app import db
+from models.document import Document
+from models.document_text import DocumentText
+from services.document_service import get_index_text
+from services.tag_service import tagged_document_ids
+
+SNIPPET_START = '<mark>'
+SNIPPET_END = '</mark>'
+SNIPPET_TOKENS = 16
+
+TOKEN_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+
+def _tags_text(tags):
+    """Flatten the JSON tags column into a space separated string"""
+    if not tags:
+        return ''
+    try:
+        return ' '.join(str(tag) for tag in json.loads(tags))
+    except (TypeError, ValueError):
+        return tags
+
+
+def _query_terms(query):
+    """Split a user supplied query into plain word tokens"""
+    return TOKEN_PATTERN.findall(query or '')
+
+
+document_fts = table('document_fts', column('rowid'), column('user_id'))
+
+
+class FTS5SearchBackend:
+    """Full-text index backed by an SQLite FTS5 virtual table"""
+
+    name = 'fts5'
+
+    def create(self, connection):
+        connection.execute(text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS document_fts USING fts5("
+            "title, content, tags, analysis, user_id UNINDEXED, "
+            "tokenize='porter unicode61')"
+        ))
+        # Backfill rows created before the index existed
+        connection.execute(text(
+            "INSERT INTO document_fts (rowid, title, content, tags, analysis, user_id) "
+            "SELECT document.id, document.title, "
+            "coalesce(document.content, '') || coalesce(char(10, 10) || document_text.text, ''), "
+            "coalesce(document.tags, ''), coalesce(document.analysis, ''), document.user_id "
+            "FROM document LEFT JOIN document_text ON document_text.document_id = document.id "
+            "WHERE document.id NOT IN (SELECT rowid FROM document_fts)"
+        ))
+
+    def index(self, connection, document):
+        self.remove(connection, document.id)
+        connection.execute(text(
+            "INSERT INTO document_fts (rowid, title, content, tags, analysis, user_id) "
+            "VALUES (:id, :title, :content, :tags, :analysis, :user_id)"
+        ), {
+            'id': document.id,
+            'title': document.title or '',
+            'content': get_index_text(document),
+            'tags': _tags_text(document.tags),
+            'analysis': document.analysis or '',
+            'user_id': document.user_id
+        })
+
+    def remove(self, connection, document_id):
+        connection.execute(text("DELETE FROM document_fts WHERE rowid = :id"), {'id': document_id})
+
+    def update_tags(self, connection, tags_by_document):
+        """Reindex only the tags of many documents, for bulk updates that bypass mapper events"""
+        connection.execute(text("UPDATE document_fts SET tags = :tags WHERE rowid = :id"), [
+            {'id': document_id, 'tags': _tags_text(tags)} for document_id, tags in tags_by_document.items()
+        ])
+
+    def remove_many(self, connection, document_ids):
+        connection.execute(text("DELETE FROM document_fts WHERE rowid = :id"), [{'id': i} for i in document_ids])
+
+    def search(self, user_id, query, status=None, tags=None, limit=50, after=None):
+        terms = _query_terms(query)
+        if not terms:
+            return []
+
+        # Quote every term so user input can never be parsed as FTS5 syntax,
+        # and make the last one a prefix match for search-as-you-type
+        match = ' '.join(f'"{term}"' for term in terms) + '*'
+
+        fts = literal_column('document_fts')
+        # bm25 is lower for better matches; hits report it negated, so higher ranks first
+        bm25 = func.bm25(fts, 10.0, 1.0, 5.0, 2.0)
+        sql = (
+            select(
+                document_fts.c.rowid.label('id'),
+                bm25.label('rank'),
+                func.highlight(fts, 0, SNIPPET_START, SNIPPET_END).label('title_highlight'),
+                func.snippet(fts, -1, SNIPPET_START, SNIPPET_END, '...', SNIPPET_TOKENS).label('snippet')
+            )
+            .select_from(document_fts.join(Document.__table__, Document.id == document_fts.c.rowid))
+            .where(fts.op('MATCH')(match), document_fts.c.user_id == user_id)
+        )
+        # Filters go into the query so every page holds limit hits that pass them
+        if status:
+            sql = sql.where(Document.status == status)
+        if tags:
+            sql = sql.where(Document.id.in_(tagged_document_ids(user_id, tags)))
+        if after:
+            after_rank, after_id = after
+            sql = sql.where(or_(bm25 > -after_rank, and_(bm25 == -after_rank, document_fts.c.rowid > after_id)))
+        sql = sql.order_by(bm25, document_fts.c.rowid).limit(limit)
+
+        rows = db.session.execute(sql).mappings().all()
+        return [
+            {
+                'id': row['id'],
+                'rank': -row['rank'],
+                'title_highlight': row['title_highlight'],
+                'snippet': row['snippet']
+            }
+            for row in rows
+        ]
+
+
+class LikeSearchBackend:
+    """Fallback for databases without FTS5, with the same result shape.
+
+    Matches substrings of the same fields as the full-text index, text
+    extracted from uploaded files included. Without an index every matching
+    document of the user is ranked in Python on each request, so it suits
+    small collections only.
+    """
+
+    name = 'like'
+
+    def create(self, connection):
+        pass
+
+    def index(self, connection, document):
+        pass
+
+    def remove(self, connection, document_id):
+        pass
+
+    def update_tags(self, connection, tags_by_document):
+        pass
+
+    def remove_many(self, connection, document_ids):
+        pass
+
+    def search(self, user_id, query, status=None, tags=None, limit=50, after=None):
+        terms = _query_terms(query)
+        if not terms:
+            return []
+
+        weighted_columns = [
+            (Document.title, 10.0),
+            (Document.tags, 5.0),
+            (Document.analysis, 2.0),
+            (Document.content, 1.0),
+            (DocumentText.text, 1.0)
+        ]
+
+        q = db.session.query(Document.id, *[column for column, _ in weighted_columns]).outerjoin(
+            DocumentText, DocumentText.document_id == Document.id
+        ).filter(Document.user_id == user_id)
+        if status:
+            q = q.filter(Document.status == status)
+        if tags:
+            q = q.filter(Document.id.in_(tagged_document_ids(user_id, tags)))
+        for term in terms:
+            q = q.filter(db.or_(*[column.ilike(f'%{term}%') for column, _ in weighted_columns]))
+
+        results = []
+        for row in q.all():
+            rank = 0.0
+            for (column, weight), value in zip(weighted_columns, row[1:]):
+                value = (value or '').lower()
+                rank += weight * sum(value.count(term.lower()) for term in terms)
+            if after and (rank > after[0] or (rank == after[0] and row.id <= after[1])):
+                continue
+            body = '\n\n'.join(part for part in (row.content, row.text) if part)
+            results.append({
+                'id': row.id,
+                'rank': rank,
+                'title_highlight': _highlight(row.title or '', terms),
+                'snippet': _snippet(body or row.analysis or '', terms)
+            })
+
+        results.sort(key=lambda result: (-result['rank'], result['id']))
+        return results[:limit]
+
+
+def _highlight(value, terms):
+    """Wrap every occurrence of the search terms in highlight markers"""
+    pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+    return pattern.sub(lambda m: f'{SNIPPET_START}{m.group(0)}{SNIPPET_END}', value)
+
+
+def _snippet(value, terms, width=120):
+    """Cut a highlighted window of text around the first matching term"""
+    lower = value.lower()
+    positions = [lower.find(term.lower()) for term in terms if term.lower() in lower]
+    if not positions:
+        return value[:width]
+    start = max(min(positions) - width // 2, 0)
+    window = value[start:start + width]
+    prefix = '...' if start > 0 else ''
+    suffix = '...' if start + width < len(value) else ''
+    return prefix + _highlight(window, terms) + suffix
+
+
+def _fts5_available(connection):
+    """Check that the SQLite build was compiled with FTS5"""
+    try:
+        connection.execute(text("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)"))
+        connection.execute(text("DROP TABLE temp._fts5_probe"))
+        return True
+    except Exception:
+        return False
+
+
+def init_search_index(app):
+    """Pick a search backend for the configured database and build its index"""
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'sqlite' and _fts5_available(connection):
+            backend = FTS5SearchBackend()
+        else:
+            backend = LikeSearchBackend()
+        backend.create(connection)
+
+    app.extensions['search_backend'] = backend
+
+    if not event.contains(Document, 'after_insert', _after_save):
+        event.listen(Document, 'after_insert', _after_save)
+        event.listen(Document, 'after_update', _after_save)
+        event.listen(Document, 'after_delete', _after_delete)
+
+    return backend
+
+
+def get_search_backend():
+    """Get the search backend configured for the current app"""
+    return current_app.extensions['search_backend']
+
+
+def search_documents(user_id, query, status=None, tags=None, limit=50, after=None):
+    """Return ranked search hits with highlighted title and snippet, best first.
+
+    Hits carry every tag in tags. Pass the (rank, id) of the last hit seen as
+    after to get the next page.
+    """
+    return get_search_backend().search(user_id, query, status=status, tags=tags, limit=limit, after=after)
+
+
+def _after_save(mapper, connection, document):
+    get_search_backend().index(connection, document)
+
+
+def _after_delete(mapper, connection, document):
+    get_search_backend().remove(connection, document.id)
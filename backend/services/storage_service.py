@@ -0,0 +1,408 @@
+import io
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import closing, contextmanager
+from datetime import datetime, timezone
+from io import BytesIO
+from flask import current_app
+from services.compression_service import ENCODING_SUFFIXES, base_key, variant_key
+from services.metrics_service import TimedStorage
+
+
+class StorageError(Exception):
+    """Raised when a storage backend cannot complete an operation"""
+
+
+def shard_key(sha256, depth=2, width=2):
+    """Spread content hashes over nested directories, e.g. ab/cd/abcd..."""
+    shards = [sha256[i * width:(i + 1) * width] for i in range(depth)]
+    return '/'.join(shards + [sha256])
+
+
+class LocalStorage:
+    """Stores objects as files under a root directory, keys map to relative paths"""
+
+    name = 'local'
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def put_file(self, source_path, key):
+        """Move a local file into storage under key"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+
+    def open(self, key, start=0):
+        f = open(self._path(key), 'rb')
+        if start:
+            f.seek(start)
+        return f
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def size(self, key):
+        return os.path.getsize(self._path(key))
+
+    def delete(self, key):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    def local_path(self, key):
+        """Path of the object on local disk, for zero-copy serving"""
+        return self._path(key)
+
+    def iter_objects(self):
+        """Yield (key, last_modified) for every stored object"""
+        for directory, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield key, datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+
+
+class S3Storage:
+    """Stores objects in an S3-compatible bucket through a boto3-style client"""
+
+    name = 's3'
+
+    def __init__(self, client, bucket, prefix=''):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+
+    def _key(self, key):
+        return self.prefix + key
+
+    def put_file(self, source_path, key):
+        self.client.upload_file(source_path, self.bucket, self._key(key))
+        os.remove(source_path)
+
+    def open(self, key, start=0):
+        # A ranged GET skips the bytes before start instead of downloading them
+        kwargs = {'Range': f'bytes={start}-'} if start else {}
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key), **kwargs)['Body']
+        except Exception as e:
+            raise StorageError(f"Could not read object '{key}': {str(e)}")
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+            return True
+        except Exception:
+            return False
+
+    def size(self, key):
+        return self.client.head_object(Bucket=self.bucket, Key=self._key(key))['ContentLength']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def delete_many(self, keys):
+        # One request removes up to 1000 objects
+        keys = list(keys)
+        for start in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': self._key(key)} for key in keys[start:start + 1000]],
+                'Quiet': True
+            })
+
+    def local_path(self, key):
+        return None
+
+    def iter_objects(self):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):], item['LastModified']
+
+
+class InMemoryS3Client:
+    """In-process stand-in for the subset of the boto3 S3 client used by S3Storage"""
+
+    class NoSuchKey(Exception):
+        pass
+
+    def __init__(self):
+        self._objects = {}
+        self._lock = threading.Lock()
+
+    def upload_file(self, filename, bucket, key):
+        with open(filename, 'rb') as f:
+            data = f.read()
+        with self._lock:
+            self._objects[(bucket, key)] = (data, datetime.now(timezone.utc))
+
+    def _get(self, bucket, key):
+        with self._lock:
+            if (bucket, key) not in self._objects:
+                raise self.NoSuchKey(key)
+            return self._objects[(bucket, key)]
+
+    def get_object(self, Bucket, Key, Range=None):
+        data, modified = self._get(Bucket, Key)
+        if Range:
+            start, _, end = Range[len('bytes='):].partition('-')
+            data = data[int(start):int(end) + 1 if end else None]
+        return {'Body': BytesIO(data), 'ContentLength': len(data), 'LastModified': modified}
+
+    def head_object(self, Bucket, Key):
+        data, modified = self._get(Bucket, Key)
+        return {'ContentLength': len(data), 'LastModified': modified}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+
+    def delete_objects(self, Bucket, Delete):
+        with self._lock:
+            for item in Delete['Objects']:
+                self._objects.pop((Bucket, item['Key']), None)
+        return {}
+
+    def get_paginator(self, operation):
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix=''):
+                with client._lock:
+                    items = [
+                        {'Key': key, 'Size': len(data), 'LastModified': modified}
+                        for (bucket, key), (data, modified) in sorted(client._objects.items())
+                        if bucket == Bucket and key.startswith(Prefix)
+                    ]
+                for start in range(0, len(items), 1000):
+                    yield {'Contents': items[start:start + 1000]}
+
+        return Paginator()
+
+
+class LazyObjectReader(io.RawIOBase):
+    """Seekable read-only view of a stored object that is opened on the first read.
+
+    A seek before reading becomes a ranged read, so serving the tail of a
+    large remote object never downloads the bytes before it, and a response
+    that ends up as 304 never touches the storage at all.
+    """
+
+    def __init__(self, storage, key, size):
+        super().__init__()
+        self.storage = storage
+        self.key = key
+        self.size = size
+        self.position = 0
+        self._body = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self.position
+        elif whence == io.SEEK_END:
+            offset += self.size
+        if offset != self.position:
+            self._close_body()
+            self.position = offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        if self._body is None:
+            self._body = self.storage.open(self.key, start=self.position)
+        data = self._body.read(len(buffer))
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
+
+    def _close_body(self):
+        if self._body is not None:
+            self._body.close()
+            self._body = None
+
+    def close(self):
+        self._close_body()
+        super().close()
+
+
+def create_storage(config):
+    """Build the storage backend selected by STORAGE_BACKEND"""
+    backend = config['STORAGE_BACKEND']
+
+    if backend == 'local':
+        return LocalStorage(os.path.join(config['UPLOAD_FOLDER'], 'blobs'))
+
+    if backend == 'memory':
+        return S3Storage(InMemoryS3Client(), config['S3_BUCKET'] or 'documind', config['S3_PREFIX'])
+
+    if backend == 's3':
+        try:
+            import boto3
+        except ImportError:
+            raise StorageError('The s3 storage backend requires the boto3 package')
+        client = boto3.client('s3', endpoint_url=config['S3_ENDPOINT_URL'])
+        return S3Storage(client, config['S3_BUCKET'], config['S3_PREFIX'])
+
+    raise StorageError(f"Unknown storage backend '{backend}'")
+
+
+def get_storage():
+    """Get the storage backend for the current app"""
+    storage = current_app.extensions.get('storage')
+    if storage is None:
+        storage = create_storage(current_app.config)
+        registry = current_app.extensions.get('metrics')
+        if registry is not None:
+            storage = TimedStorage(storage, registry)
+        current_app.extensions['storage'] = storage
+    return storage
+
+
+def is_legacy_path(file_path):
+    """Files uploaded before the storage layer are referenced by absolute local path"""
+    return os.path.isabs(file_path)
+
+
+def file_exists(file_path):
+    if is_legacy_path(file_path):
+        return os.path.exists(file_path)
+    return get_storage().exists(file_path)
+
+
+def open_file(file_path):
+    if is_legacy_path(file_path):
+        return open(file_path, 'rb')
+    return get_storage().open(file_path)
+
+
+def open_file_lazily(file_path, size):
+    """Open a stored file as a seekable reader that only fetches what is read"""
+    if is_legacy_path(file_path):
+        return open(file_path, 'rb')
+    return LazyObjectReader(get_storage(), file_path, size)
+
+
+def delete_file(file_path):
+    if not file_path:
+        return
+    if is_legacy_path(file_path):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        return
+    storage = get_storage()
+    storage.delete(file_path)
+    # Precompressed variants go with the file
+    for encoding in ENCODING_SUFFIXES:
+        storage.delete(variant_key(file_path, encoding))
+
+
+def delete_files(file_paths):
+    """Delete many stored files and their variants with as few storage requests as possible"""
+    keys = []
+    for file_path in file_paths:
+        if not file_path:
+            continue
+        if is_legacy_path(file_path):
+            delete_file(file_path)
+            continue
+        keys.append(file_path)
+        keys.extend(variant_key(file_path, encoding) for encoding in ENCODING_SUFFIXES)
+    if keys:
+        get_storage().delete_many(keys)
+
+
+def get_local_path(file_path):
+    """Local path of a stored file if the backend keeps it on local disk, else None"""
+    if is_legacy_path(file_path):
+        return file_path
+    return get_storage().local_path(file_path)
+
+
+@contextmanager
+def local_copy(file_path):
+    """Yield a local path for a stored file, downloading it to a temp file if needed"""
+    path = get_local_path(file_path)
+    if path is not None:
+        yield path
+        return
+
+    suffix = os.path.splitext(file_path)[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as temp_file:
+        with closing(open_file(file_path)) as source:
+            shutil.copyfileobj(source, temp_file)
+    try:
+        yield temp_file.name
+    finally:
+        os.remove(temp_file.name)
+
+
+def collect_garbage(grace_seconds):
+    """Delete stored objects and temp uploads that no stored_file row references.
+
+    Objects younger than grace_seconds are kept so uploads that have been
+    written but not yet committed are never collected.
+    """
+    from app import db
+    from models.stored_file import StoredFile
+
+    cutoff = datetime.now(timezone.utc).timestamp() - grace_seconds
+    storage = get_storage()
+    removed = {'orphan_objects': 0, 'unreferenced_rows': 0, 'temp_files': 0}
+
+    # Rows whose last reference went away without being deleted; their objects are
+    # then unreferenced and swept below, so a concurrent re-upload is never unlinked
+    removed['unreferenced_rows'] = StoredFile.query.filter(StoredFile.ref_count <= 0).delete(synchronize_session=False)
+    db.session.commit()
+
+    batch = []
+
+    def sweep(keys):
+        # Rows may also hold the absolute local path of files stored before the storage layer,
+        # and precompressed variants belong to the row of the file they were made from
+        candidates = {key: {base_key(key), storage.local_path(base_key(key))} - {None} for key in keys}
+        paths = set().union(*candidates.values())
+        known = {path for (path,) in db.session.query(StoredFile.path).filter(StoredFile.path.in_(paths))}
+        for key in keys:
+            if not candidates[key] & known:
+                storage.delete(key)
+                removed['orphan_objects'] += 1
+
+    for key, last_modified in storage.iter_objects():
+        if last_modified.timestamp() > cutoff:
+            continue
+        batch.append(key)
+        if len(batch) >= 500:
+            sweep(batch)
+            batch = []
+    if batch:
+        sweep(batch)
+
+    temp_folder = os.path.join(current_app.config['UPLOAD_FOLDER'], 'tmp')
+    if os.path.isdir(temp_folder):
+        for filename in os.listdir(temp_folder):
+            path = os.path.join(temp_folder, filename)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed['temp_files'] += 1
+
+    return removed
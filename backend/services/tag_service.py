@@ -0,0 +1,113 @@
+import json
+from sqlalchemy import event, inspect, select, func
+from app import db
+from models.document import Document
+from models.tag import Tag, document_tags
+
+
+def _decode_tags(tags):
+    """Tag names from the JSON tags column"""
+    if not tags:
+        return []
+    try:
+        return Document.normalize_tags(json.loads(tags))
+    except (TypeError, ValueError):
+        return []
+
+
+def _insert_ignoring_duplicates(connection, table, rows):
+    """Insert rows, skipping ones that would violate a unique constraint"""
+    if not rows:
+        return
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+        connection.execute(insert(table).on_conflict_do_nothing(), rows)
+    elif dialect == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+        connection.execute(insert(table).on_conflict_do_nothing(), rows)
+    else:
+        connection.execute(table.insert().prefix_with('IGNORE', dialect='mysql'), rows)
+
+
+def sync_document_tags(connection, document_id, user_id, names):
+    """Point a document's tag associations at exactly the given tag names"""
+    sync_tags(connection, user_id, {document_id: names})
+
+
+def sync_tags(connection, user_id, tags_by_document):
+    """Point the tag associations of many documents of one user at their tag names, in a few statements"""
+    if not tags_by_document:
+        return
+    connection.execute(document_tags.delete().where(document_tags.c.document_id.in_(list(tags_by_document))))
+
+    names = sorted({name for document_names in tags_by_document.values() for name in document_names})
+    if not names:
+        return
+
+    tag_table = Tag.__table__
+    # Tags are shared per user, so a concurrent insert of the same name is not an error
+    _insert_ignoring_duplicates(connection, tag_table, [{'user_id': user_id, 'name': name} for name in names])
+    tag_ids = dict(connection.execute(
+        select(tag_table.c.name, tag_table.c.id).where(tag_table.c.user_id == user_id, tag_table.c.name.in_(names))
+    ).all())
+    connection.execute(document_tags.insert(), [
+        {'document_id': document_id, 'tag_id': tag_ids[name]}
+        for document_id, document_names in tags_by_document.items()
+        for name in document_names
+    ])
+
+
+def tagged_document_ids(user_id, names):
+    """Subquery of the ids of a user's documents carrying every one of the given tags"""
+    return (
+        select(document_tags.c.document_id)
+        .join(Tag, Tag.id == document_tags.c.tag_id)
+        .where(Tag.user_id == user_id, Tag.name.in_(names))
+        .group_by(document_tags.c.document_id)
+        .having(func.count() == len(names))
+    )
+
+
+def tag_facets(user_id, status=None, tags=None):
+    """Count a user's documents per tag in one aggregate query, optionally within a filter"""
+    count = func.count(document_tags.c.document_id).label('count')
+    query = (
+        db.session.query(Tag.name, count)
+        .join(document_tags, document_tags.c.tag_id == Tag.id)
+        .filter(Tag.user_id == user_id)
+    )
+    if status:
+        query = query.join(Document, Document.id == document_tags.c.document_id).filter(Document.status == status)
+    if tags:
+        query = query.filter(document_tags.c.document_id.in_(tagged_document_ids(user_id, tags)))
+
+    rows = query.group_by(Tag.name).order_by(count.desc(), Tag.name).all()
+    return [{'tag': name, 'count': documents} for name, documents in rows]
+
+
+def init_tag_index(app):
+    """Keep the normalized tag tables in sync with the tags column"""
+    with db.engine.begin() as connection:
+        # Backfill documents tagged before the tag tables existed
+        rows = connection.execute(
+            select(Document.id, Document.user_id, Document.tags)
+            .where(Document.tags.isnot(None), Document.tags.notin_(['', '[]']))
+            .where(Document.id.notin_(select(document_tags.c.document_id)))
+        ).all()
+        for document_id, user_id, tags in rows:
+            sync_document_tags(connection, document_id, user_id, _decode_tags(tags))
+
+    if not event.contains(Document, 'after_insert', _after_save):
+        event.listen(Document, 'after_insert', _after_save)
+        event.listen(Document, 'after_update', _after_save)
+        event.listen(Document, 'after_delete', _after_delete)
+
+
+def _after_save(mapper, connection, document):
+    if inspect(document).attrs.tags.history.has_changes():
+        sync_document_tags(connection, document.id, document.user_id, _decode_tags(document.tags))
+
+
+def _after_delete(mapper, connection, document):
+    connection.execute(document_tags.delete().where(document_tags.c.document_id == document.id))
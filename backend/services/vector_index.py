@@ -0,0 +1,373 @@
+import json
+import os
+import threading
+from datetime import datetime
+import numpy as np
+from flask import current_app
+from sqlalchemy import event, inspect, select, update
+from sqlalchemy.orm import object_session
+from app import db
+from models.document import Document
+from models.job import Job
+from services.chunking_service import iter_chunks
+from services.document_service import get_index_text
+from services.embedding_service import get_embedding_provider, validate_embedding_config
+from services.job_service import job_handler, notify_workers
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+
+class VectorIndex:
+    """In-memory matrix of unit-length chunk embeddings for one user.
+
+    Row i of `vectors` belongs to `chunks[i]`, a dict with the document id,
+    the chunk position within the document and the chunk text.
+    """
+
+    def __init__(self, dimensions):
+        self.vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self.chunks = []
+
+    def remove_document(self, document_id):
+        keep = [i for i, chunk in enumerate(self.chunks) if chunk['document_id'] != document_id]
+        if len(keep) != len(self.chunks):
+            self.vectors = self.vectors[keep]
+            self.chunks = [self.chunks[i] for i in keep]
+
+    def add_document(self, document_id, texts, vectors):
+        self.remove_document(document_id)
+        if not texts:
+            return
+        self.vectors = np.vstack([self.vectors, vectors.astype(np.float32)])
+        self.chunks.extend(
+            {'document_id': document_id, 'position': position, 'text': text}
+            for position, text in enumerate(texts)
+        )
+
+    def search(self, queries, top_k):
+        """Return the top_k (score, chunk) pairs for each row of the query matrix"""
+        if not self.chunks:
+            return [[] for _ in range(len(queries))]
+
+        # One matrix product scores every query against every chunk
+        scores = queries @ self.vectors.T
+        k = min(top_k, len(self.chunks))
+
+        results = []
+        for row in scores:
+            best = np.argpartition(-row, k - 1)[:k]
+            best = best[np.argsort(-row[best])]
+            results.append([(float(row[i]), self.chunks[i]) for i in best])
+        return results
+
+    def save(self, path):
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, vectors=self.vectors, chunks=np.array(json.dumps(self.chunks)))
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path, dimensions):
+        index = cls(dimensions)
+        with np.load(path) as data:
+            index.vectors = data['vectors']
+            index.chunks = json.loads(str(data['chunks']))
+        return index
+
+
+class UserIndexLock:
+    """Serializes work on one user's index, across threads and processes.
+
+    Threads of this process share a re-entrant lock; the outermost holder
+    also takes an exclusive flock on a lock file next to the index, so a
+    load-modify-save in another worker process cannot interleave and lose
+    an update. Without fcntl (Windows) only threads are serialized.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._depth = 0
+        self._file = None
+
+    def __enter__(self):
+        self._lock.acquire()
+        if self._depth == 0 and fcntl is not None:
+            try:
+                self._file = open(self.path, 'a')
+                fcntl.flock(self._file, fcntl.LOCK_EX)
+            except BaseException:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                self._lock.release()
+                raise
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info):
+        self._depth -= 1
+        if self._depth == 0 and self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+        self._lock.release()
+
+
+class VectorIndexStore:
+    """Loads, caches and persists one VectorIndex per user under a folder.
+
+    Cached indexes are reloaded when the file on disk was rewritten by
+    another process.
+    """
+
+    def __init__(self, folder, dimensions):
+        self.folder = folder
+        self.dimensions = dimensions
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._user_locks = {}
+
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+    def path(self, user_id):
+        return os.path.join(self.folder, f'{user_id}.npz')
+
+    def user_lock(self, user_id):
+        with self._lock:
+            lock = self._user_locks.get(user_id)
+            if lock is None:
+                lock = self._user_locks[user_id] = UserIndexLock(f'{self.path(user_id)}.lock')
+            return lock
+
+    def get(self, user_id, build=None):
+        """Get a user's index, building it with build(index) if none was persisted yet"""
+        path = self.path(user_id)
+        with self.user_lock(user_id):
+            mtime = os.path.getmtime(path) if os.path.exists(path) else None
+            cached = self._indexes.get(user_id)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+
+            if mtime is not None:
+                index = VectorIndex.load(path, self.dimensions)
+            else:
+                index = VectorIndex(self.dimensions)
+                if build is not None:
+                    build(index)
+                    index.save(path)
+                    mtime = os.path.getmtime(path)
+
+            self._indexes[user_id] = (mtime, index)
+            return index
+
+    def save(self, user_id, index):
+        path = self.path(user_id)
+        with self.user_lock(user_id):
+            index.save(path)
+            self._indexes[user_id] = (os.path.getmtime(path), index)
+
+
+def get_embedding_text(document):
+    """Text that gets embedded for a document"""
+    return '\n\n'.join(part for part in (document.title, get_index_text(document)) if part)
+
+
+def embed_document(text):
+    """Split a document into chunks and embed them in one batch"""
+    texts = list(iter_chunks(text, current_app.config['RAG_CHUNK_TOKENS']))
+    if not texts:
+        return texts, None
+    return texts, get_embedding_provider().embed(texts)
+
+
+def get_vector_store():
+    """Get the vector index store for the current app"""
+    store = current_app.extensions.get('vector_store')
+    if store is None:
+        store = VectorIndexStore(
+            current_app.config['VECTOR_INDEX_FOLDER'],
+            current_app.config['EMBEDDING_DIMENSIONS']
+        )
+        current_app.extensions['vector_store'] = store
+    return store
+
+
+def build_user_index(user_id):
+    """Embed all of a user's documents into a new index, returning False if the user already has one"""
+    def build(index):
+        documents = Document.query.filter_by(user_id=user_id).yield_per(100)
+        for document in documents:
+            texts, vectors = embed_document(get_embedding_text(document))
+            index.add_document(document.id, texts, vectors)
+
+    store = get_vector_store()
+    with store.user_lock(user_id):
+        if os.path.exists(store.path(user_id)):
+            return False
+        store.get(user_id, build=build)
+        return True
+
+
+def retrieve_chunks(user_id, query, top_k=None):
+    """Return the chunks of a user's documents most relevant to query.
+
+    A user without an index gets no chunks while a job builds it, so a chat
+    request never embeds the user's whole collection.
+    """
+    top_k = top_k or current_app.config['RAG_TOP_K']
+    store = get_vector_store()
+    if not os.path.exists(store.path(user_id)):
+        try:
+            with db.engine.begin() as connection:
+                queue_index_update(connection, user_id, rebuild=True)
+            notify_workers()
+        except Exception as e:
+            current_app.logger.error(f"Error queueing vector index build: {str(e)}")
+        return []
+
+    query_vector = get_embedding_provider().embed([query])
+    with store.user_lock(user_id):
+        hits = store.get(user_id).search(query_vector, top_k)[0]
+
+    min_score = current_app.config['RAG_MIN_SCORE']
+    return [dict(chunk, score=score) for score, chunk in hits if score >= min_score]
+
+
+def apply_index_changes(user_id, document_ids):
+    """Re-embed a user's changed documents from their current content, dropping deleted ones"""
+    store = get_vector_store()
+    with store.user_lock(user_id):
+        # A missing index is built by a job queued on first search instead
+        if not os.path.exists(store.path(user_id)):
+            return
+
+        documents = {d.id: d for d in Document.query.filter(
+            Document.user_id == user_id, Document.id.in_(document_ids)
+        )}
+        index = store.get(user_id)
+        for document_id in document_ids:
+            document = documents.get(document_id)
+            if document is None:
+                index.remove_document(document_id)
+            else:
+                texts, vectors = embed_document(get_embedding_text(document))
+                index.add_document(document_id, texts, vectors)
+        store.save(user_id, index)
+
+
+def queue_index_update(connection, user_id, document_ids=(), rebuild=False):
+    """Queue an index job for a user, folding the changes into the user's queued job if there is one.
+
+    The merge only applies while the job is still queued with the payload
+    that was read, so a worker claiming it or another process merging at the
+    same time leads to a new job instead of lost changes.
+    """
+    jobs = Job.__table__
+    queued = connection.execute(
+        select(jobs.c.id, jobs.c.payload)
+        .where(jobs.c.user_id == user_id, jobs.c.kind == 'update_vector_index', jobs.c.status == 'queued')
+        .order_by(jobs.c.id)
+        .limit(1)
+    ).first()
+
+    if queued is not None:
+        payload = json.loads(queued.payload or '{}')
+        known = payload.get('document_ids', [])
+        merged = {
+            'document_ids': known + [document_id for document_id in document_ids if document_id not in known],
+            'rebuild': payload.get('rebuild', False) or rebuild
+        }
+        if merged == {'document_ids': known, 'rebuild': payload.get('rebuild', False)}:
+            return
+        swapped = connection.execute(update(jobs).where(
+            jobs.c.id == queued.id, jobs.c.status == 'queued', jobs.c.payload == queued.payload
+        ).values(payload=json.dumps(merged)))
+        if swapped.rowcount:
+            return
+
+    now = datetime.utcnow()
+    connection.execute(jobs.insert().values(
+        kind='update_vector_index', status='queued', user_id=user_id,
+        payload=json.dumps({'document_ids': list(document_ids), 'rebuild': rebuild}), attempts=0,
+        max_attempts=current_app.config['JOBS_MAX_ATTEMPTS'], created_at=now, run_after=now
+    ))
+
+
+@job_handler('update_vector_index')
+def update_vector_index_job(job):
+    """Build a user's missing index, or apply the document changes of committed transactions"""
+    payload = job.get_payload()
+    document_ids = payload.get('document_ids', [])
+    # A fresh index already holds the current content of every document
+    if not (payload.get('rebuild') and build_user_index(job.user_id)):
+        apply_index_changes(job.user_id, document_ids)
+    return json.dumps({'documents': len(document_ids), 'rebuild': bool(payload.get('rebuild'))})
+
+
+def init_vector_index(app):
+    """Keep vector indexes in sync with document changes"""
+    validate_embedding_config(app.config)
+    session_class = db.session.session_factory.class_
+    if not event.contains(session_class, 'after_commit', _after_commit):
+        event.listen(Document, 'after_insert', _record_save)
+        event.listen(Document, 'after_update', _record_save)
+        event.listen(Document, 'after_delete', _record_delete)
+        event.listen(session_class, 'after_commit', _after_commit)
+        event.listen(session_class, 'after_soft_rollback', _after_rollback)
+
+
+def queue_index_changes(session, changes):
+    """Apply index changes once the session commits; bulk SQL that bypasses mapper events uses this directly"""
+    session.info.setdefault('pending_embeddings', []).extend(changes)
+
+
+def _pending(document):
+    """Changes are collected on the session during flush and applied after commit"""
+    return object_session(document).info.setdefault('pending_embeddings', [])
+
+
+def _record_save(mapper, connection, document):
+    state = inspect(document)
+    if not (state.attrs.title.history.has_changes() or state.attrs.content.history.has_changes()):
+        return
+    _pending(document).append({'user_id': document.user_id, 'document_id': document.id})
+
+
+def _record_delete(mapper, connection, document):
+    _pending(document).append({'user_id': document.user_id, 'document_id': document.id})
+
+
+def _after_commit(session):
+    """Queue index jobs once the outermost transaction commits, so embedding runs on a worker"""
+    # Releasing a savepoint also fires after_commit, before anything is committed
+    if session.in_nested_transaction():
+        return
+    changes = session.info.pop('pending_embeddings', None)
+    if not changes:
+        return
+
+    by_user = {}
+    for change in changes:
+        document_ids = by_user.setdefault(change['user_id'], [])
+        if change['document_id'] not in document_ids:
+            document_ids.append(change['document_id'])
+
+    # The committed session cannot emit SQL, so the jobs are written on a connection of their own
+    try:
+        with db.engine.begin() as connection:
+            for user_id, document_ids in by_user.items():
+                queue_index_update(connection, user_id, document_ids)
+        notify_workers()
+    except Exception as e:
+        current_app.logger.error(f"Error queueing vector index update: {str(e)}")
+
+
+def _after_rollback(session, previous_transaction):
+    # Jobs re-read documents from the database, so changes of a rolled back savepoint can stay queued
+    if not previous_transaction.nested:
+        session.info.pop('pending_embeddings', None)
@@ -0,0 +1,157 @@
+import random
+import re
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from app import create_app, db
+from config import Config
+from models.document import Document
+from models.document_chunk import DocumentChunk
+from models.user import User
+from services.ai_service import _analyze_content
+from services.chunking_service import CHARS_PER_TOKEN, iter_blocks, iter_chunks
+
+CHUNK_TOKENS = 200
+MAX_WORKERS = 3
+
+SECTION_PROMPT = re.compile(r'section (\d+) of a longer document.*?Section content:\s*(.*)', re.DOTALL)
+PARTIAL_LINE = re.compile(r'Section \d+:\n(.*)')
+
+
+class StubCompletions:
+    """Stands in for client.chat.completions, recording prompts and how many calls overlap.
+
+    Section calls answer P<section number>; merge calls answer their partials
+    joined with '+', so the final prompt shows the order partials were merged in.
+    Odd sections are slower, so sections finish out of document order.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self.merges = []
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def create(self, model, messages, **kwargs):
+        prompt = messages[-1]['content']
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        try:
+            section = SECTION_PROMPT.search(prompt)
+            if section:
+                number = int(section.group(1))
+                time.sleep(0.03 if number % 2 else 0.005)
+                with self._lock:
+                    self.sections[number] = section.group(2)
+                answer = f'P{number}'
+            else:
+                partials = PARTIAL_LINE.findall(prompt)
+                with self._lock:
+                    self.merges.append(partials)
+                answer = '+'.join(partials)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answer))])
+
+
+def stub_client():
+    return SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions()))
+
+
+def make_document(paragraphs=60, seed=0):
+    rng = random.Random(seed)
+    blocks = []
+    for i in range(paragraphs):
+        if i % 10 == 0:
+            blocks.append(f'PART {i // 10 + 1}')
+        words = ' '.join(f'word{rng.randrange(500)}' for _ in range(rng.randrange(10, 60)))
+        blocks.append(f'Paragraph {i}. {words}.')
+    return '\n\n'.join(blocks)
+
+
+@pytest.fixture
+def app(tmp_path):
+    class TestConfig(Config):
+        TESTING = True
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'test.db'}"
+        UPLOAD_FOLDER = str(tmp_path / 'uploads')
+        VECTOR_INDEX_FOLDER = str(tmp_path / 'vector_index')
+        JOBS_WORKERS = 0
+
+    app = create_app(TestConfig)
+    with app.app_context():
+        yield app
+
+
+def test_sections_follow_chunk_boundaries(app):
+    content = make_document()
+    client = stub_client()
+
+    _analyze_content(content, client=client, chunk_tokens=CHUNK_TOKENS, max_workers=MAX_WORKERS)
+
+    chunks = list(iter_chunks(content, CHUNK_TOKENS, stable=True))
+    sections = client.chat.completions.sections
+    assert len(chunks) > MAX_WORKERS * 2
+    assert [sections[number].strip() for number in sorted(sections)] == chunks
+    assert all(len(chunk) <= CHUNK_TOKENS * CHARS_PER_TOKEN for chunk in chunks)
+    # Chunks break between paragraphs only, and together hold every paragraph once, in order
+    assert [block for chunk in chunks for block in chunk.split('\n\n')] == list(iter_blocks(content))
+
+
+def test_sections_run_in_parallel_within_max_workers(app):
+    client = stub_client()
+
+    _analyze_content(make_document(), client=client, chunk_tokens=CHUNK_TOKENS, max_workers=MAX_WORKERS)
+
+    assert 1 < client.chat.completions.peak <= MAX_WORKERS
+
+
+def test_partials_are_merged_in_document_order(app):
+    client = stub_client()
+
+    analysis = _analyze_content(make_document(), client=client, chunk_tokens=CHUNK_TOKENS, max_workers=MAX_WORKERS)
+
+    completions = client.chat.completions
+    expected = [f'P{number}' for number in range(1, len(completions.sections) + 1)]
+    assert analysis.split('+') == expected
+    assert '+'.join(completions.merges[-1]).split('+') == expected
+
+
+def test_long_reductions_merge_in_rounds_keeping_order(app):
+    client = stub_client()
+
+    # A small budget cannot fit every partial in one prompt, so they are merged in groups first
+    analysis = _analyze_content(make_document(paragraphs=60), client=client, chunk_tokens=40, max_workers=MAX_WORKERS)
+
+    completions = client.chat.completions
+    assert len(completions.merges) > 1
+    assert analysis.split('+') == [f'P{number}' for number in range(1, len(completions.sections) + 1)]
+
+
+def test_sections_are_saved_within_the_callers_transaction(app):
+    user = User(username='reader', email='reader@example.com')
+    user.set_password('secret')
+    db.session.add(user)
+    db.session.commit()
+    document = Document(title='Long read', content=make_document(), user_id=user.id)
+    db.session.add(document)
+    db.session.commit()
+
+    # Work the caller has not committed yet is neither committed nor thrown away by the analysis
+    document.title = 'Renamed'
+    _analyze_content(document.content, client=stub_client(), chunk_tokens=CHUNK_TOKENS,
+                     max_workers=MAX_WORKERS, document_id=document.id)
+    assert document.title == 'Renamed'
+    db.session.rollback()
+    assert document.title == 'Long read'
+    assert DocumentChunk.query.filter_by(document_id=document.id).count() == 0
+
+    _analyze_content(document.content, client=stub_client(), chunk_tokens=CHUNK_TOKENS,
+                     max_workers=MAX_WORKERS, document_id=document.id)
+    db.session.commit()
+    chunks = list(iter_chunks(document.content, CHUNK_TOKENS, stable=True))
+    assert DocumentChunk.query.filter_by(document_id=document.id).count() == len(chunks)
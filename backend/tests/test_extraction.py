@@ -0,0 +1,41 @@
+from services.extraction_service import READ_CHUNK_SIZE, extract_text, normalize_text
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_plain_text_larger_than_a_read_round_trips(tmp_path):
+    source = ''.join(f'{i},item {i},{i * 3.5}\n' for i in range(12000))
+    assert len(source) > READ_CHUNK_SIZE * 2
+
+    text, sections = extract_text(write(tmp_path, 'data.csv', source.encode('utf-8')), 'csv')
+
+    assert text == source.rstrip('\n')
+    assert sections == []
+
+
+def test_plain_text_normalizes_across_read_boundaries(tmp_path):
+    # CRLF pairs, trailing spaces and blank line runs that straddle the 64KB reads
+    lines = []
+    for i in range(20000):
+        lines.append(f'line {i}   ' if i % 7 else '')
+        if i % 250 == 0:
+            lines.extend([''] * 5)
+    source = '\r\n'.join(lines)
+    assert len(source) > READ_CHUNK_SIZE * 2
+
+    text, _ = extract_text(write(tmp_path, 'notes.txt', source.encode('utf-8')), 'txt')
+
+    assert text == normalize_text(source).strip('\n')
+    assert '\n\n\n' not in text
+
+
+def test_plain_text_with_multibyte_characters_across_reads(tmp_path):
+    source = 'é€😀 ' * (READ_CHUNK_SIZE // 3) + '\nend'
+
+    text, _ = extract_text(write(tmp_path, 'unicode.txt', source.encode('utf-8')), 'txt')
+
+    assert text == normalize_text(source)
@@ -1,3 +1,6 @@
+import base64
+import hashlib
+import json
 import os
 import re
 from datetime import datetime
@@ -15,6 +18,56 @@ def format_datetime(dt):
     """Format a datetime object as a string"""
     return dt.strftime('%Y-%m-%d %H:%M:%S')
 
+def encode_cursor(dt, item_id):
+    """Encode a (timestamp, id) keyset position as an opaque cursor string"""
+    raw = json.dumps([dt.isoformat(), item_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Decode a cursor created by encode_cursor, raising ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        timestamp, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return datetime.fromisoformat(timestamp), int(item_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def encode_rank_cursor(rank, item_id):
+    """Encode a (score, id) position in ranked results as an opaque cursor string"""
+    raw = json.dumps([rank, item_id]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_rank_cursor(cursor):
+    """Decode a cursor created by encode_rank_cursor, raising ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        rank, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return float(rank), int(item_id)
+    except Exception:
+        raise ValueError('Invalid cursor')
+
+def make_etag(*parts):
+    """Build a strong ETag value from JSON-serializable version parts"""
+    raw = json.dumps(parts, default=str, sort_keys=True).encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()[:32]
+
+def format_sse(data, event=None):
+    """Format a JSON-serializable payload as a Server-Sent Events message"""
+    message = f"data: {json.dumps(data)}\n\n"
+    if event:
+        message = f"event: {event}\n{message}"
+    return message
+
+def retry_after_header(error):
+    """Retry-After header for an LLMBusyError, falling back to a few seconds"""
+    return {'Retry-After': str(getattr(error, 'retry_after', None) or 5)}
+
+def wants_stream(data, accept_header):
+    """Check whether the client asked for a streamed response"""
+    if data and data.get('stream') is True:
+        return True
+    return 'text/event-stream' in (accept_header or '')
+
 def get_time_ago(dt):
     """Get a human-readable string representing time ago"""
     now = datetime.utcnow()